@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 
+"""Command line interface of the digital twin.
+
+Each command imports its dependencies lazily, so that e.g. compiling a snapshot
+does not pay for importing FastAPI, and serving the API does not pay for importing matplotlib.
+"""
+
+import argparse
 import os
-import uvicorn
 
-from dt.api import create_api
-from dt.data import RepositoryFactory
-from dt.config import Config
 
+def load_config():
+    # Imported here to keep the startup of the CLI fast
+    from dt.config import Config
 
-def main():
     if os.environ.get("DT_CONFIG_FILE") is None:
         raise ValueError("DT_CONFIG_FILE environment variable is not set")
 
-    config = Config.from_toml(os.environ["DT_CONFIG_FILE"])
+    return Config.from_toml(os.environ["DT_CONFIG_FILE"])
+
+
+def run_api(_: argparse.Namespace):
+    import uvicorn
+    from dt.api import create_api
+    from dt.data import RepositoryFactory
+
+    config = load_config()
     repository = RepositoryFactory.create(config.database_config)
     api = create_api(repository, config.home_config)
 
@@ -23,5 +36,371 @@ def main():
 
     uvicorn.run(api, port=port)
 
+
+def run_map(_: argparse.Namespace):
+    from dt.plots import run_plots
+
+    run_plots()
+
+
+def run_render(args: argparse.Namespace):
+    from datetime import date
+    import time
+    from dt.config import Config
+    from dt.data import RepositoryFactory
+    from dt.plots import render_homes
+    from dt.timeline import Timeline
+
+    config_files = args.config or [os.environ["DT_CONFIG_FILE"]]
+    day = date.fromisoformat(args.day) if args.day else date.today()
+    homes = {}
+
+    for config_file in config_files:
+        config = Config.from_toml(config_file)
+        repository = RepositoryFactory.create(config.database_config)
+        name = os.path.splitext(os.path.basename(config_file))[0]
+        # Only the routines that run on the day are rendered
+        timeline = Timeline(repository.get_appliances(), repository.get_routines(), config.home_config,
+                            repository.get_base_matrix(config.home_config))
+        homes[name] = timeline.matrix(day)
+
+    start = time.perf_counter()
+    filepaths = render_homes(homes, args.output_dir,
+                             args.format, args.dpi, args.workers)
+    print(f"Rendered {len(filepaths)} homes in {time.perf_counter() - start:.2f}s")
+
+
+def run_snapshot(args: argparse.Namespace):
+    from dt.data import RepositoryFactory
+    from dt.data.snapshot import write_snapshot
+    from dt.energy import ConflictError, StateMatrix
+
+    config = load_config()
+    repository = RepositoryFactory.create(config.database_config)
+    appliances = repository.get_appliances()
+
+    # The timeline uses the base matrix on the days on which every enabled routine runs
+    try:
+        matrix = StateMatrix(
+            appliances, repository.get_routines(), config.home_config)
+    except ConflictError as e:
+        # Routines that conflict can still be valid if they never run on the same day,
+        # in which case the days are simulated when queried, as without a snapshot
+        print(f"The routines can't all run on the same day, so only the idle matrix is compiled: {e}")
+        matrix = StateMatrix(appliances, [], config.home_config)
+
+    write_snapshot(args.output, repository, [a.id for a in matrix.registry.appliances],
+                   [routine.id for routine in matrix.routines if routine.enabled],
+                   matrix.requested_matrix, config.home_config)
+
+
+def run_bundle(args: argparse.Namespace):
+    from dt.data.data_repository import convert_json_to_jsonl
+
+    database_config = load_config().database_config
+    convert_json_to_jsonl(database_config.appliances_dir, database_config.routines_dir,
+                          database_config.test_routines_dir, args.output)
+
+
+def run_sqlite(args: argparse.Namespace):
+    from dt.data import RepositoryFactory
+    from dt.data.sqlite_repository import import_to_sqlite
+
+    config = load_config()
+    repository = RepositoryFactory.create(config.database_config)
+    import_to_sqlite(repository, args.output, args.home_id)
+
+
+def run_scenarios(args: argparse.Namespace):
+    import csv
+    from datetime import date, timedelta
+    import time
+    from dt.data import RepositoryFactory
+    from dt.scenarios import RoutineUncertainty, ScenarioEngine
+
+    config = load_config()
+    repository = RepositoryFactory.create(config.database_config)
+    first_day = date.fromisoformat(args.start) if args.start else date.today()
+    end_day = date.fromisoformat(args.end) if args.end else first_day + timedelta(days=1)
+    engine = ScenarioEngine(repository.get_appliances(), repository.get_routines(), config.home_config,
+                            RoutineUncertainty(args.jitter, args.spread),
+                            days=[first_day + timedelta(days=offset) for offset in range((end_day - first_day).days)])
+
+    start = time.perf_counter()
+    report = engine.run(args.count, args.seed, workers=args.workers)
+    print(f"Simulated {report.scenarios} scenarios in {time.perf_counter() - start:.2f}s")
+    print(f"Probability of exceeding {config.home_config.max_power/1000}kW: {report.exceedance_probability:.2%}")
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["minute", *[f"p{p:g}" for p in report.percentiles], "exceedance"])
+            for minute in range(report.load_curves.shape[1]):
+                writer.writerow([minute, *report.load_curves[:, minute].round(1), report.minute_exceedance[minute]])
+
+
+def run_batch(args: argparse.Namespace):
+    import sys
+    import time
+    from dt.batch import read_scenarios, write_results
+    from dt.batch import run_batch as simulate_batch
+
+    if os.environ.get("DT_CONFIG_FILE") is None:
+        raise ValueError("DT_CONFIG_FILE environment variable is not set")
+
+    export_format = os.path.splitext(args.output)[1].lstrip(".") if args.output is not None else "jsonl"
+    results = simulate_batch(read_scenarios(args.input), os.environ["DT_CONFIG_FILE"], args.workers)
+    start = time.perf_counter()
+
+    if export_format in ("npz", "parquet", "arrow"):
+        from dt.export import results_columns, write_columns
+
+        # Columnar files are written at once, when every result is ready
+        results = list(results)
+        write_columns(results_columns(results), args.output)
+        count = len(results)
+    else:
+        output = open(args.output, "w", newline="", encoding="utf-8") if args.output is not None else sys.stdout
+        try:
+            count = write_results(results, output, "csv" if export_format == "csv" else "jsonl")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    elapsed = time.perf_counter() - start
+    # Reported on stderr, so that the results can be piped from stdout
+    print(f"Simulated {count} routines in {elapsed:.2f}s ({count / elapsed:.1f} routines/s)", file=sys.stderr)
+
+
+def run_export(args: argparse.Namespace):
+    from datetime import date, timedelta
+    import time
+    from dt.config import Config
+    from dt.data import RepositoryFactory
+    from dt.energy import CostsMatrix
+    from dt.export import export_home
+    from dt.timeline import Timeline
+
+    start = date.fromisoformat(args.start) if args.start else date.today()
+    end = date.fromisoformat(args.end) if args.end else start + timedelta(days=7)
+    config_files = args.config or [os.environ["DT_CONFIG_FILE"]]
+
+    begin = time.perf_counter()
+    for config_file in config_files:
+        config = Config.from_toml(config_file)
+        repository = RepositoryFactory.create(config.database_config)
+        timeline = Timeline(repository.get_appliances(), repository.get_routines(), config.home_config,
+                            repository.get_base_matrix(config.home_config))
+        name = os.path.splitext(os.path.basename(config_file))[0]
+
+        filepath = export_home(timeline, CostsMatrix(config.home_config), start, end, args.output_dir, name, args.format)
+        print(f"Exported {name} to {filepath}")
+
+    print(f"Exported {len(config_files)} homes in {time.perf_counter() - begin:.2f}s")
+
+
+def run_meter(args: argparse.Namespace):
+    from dt.meter import ingest_meter_csv
+
+    history = ingest_meter_csv(args.input, args.output)
+    print(f"History from {history.start} with {history.days} days")
+
+
+def run_compare(args: argparse.Namespace):
+    from datetime import date, timedelta
+    from dt.data import RepositoryFactory
+    from dt.meter import MeterHistory
+    from dt.timeline import Timeline
+
+    config = load_config()
+    repository = RepositoryFactory.create(config.database_config)
+    timeline = Timeline(repository.get_appliances(), repository.get_routines(), config.home_config,
+                        repository.get_base_matrix(config.home_config))
+    history = MeterHistory(args.history)
+
+    # Each day is compared with the routines executed on it
+    start = max(date.fromisoformat(args.start), history.start) if args.start else history.start
+    history_end = history.start + timedelta(days=history.days)
+    end = max(min(date.fromisoformat(args.end), history_end) if args.end else history_end, start)
+
+    # The simulated days are only built chunk by chunk, as the readings are compared
+    comparison = history.compare(lambda day: timeline.matrix(day).net_power, start, end, args.threshold)
+
+    print(f"Compared minutes: {comparison.minutes}")
+    print(f"Mean absolute error: {comparison.mean_absolute_error:.1f}W")
+    print(f"Root mean squared error: {comparison.root_mean_squared_error:.1f}W")
+    print(f"Bias: {comparison.bias:.1f}W")
+    print(f"Energy error: {comparison.energy_error/1000:.3f}kWh")
+
+    for start, end in comparison.divergent_intervals:
+        print(f"Diverges from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}")
+
+
+def run_calibrate(args: argparse.Namespace):
+    from datetime import date, timedelta
+    from dt.calibration import Calibrator, write_calibrated_appliances
+    from dt.data import RepositoryFactory
+    from dt.meter import MeterHistory
+    from dt.timeline import Timeline
+
+    config = load_config()
+    repository = RepositoryFactory.create(config.database_config)
+    appliances = repository.get_appliances()
+    timeline = Timeline(appliances, repository.get_routines(), config.home_config)
+    history = MeterHistory(args.history)
+
+    calibrator = Calibrator(appliances, args.regularization)
+    start = date.fromisoformat(args.start) if args.start else history.start
+    end = date.fromisoformat(args.end) if args.end else history.start + timedelta(days=history.days)
+
+    for day, matrix in timeline.days(start, end):
+        calibrator.add_day(matrix, history.day(day))
+
+    powers = calibrator.fit()
+    for (appliance_id, mode_id), power in powers.items():
+        mode = calibrator.registry.get_mode(appliance_id, mode_id)
+        print(f"{calibrator.registry.get(appliance_id).device} - {mode.name}: {mode.power_consumption}W -> {power:.1f}W")
+
+    filepaths = write_calibrated_appliances(
+        config.database_config.appliances_dir, args.output_dir, powers)
+    print(f"Calibrated {len(powers)} modes with {calibrator.minutes} minutes of readings, written to {len(filepaths)} files")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="dt", description="A smart home digital twin.")
+    subparsers = parser.add_subparsers(title="commands")
+
+    api_parser = subparsers.add_parser(
+        "api", help="start the REST API server in development mode")
+    api_parser.set_defaults(func=run_api)
+
+    map_parser = subparsers.add_parser(
+        "map", help="show a map of the appliances modes during the day")
+    map_parser.set_defaults(func=run_map)
+
+    render_parser = subparsers.add_parser(
+        "render", help="render the maps of the appliances modes of many homes to files, without a display")
+    render_parser.add_argument(
+        "output_dir", help="directory to write the files to")
+    render_parser.add_argument(
+        "config", nargs="*", help="configuration file of each home, defaults to DT_CONFIG_FILE")
+    render_parser.add_argument(
+        "--day", default=None, help="day to render the routines of, e.g. 2024-03-01 (default: today)")
+    render_parser.add_argument(
+        "--format", default="png", help="file format, e.g. png or svg (default: png)")
+    render_parser.add_argument(
+        "--dpi", type=int, default=100, help="resolution of raster formats (default: 100)")
+    render_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="number of rendering processes (default: number of CPUs)")
+    render_parser.set_defaults(func=run_render)
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="compile the configured home into a snapshot file, for faster startup")
+    snapshot_parser.add_argument(
+        "output", help="path of the snapshot file to write")
+    snapshot_parser.set_defaults(func=run_snapshot)
+
+    bundle_parser = subparsers.add_parser(
+        "bundle", help="convert the configured JSON directories into a single JSON Lines file")
+    bundle_parser.add_argument(
+        "output", help="path of the JSON Lines file to write")
+    bundle_parser.set_defaults(func=run_bundle)
+
+    sqlite_parser = subparsers.add_parser(
+        "sqlite", help="import the configured home into a SQLite database")
+    sqlite_parser.add_argument(
+        "output", help="path of the SQLite database, created if it does not exist")
+    sqlite_parser.add_argument(
+        "home_id", help="ID of the home in the database, its previous data is replaced")
+    sqlite_parser.set_defaults(func=run_sqlite)
+
+    scenarios_parser = subparsers.add_parser(
+        "scenarios", help="estimate the probability of exceeding the maximum power with randomized routine timings")
+    scenarios_parser.add_argument(
+        "--count", type=int, default=1000, help="number of scenarios (default: 1000)")
+    scenarios_parser.add_argument(
+        "--jitter", type=float, default=15, help="standard deviation of the start of the routines, in minutes (default: 15)")
+    scenarios_parser.add_argument(
+        "--spread", type=float, default=0.1, help="standard deviation of the durations, relative to the duration (default: 0.1)")
+    scenarios_parser.add_argument(
+        "--seed", type=int, default=None, help="seed of the random generator, for reproducible results")
+    scenarios_parser.add_argument(
+        "--from", dest="start", default=None, help="first day the scenarios are drawn from, e.g. 2024-03-01 (default: today)")
+    scenarios_parser.add_argument(
+        "--to", dest="end", default=None, help="day after the last one the scenarios are drawn from (default: the day after the first)")
+    scenarios_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="number of simulating processes (default: number of CPUs)")
+    scenarios_parser.add_argument(
+        "--output", default=None, help="CSV file to write the percentile load curves and the exceedance of each minute to")
+    scenarios_parser.set_defaults(func=run_scenarios)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="simulate and optimize the candidate routines of many scenarios, without the API")
+    batch_parser.add_argument(
+        "input", help="JSON Lines file, or directory of JSON files, with one scenario each")
+    batch_parser.add_argument(
+        "--output", default=None, help="file to write the results to, in the format of its extension: .csv, .npz, .parquet or .arrow, JSON Lines otherwise (default: stdout)")
+    batch_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="number of simulating processes (default: number of CPUs)")
+    batch_parser.set_defaults(func=run_batch)
+
+    export_parser = subparsers.add_parser(
+        "export", help="export the state, power and costs of many homes, minute by minute, to columnar files")
+    export_parser.add_argument(
+        "output_dir", help="directory to write the files to, one subdirectory for each home")
+    export_parser.add_argument(
+        "config", nargs="*", help="configuration file of each home, defaults to DT_CONFIG_FILE")
+    export_parser.add_argument(
+        "--from", dest="start", default=None, help="first day to export, e.g. 2024-03-01 (default: today)")
+    export_parser.add_argument(
+        "--to", dest="end", default=None, help="day after the last one to export (default: a week after the first)")
+    export_parser.add_argument(
+        "--format", default="npz", choices=["npz", "parquet", "arrow"], help="file format, parquet and arrow require pyarrow (default: npz)")
+    export_parser.set_defaults(func=run_export)
+
+    meter_parser = subparsers.add_parser(
+        "meter", help="store the readings of a meter, from a CSV file with a timestamp,power header, in a history file")
+    meter_parser.add_argument(
+        "input", help="path of the CSV file to read")
+    meter_parser.add_argument(
+        "output", help="path of the history file, created if it does not exist")
+    meter_parser.set_defaults(func=run_meter)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare the readings of a meter history with the power simulated for the configured home")
+    compare_parser.add_argument(
+        "history", help="path of the history file")
+    compare_parser.add_argument(
+        "--from", dest="start", default=None, help="first day to compare, e.g. 2024-03-01 (default: start of the history)")
+    compare_parser.add_argument(
+        "--to", dest="end", default=None, help="day after the last one to compare (default: end of the history)")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=500, help="difference above which the twin diverges, in watts (default: 500)")
+    compare_parser.set_defaults(func=run_compare)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate", help="fit the power consumption of the modes to the readings of a meter history")
+    calibrate_parser.add_argument(
+        "history", help="path of the history file")
+    calibrate_parser.add_argument(
+        "output_dir", help="directory to write the calibrated appliances JSON files to")
+    calibrate_parser.add_argument(
+        "--from", dest="start", default=None, help="first day to fit, e.g. 2024-03-01 (default: start of the history)")
+    calibrate_parser.add_argument(
+        "--to", dest="end", default=None, help="day after the last one to fit (default: end of the history)")
+    calibrate_parser.add_argument(
+        "--regularization", type=float, default=1.0, help="weight of the current power of the modes, in minutes of readings (default: 1)")
+    calibrate_parser.set_defaults(func=run_calibrate)
+
+    args = parser.parse_args()
+
+    # Start the API if no command is given, for backwards compatibility
+    if "func" not in args:
+        args.func = run_api
+
+    args.func(args)
+
+
 if __name__ == "__main__":
     main()
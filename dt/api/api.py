@@ -3,6 +3,7 @@
 This module provides the REST API for the Digital Twin, implemented using [FastAPI](https://fastapi.tiangolo.com/).
 """
 
+from datetime import date
 import os
 from fastapi import FastAPI
 import fastapi
@@ -12,9 +13,10 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException
 
-from dt.data import DataRepository
+from dt.data import AsyncDataRepository, DataRepository
 from dt.config import HomeConfig
-from dt.energy import ConflictError, StateMatrix, CostsMatrix
+from dt.energy import ConflictError, CostsMatrix
+from dt.timeline import Timeline
 from . import routes
 from . import schemas
 
@@ -47,7 +49,7 @@ def create_api(repository: DataRepository, config: HomeConfig, title="Digital Tw
     """Create a FastAPI instance.
 
     Create a new FastAPI instance, using the given data repository and
-    state matrix. These are not passed to routes using dependency injection
+    the timeline of the state matrices of the home. These are not passed to routes using dependency injection
     as they are global to the application.
 
     Args:
@@ -59,10 +61,16 @@ def create_api(repository: DataRepository, config: HomeConfig, title="Digital Tw
     Returns:
         FastAPI: The FastAPI instance.
     """
-    matrix = StateMatrix(
-        repository.get_appliances(), repository.get_routines(), config)
+    timeline = Timeline(
+        repository.get_appliances(), repository.get_routines(), config, repository.get_base_matrix(config))
     costs = CostsMatrix(config)
 
+    # Other days are simulated when queried, but today's routines are checked at startup
+    timeline.matrix(date.today())
+
+    # The routes use the asynchronous repository, so that slow storage does not block the event loop
+    async_repository = AsyncDataRepository(repository)
+
     api = FastAPI(
         title=title,
         version=version,
@@ -70,6 +78,7 @@ def create_api(repository: DataRepository, config: HomeConfig, title="Digital Tw
         redoc_url=None,  # Disable Redoc
         summary="API to interact with the Digital Twin.",
         openapi_tags=TAGS_METADATA,
+        on_shutdown=[async_repository.close],
     )
 
     api.add_middleware(
@@ -81,13 +90,13 @@ def create_api(repository: DataRepository, config: HomeConfig, title="Digital Tw
     )
 
     api.include_router(routes.get_appliance_router(
-        repository, tags=[__APPLIANCE_TAG]))
+        async_repository, tags=[__APPLIANCE_TAG]))
     api.include_router(routes.get_routine_router(
-        repository, tags=[__ROUTINE_TAG]))
+        async_repository, tags=[__ROUTINE_TAG]))
     api.include_router(routes.get_consumption_router(
-        repository, matrix, tags=[__CONSUMPTION_TAG]))
+        async_repository, timeline, tags=[__CONSUMPTION_TAG]))
     api.include_router(routes.get_simulate_router(
-        repository, matrix, costs, tags=[__SIMULATE_TAG]))
+        async_repository, timeline, costs, tags=[__SIMULATE_TAG]))
 
     @api.exception_handler(HTTPException)
     async def http_exception_handler(_: fastapi.Request, exc: HTTPException):
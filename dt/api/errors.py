@@ -14,3 +14,6 @@ APPLIANCE_INVALID = HTTPException(
 
 OPERATION_MODE_INVALID = HTTPException(
     status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid operation mode")
+
+RECURRENCE_INVALID = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid recurrence")
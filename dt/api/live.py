@@ -0,0 +1,133 @@
+"""Live consumption updates for the API clients.
+
+Dashboards show the consumption of the current minute, which only changes when a routine
+starts or stops an appliance. Rather than having every client poll the consumption endpoints,
+a single broadcaster computes the consumptions once per minute and pushes them to all the
+subscribers, only when they change. Messages are encoded once and shared by all the subscribers.
+If the consumptions can't be computed, the subscribers receive an error message and their
+iterations stop, so that the clients can reconnect.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from dt.timeline import Timeline
+from . import serializers
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumptionBroadcaster:
+    """Pushes the consumptions of the current minute to many subscribers.
+
+    The consumptions are computed by a background task, which only runs while there are subscribers.
+    Each subscriber receives the latest message when it subscribes, and then every change.
+    Subscribers that are slower than the updates skip the intermediate messages.
+    If an update fails, the subscribers receive an error message, shaped as `schemas.ErrorOut`
+    under an `error` key, and then their iterations stop.
+    """
+
+    def __init__(self, timeline: Timeline):
+        """Constructor.
+
+        Args:
+            timeline (Timeline): The timeline to get the state matrix of each day from.
+        """
+        self.timeline = timeline
+        # None ends the iteration of the subscriber
+        self.__subscribers: set[asyncio.Queue[bytes | None]] = set()
+        self.__task: asyncio.Task | None = None
+        self.__last_consumptions: list[float] | None = None
+        self.__last_message: bytes | None = None
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Receive the messages, as JSON shaped as `schemas.LiveConsumptionOut`, until the iteration stops.
+
+        Yields:
+            bytes: The encoded message.
+        """
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=2)
+
+        if self.__task is None:
+            try:
+                self.__update(datetime.now())
+            except Exception as e:
+                logger.exception("Live consumption update failed")
+                yield self.__error_message(e)
+                return
+
+            self.__task = asyncio.create_task(self.__run())
+
+        if self.__last_message is not None:
+            queue.put_nowait(self.__last_message)
+        self.__subscribers.add(queue)
+
+        try:
+            while (message := await queue.get()) is not None:
+                yield message
+        finally:
+            self.__subscribers.discard(queue)
+
+            if not self.__subscribers and self.__task is not None:
+                self.__task.cancel()
+                self.__task = None
+
+    async def __run(self) -> None:
+        try:
+            while True:
+                # Wake up at the start of the next minute
+                now = datetime.now()
+                next_minute = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+                await asyncio.sleep((next_minute - now).total_seconds())
+
+                self.__update(datetime.now())
+        except Exception as e:
+            logger.exception("Live consumption update failed")
+            self.__fail(e)
+        finally:
+            # The next subscriber starts a new task
+            if self.__task is asyncio.current_task():
+                self.__task = None
+
+    @staticmethod
+    def __error_message(error: Exception) -> bytes:
+        return serializers.dumps({"error": {"message": str(error), "context": {}}})
+
+    def __fail(self, error: Exception) -> None:
+        message = self.__error_message(error)
+        self.__last_consumptions = None
+        self.__last_message = None
+
+        # The subscribers stop, and the next subscriber starts over
+        subscribers, self.__subscribers = self.__subscribers, set()
+        for queue in subscribers:
+            # The error replaces the message that the subscriber has not received yet, if any
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(message)
+            queue.put_nowait(None)
+
+    def __update(self, when: datetime) -> None:
+        matrix = self.timeline.matrix(when.date())
+        minute_of_day = when.hour * 60 + when.minute
+        consumptions = matrix.power_matrix[minute_of_day].tolist()
+
+        if consumptions == self.__last_consumptions:
+            return
+
+        self.__last_consumptions = consumptions
+        self.__last_message = serializers.dumps({
+            "when": when.replace(second=0, microsecond=0).isoformat(),
+            "total": float(matrix.power[minute_of_day]),
+            "consumptions": [{"appliance_id": appliance.id, "consumption": consumption}
+                             for appliance, consumption in zip(matrix.registry.appliances, consumptions)]
+        })
+
+        for queue in self.__subscribers:
+            # Replace the message that the subscriber has not received yet, if any
+            if not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.__last_message)
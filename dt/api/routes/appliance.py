@@ -1,12 +1,12 @@
 from enum import Enum
 from fastapi import APIRouter
 
-from dt.api import schemas
-from dt.data import DataRepository
+from dt.api import schemas, serializers
+from dt.data import AsyncDataRepository
 from .. import errors
 
 
-def get_appliance_router(repository: DataRepository, tags: list[str | Enum]) -> APIRouter:
+def get_appliance_router(repository: AsyncDataRepository, tags: list[str | Enum]) -> APIRouter:
     router = APIRouter(tags=tags, prefix="/appliance")
 
     @router.get("/{appliance_id}")
@@ -14,18 +14,18 @@ def get_appliance_router(repository: DataRepository, tags: list[str | Enum]) ->
         """Get an appliance by ID.
         """
 
-        appliance = repository.get_appliance(appliance_id)
+        appliance = await repository.aget_appliance(appliance_id)
 
         if appliance is None:
             raise errors.APPLIANCE_NOT_FOUND
 
-        return schemas.ValueResponse(value=schemas.ApplianceOut.model_validate(appliance))
+        return serializers.value_response(serializers.serialize_appliance(appliance))
 
     @router.get("")
     async def get_appliances() -> schemas.ListResponse[schemas.ApplianceOut]:
         """Get all appliances.
         """
 
-        return schemas.ListResponse(value=[schemas.ApplianceOut.model_validate(a) for a in repository.get_appliances()])
+        return serializers.value_response([serializers.serialize_appliance(a) for a in await repository.aget_appliances()])
 
     return router
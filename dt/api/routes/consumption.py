@@ -1,49 +1,79 @@
+import asyncio
 from datetime import datetime
 from enum import Enum
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
 
-from dt.api import schemas
-from dt.data import DataRepository
-from dt.energy import StateMatrix
+from dt.api import schemas, serializers
+from dt.api.live import ConsumptionBroadcaster
+from dt.data import AsyncDataRepository
+from dt.timeline import Timeline
 from .. import errors
 
 
-def get_consumption_router(repository: DataRepository, matrix: StateMatrix, tags: list[str | Enum]) -> APIRouter:
+def get_consumption_router(repository: AsyncDataRepository, timeline: Timeline, tags: list[str | Enum]) -> APIRouter:
     router = APIRouter(tags=tags, prefix="/consumption")
+    broadcaster = ConsumptionBroadcaster(timeline)
+
+    @router.websocket("/live")
+    async def websocket_consumption_live(websocket: WebSocket):
+        """Push the per-appliance and total consumption of the current minute, whenever they change.
+        The messages are shaped as `schemas.LiveConsumptionOut`. If the consumptions can't be computed,
+        the last message has an `error` key shaped as `schemas.ErrorOut`, and the server closes the connection.
+        """
+
+        await websocket.accept()
+
+        async def push():
+            async for message in broadcaster.subscribe():
+                await websocket.send_text(message.decode("utf-8"))
+
+            # The iteration only stops after an error
+            await websocket.close(code=1011)
+
+        push_task = asyncio.create_task(push())
+
+        try:
+            # Clients are not expected to send anything, this only waits for them to disconnect
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            push_task.cancel()
 
     @router.get("/{when}")
     async def get_consumptions(when: datetime) -> schemas.ListResponse[schemas.ApplianceConsumption]:
         """Get the per-appliance consumption at a given date and time.
         """
 
-        consumptions = matrix.consumptions(when)
+        consumptions = timeline.matrix(when.date()).consumptions(when)
 
-        return schemas.ListResponse(value=[schemas.ApplianceConsumption(appliance_id=a.id, consumption=c) for a, c in consumptions.items()])
+        return serializers.value_response([{"appliance_id": a.id, "consumption": c} for a, c in consumptions.items()])
 
     @router.get("/total/{when}")
     async def get_consumption_total(when: datetime) -> schemas.ValueResponse[float]:
         """Get the total consumption at a given date and time.
         """
 
-        return schemas.ValueResponse(value=matrix.total_consumption(when))
+        return schemas.ValueResponse(value=timeline.matrix(when.date()).total_consumption(when))
 
     @router.get("/total/")
     async def get_consumption_total_list(when: list[datetime] = Query()) -> schemas.ListResponse[float]:
         """Get the total consumption for the given dates and times.
         """
 
-        return schemas.ListResponse(value=[matrix.total_consumption(w) for w in when])
+        return serializers.value_response([timeline.matrix(w.date()).total_consumption(w) for w in when])
 
     @router.get("/{appliance_id}/{when}")
     async def get_consumption_appliance(appliance_id: int, when: datetime) -> schemas.ValueResponse[float]:
         """Get the consumption of an appliance at a given date and time.
         """
 
-        appliance = repository.get_appliance(appliance_id)
+        appliance = await repository.aget_appliance(appliance_id)
 
         if appliance is None:
             raise errors.APPLIANCE_NOT_FOUND
 
-        return schemas.ValueResponse(value=matrix.appliance_consumption(appliance, when))
+        return schemas.ValueResponse(value=timeline.matrix(when.date()).appliance_consumption(appliance, when))
 
     return router
@@ -1,31 +1,39 @@
 from enum import Enum
 from fastapi import APIRouter
 
-from dt.api import schemas
-from dt.data import DataRepository
+from dt.api import schemas, serializers
+from dt.data import AsyncDataRepository
 from .. import errors
 
 
-def get_routine_router(repository: DataRepository, tags: list[str | Enum]) -> APIRouter:
+def get_routine_router(repository: AsyncDataRepository, tags: list[str | Enum]) -> APIRouter:
     router = APIRouter(tags=tags, prefix="/routine")
 
+    @router.get("/compact")
+    async def get_routines_compact() -> schemas.ValueResponse[schemas.CompactRoutinesOut]:
+        """Get all routines, with the actions referencing the appliances by ID.
+        The appliances are returned once, in a separate table.
+        """
+
+        return serializers.value_response(serializers.serialize_compact_routines(await repository.aget_routines()))
+
     @router.get("/{routine_id}")
     async def get_routine(routine_id: int) -> schemas.ValueResponse[schemas.RoutineOut]:
         """Get a routine by ID.
         """
 
-        routine = repository.get_routine(routine_id)
+        routine = await repository.aget_routine(routine_id)
 
         if routine is None:
             raise errors.ROUTINE_NOT_FOUND
 
-        return schemas.ValueResponse(value=schemas.RoutineOut.model_validate(routine))
+        return serializers.value_response(serializers.serialize_routine(routine))
 
     @router.get("")
     async def get_routines() -> schemas.ListResponse[schemas.RoutineOut]:
         """Get all routines.
         """
 
-        return schemas.ListResponse(value=[schemas.RoutineOut.model_validate(r) for r in repository.get_routines()])
+        return serializers.value_response(serializers.serialize_routines(await repository.aget_routines()))
 
     return router
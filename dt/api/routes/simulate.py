@@ -1,27 +1,41 @@
-from datetime import datetime
+import asyncio
+from datetime import date, datetime
 from enum import Enum
 from fastapi import APIRouter, Query
 
-from dt.api import schemas
-from dt.data import DataRepository, Routine, RoutineAction, Appliance
-from dt.energy import StateMatrix, CostsMatrix, InconsistentRoutinesError, MaxPowerExceededError, RoutineOptimizer
+from dt.api import schemas, serializers
+from dt.data import AsyncDataRepository, ApplianceLoader, Routine, RoutineAction, Appliance
+from dt.data.data_repository import parse_recurrence
+from dt.energy import CostsMatrix, InconsistentRoutinesError, MaxPowerExceededError, RoutineOptimizer
+from dt.demand_response import DemandResponseResult
+from dt.recommendations import ConflictResolver, Resolution
+from dt.timeline import Timeline
 from .. import errors
 
 
-def get_simulate_router(repository: DataRepository, matrix: StateMatrix, costs: CostsMatrix, tags: list[str | Enum]) -> APIRouter:
+def get_simulate_router(repository: AsyncDataRepository, timeline: Timeline, costs: CostsMatrix, tags: list[str | Enum]) -> APIRouter:
     router = APIRouter(tags=tags, prefix="/simulate")
 
     @router.post("")
-    async def post_simulate(routine_in: schemas.RoutineIn) -> schemas.ListResponse[schemas.RecommendationOut]:
-        """Simulates the addition of a routine.
+    async def post_simulate(routine_in: schemas.RoutineIn, budget: float | None = Query(None, gt=0)) -> schemas.ListResponse[schemas.RecommendationOut]:
+        """Simulates the addition of a routine, on the next day on which it is executed.
+        If a budget, in seconds, is given, the start time is searched approximately within it,
+        and the recommendation also has the most that a better start time could save in addition, as `gap`.
         """
         error = None
         recommendations = []
 
-        routine_model = __routine_schema_to_model(routine_in, repository)
+        routine_model = await __routine_schema_to_model(routine_in, repository.loader())
+        day = __simulation_day(routine_model)
+        matrix = timeline.matrix(day)
         try:
             # Try to add the routine to the matrix to see if any conflicts are thrown
-            matrix.add_routine(routine_model)
+            simulated = matrix.add_routine(routine_model)
+
+            if simulated.demand_response is not None and simulated.demand_response.delays:
+                # The routine is accepted, and the appliances with lower priorities are delayed to make room for it
+                recommendations.append(
+                    __demand_response_to_schema(simulated.demand_response))
         except InconsistentRoutinesError as e:
             error = e
 
@@ -33,47 +47,86 @@ def get_simulate_router(repository: DataRepository, matrix: StateMatrix, costs:
         except MaxPowerExceededError as e:
             error = e
 
-            list = matrix.routines.copy()
-            list.append(routine_model)
-            most_consuming = sorted(list, key=lambda r: r.power_consumption_at(
-                routine_model.when), reverse=True)
-
-            recommendations.append(schemas.RecommendationOut(type=schemas.RecommendationType.disable_routine,
-                                                             context={"routine": schemas.RoutineOut.model_validate(most_consuming[0])}))
-            recommendations.append(schemas.RecommendationOut(type=schemas.RecommendationType.disable_routine,
-                                                             context={"routine": schemas.RoutineOut.model_validate(most_consuming[1])}))
-
-        # Try to find the best start time for the routine
-        optimizer = RoutineOptimizer(matrix, costs)
-        search_result = optimizer.find_best_start_time(routine_model)
-        if search_result is not None:
-            best_start_time, savings = search_result
+            # Find the smallest changes that bring the house back under its maximum power
+            resolver = ConflictResolver(matrix, costs, day)
+            for resolution in resolver.resolve(routine_model):
+                recommendations.append(__resolution_to_schema(resolution))
+
+        # Try to find the best start time for the routine, with the prices of that day
+        optimizer = RoutineOptimizer(matrix, costs, day)
+        if budget is None:
+            search_result = optimizer.find_best_start_time(routine_model)
+            context = {"when": search_result[0], "savings": search_result[1]} if search_result else None
+        else:
+            search_result = optimizer.find_approximate_start_time(
+                routine_model, budget=budget)
+            context = {"when": search_result[0], "savings": search_result[1],
+                       "gap": search_result[2]} if search_result else None
+
+        if context is not None:
             recommendation = schemas.RecommendationOut(type=schemas.RecommendationType.change_start_time,
-                                                       context={"when": best_start_time, "savings": savings})
+                                                       context=context)
             recommendations.append(recommendation)
 
         return schemas.ListResponse(value=recommendations,
                                     error=schemas.ErrorOut(message=str(error),
                                                            context=__context_to_schemas(error.context)) if error else None)
 
+    @router.post("/diff")
+    async def post_simulate_diff(routine_in: schemas.RoutineIn) -> schemas.ValueResponse[schemas.SimulationDiffOut]:
+        """Simulates the addition of a routine and returns what changes from the current schedule:
+        the changes of the modes of the appliances, and the difference of power, energy and cost.
+        The next day on which the routine is executed is simulated.
+        """
+
+        routine_model = await __routine_schema_to_model(routine_in, repository.loader())
+        day = __simulation_day(routine_model)
+        matrix = timeline.matrix(day)
+        diff = matrix.diff(matrix.add_routine(routine_model), costs, day)
+
+        return serializers.value_response(serializers.serialize_diff(diff, matrix.registry))
+
+    @router.post("/options")
+    async def post_simulate_options(routine_in: schemas.RoutineIn, cost_weight: float = Query(1.0, ge=0), peak_weight: float = Query(1.0, ge=0),
+                                    distance_weight: float = Query(1.0, ge=0)) -> schemas.ListResponse[schemas.StartTimeOptionOut]:
+        """Get the start times of a routine that trade off its cost, the peak load and the distance from its start time,
+        ranked by the weighted sum of the objectives. The next day on which the routine is executed is checked.
+        """
+
+        routine_model = await __routine_schema_to_model(routine_in, repository.loader())
+        day = __simulation_day(routine_model)
+        optimizer = RoutineOptimizer(timeline.matrix(day), costs, day)
+        options = optimizer.find_pareto_start_times(
+            routine_model, cost_weight, peak_weight, distance_weight)
+
+        return schemas.ListResponse(value=[schemas.StartTimeOptionOut.model_validate(option) for option in options])
+
+    @router.post("/feasibility")
+    async def post_simulate_feasibility(routine_in: schemas.RoutineIn) -> schemas.ValueResponse[schemas.FeasibilityOut]:
+        """Get every start time at which a routine could be added without conflicts, as intervals of minutes of the day.
+        The start time of the routine is ignored, and the next day on which it is executed is checked.
+        """
+
+        routine_model = await __routine_schema_to_model(routine_in, repository.loader())
+        matrix = timeline.matrix(__simulation_day(routine_model))
+        return serializers.value_response(serializers.serialize_feasibility(matrix.feasible_starts(routine_model)))
+
     @router.post("/consumption/{when}")
     async def post_consumptions(routine_in: schemas.RoutineIn, when: datetime) -> schemas.ListResponse[schemas.ApplianceConsumption]:
         """Get the per-appliance consumption at a given date and time.
         """
 
-        simulated = matrix.add_routine(
-            __routine_schema_to_model(routine_in, repository))
+        simulated = timeline.simulate(await __routine_schema_to_model(routine_in, repository.loader()), when.date())
         consumptions = simulated.consumptions(when)
 
-        return schemas.ListResponse(value=[schemas.ApplianceConsumption(appliance_id=a.id, consumption=c) for a, c in consumptions.items()])
+        return serializers.value_response([{"appliance_id": a.id, "consumption": c} for a, c in consumptions.items()])
 
     @router.post("/consumption/total/{when}")
     async def post_simulate_consumption_total(routine_in: schemas.RoutineIn, when: datetime) -> schemas.ValueResponse[float]:
         """Simulates the addition of a routine and returns the total consumption at a given date and time.
         """
 
-        simulated = matrix.add_routine(
-            __routine_schema_to_model(routine_in, repository))
+        simulated = timeline.simulate(await __routine_schema_to_model(routine_in, repository.loader()), when.date())
         return schemas.ValueResponse(value=simulated.total_consumption(when))
 
     @router.post("/consumption/total/")
@@ -81,44 +134,48 @@ def get_simulate_router(repository: DataRepository, matrix: StateMatrix, costs:
         """Get the total consumption for the given dates and times.
         """
 
-        simulated = matrix.add_routine(
-            __routine_schema_to_model(routine_in, repository))
-        return schemas.ListResponse(value=[simulated.total_consumption(w) for w in when])
+        routine_model = await __routine_schema_to_model(routine_in, repository.loader())
+        return serializers.value_response([timeline.simulate(routine_model, w.date()).total_consumption(w) for w in when])
 
     @router.post("/consumption/{appliance_id}/{when}")
     async def post_simulate_consumption_appliance(routine_in: schemas.RoutineIn, appliance_id: int, when: datetime) -> schemas.ValueResponse[float]:
         """Get the consumption of an appliance at a given date and time.
         """
-        appliance = repository.get_appliance(appliance_id)
+        # Both lookups are fetched together by the loader
+        loader = repository.loader()
+        appliance, routine_model = await asyncio.gather(loader.load(appliance_id),
+                                                        __routine_schema_to_model(routine_in, loader))
 
         if appliance is None:
             raise errors.APPLIANCE_NOT_FOUND
 
-        simulated = matrix.add_routine(
-            __routine_schema_to_model(routine_in, repository))
+        simulated = timeline.simulate(routine_model, when.date())
         return schemas.ValueResponse(value=simulated.appliance_consumption(appliance, when))
 
     return router
 
 
-def __routine_schema_to_model(routine_in: schemas.RoutineIn, repository: DataRepository) -> Routine:
+async def __routine_schema_to_model(routine_in: schemas.RoutineIn, loader: ApplianceLoader) -> Routine:
     """Convert a routine schema to a routine model.
+    The appliances of all the actions are fetched with a single bulk lookup.
 
     Args:
         routine_in (schemas.RoutineIn): The routine schema.
-        repository (DataRepository): The data repository to get the routine model from.
+        loader (ApplianceLoader): The request-scoped loader to get the appliances from.
 
     Raises:
         errors.APPLIANCE_INVALID: Appliance or a mode of the appliance not found in the repository.
+        errors.RECURRENCE_INVALID: The rules of the recurrence are invalid.
 
     Returns:
-        Routine: _description_
+        Routine: The routine, with the durations of the actions in minutes.
     """
 
     actions = []
+    appliances = await loader.load_many(action_in.appliance_id for action_in in routine_in.actions)
 
     for action_in in routine_in.actions:
-        appliance = repository.get_appliance(action_in.appliance_id)
+        appliance = appliances[action_in.appliance_id]
         if appliance is None:
             raise errors.APPLIANCE_INVALID
 
@@ -129,7 +186,9 @@ def __routine_schema_to_model(routine_in: schemas.RoutineIn, repository: DataRep
         action_dict = vars(action_in).copy()
         action_dict["appliance"] = appliance
         action_dict["mode"] = mode
-        action_dict["duration"] = action_dict["duration"] // 60
+        # As in the JSON files, actions without a duration last the default duration of their mode, if any
+        action_dict["duration"] = action_dict["duration"] // 60 if action_dict["duration"] is not None \
+            else mode.default_duration
         action_dict.pop("appliance_id")
         action_dict.pop("mode_id")
 
@@ -138,9 +197,70 @@ def __routine_schema_to_model(routine_in: schemas.RoutineIn, repository: DataRep
     routine_dict = vars(routine_in)
     routine_dict["when"] = datetime.strptime(routine_dict["when"], "%H:%M")
     routine_dict["actions"] = actions
+
+    if routine_in.recurrence is not None:
+        try:
+            routine_dict["recurrence"] = parse_recurrence(
+                routine_in.recurrence.model_dump(mode="json", exclude_none=True))
+        except ValueError:
+            raise errors.RECURRENCE_INVALID
+
     return Routine(**routine_dict)
 
 
+def __simulation_day(routine: Routine) -> date:
+    """Get the day to simulate a routine on: the next day on which it is executed, from today.
+
+    Args:
+        routine (Routine): The routine.
+
+    Returns:
+        date: The day, today if the routine is not executed again.
+    """
+    today = date.today()
+    return routine.next_occurrence(today) or today
+
+
+def __resolution_to_schema(resolution: Resolution) -> schemas.RecommendationOut:
+    """Converts a resolution of the exceeding of the maximum power to a recommendation.
+
+    Args:
+        resolution (Resolution): The resolution.
+
+    Returns:
+        schemas.RecommendationOut: The recommendation.
+    """
+
+    if resolution.shifted is not None:
+        # Subtracting from zero, rather than negating, turns a zero cost into 0.0 instead of -0.0
+        return schemas.RecommendationOut(type=schemas.RecommendationType.change_start_time,
+                                         context={"when": resolution.when, "savings": 0.0 - resolution.cost_delta,
+                                                  "routine": schemas.RoutineOut.model_validate(resolution.shifted)})
+
+    if len(resolution.disabled) == 1:
+        return schemas.RecommendationOut(type=schemas.RecommendationType.disable_routine,
+                                         context={"routine": schemas.RoutineOut.model_validate(resolution.disabled[0])})
+
+    return schemas.RecommendationOut(type=schemas.RecommendationType.disable_routines,
+                                     context={"routines": [schemas.RoutineOut.model_validate(r) for r in resolution.disabled]})
+
+
+def __demand_response_to_schema(result: DemandResponseResult) -> schemas.RecommendationOut:
+    """Converts the schedule of the load controller to a recommendation.
+
+    Args:
+        result (DemandResponseResult): The schedule.
+
+    Returns:
+        schemas.RecommendationOut: The recommendation.
+    """
+
+    return schemas.RecommendationOut(type=schemas.RecommendationType.demand_response,
+                                     context={"delays": [schemas.LoadDelayOut.model_validate(delay) for delay in result.delays],
+                                              "shifted_energy": result.shifted_energy,
+                                              "unserved_energy": result.unserved_energy})
+
+
 def __context_to_schemas(context: dict) -> dict:
     """Converts a context dictionary to a dictionary of schemas.
 
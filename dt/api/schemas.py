@@ -8,10 +8,18 @@ There is duplication the fields of the schemas and the model, but I don't know h
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from typing import Any, Generic, TypeVar
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+
+
+class PowerSegmentOut(BaseModel):
+    """The schema for a segment of the power profile of an operation mode.
+    """
+
+    duration: int
+    power_consumption: float
 
 
 class OperationModeOut(BaseModel):
@@ -22,6 +30,17 @@ class OperationModeOut(BaseModel):
     name: str
     power_consumption: float
     default_duration: int | None = None
+    power_profile: list[PowerSegmentOut] | None = None
+
+    @field_validator("power_profile", mode="before")
+    @classmethod
+    def segments_from_tuples(cls, value: Any) -> Any:
+        """Convert the (duration, power consumption) tuples of the model.
+        """
+        if value is None:
+            return None
+
+        return [{"duration": duration, "power_consumption": power} for duration, power in value]
 
     # Enable creating an instance of this schema from a model.
     class Config:
@@ -37,6 +56,8 @@ class ApplianceOut(BaseModel):
     manufacturer: str
     model: str
     location: str
+    priority: int = 0
+    interruptible: bool = False
     modes: list[OperationModeOut]
 
     # Enable creating an instance of this schema from a model.
@@ -58,6 +79,40 @@ class RoutineActionOut(BaseModel):
         from_attributes = True
 
 
+class Weekday(str, Enum):
+    monday = "monday"
+    tuesday = "tuesday"
+    wednesday = "wednesday"
+    thursday = "thursday"
+    friday = "friday"
+    saturday = "saturday"
+    sunday = "sunday"
+
+
+class RecurrenceOut(BaseModel):
+    """The schema for the recurrence of a routine.
+    """
+
+    weekdays: list[Weekday] | None = None
+    every_n_days: int = 1
+    start_date: date | None = None
+    end_date: date | None = None
+
+    @field_validator("weekdays", mode="before")
+    @classmethod
+    def weekdays_from_indices(cls, value: Any) -> Any:
+        """Convert the days of the week of the model, from 0 (Monday) to 6 (Sunday).
+        """
+        if isinstance(value, (set, frozenset)):
+            return [list(Weekday)[weekday] for weekday in sorted(value)]
+
+        return value
+
+    # Enable creating an instance of this schema from a model.
+    class Config:
+        from_attributes = True
+
+
 class RoutineOut(BaseModel):
     """The schema for a routine action.
     """
@@ -67,12 +122,43 @@ class RoutineOut(BaseModel):
     when: datetime
     actions: list[RoutineActionOut]
     enabled: bool = True
+    recurrence: RecurrenceOut | None = None
 
     # Enable creating an instance of this schema from a model.
     class Config:
         from_attributes = True
 
 
+class CompactRoutineActionOut(BaseModel):
+    """The schema for a routine action, referencing the appliance and the mode by ID.
+    """
+
+    id: int
+    appliance_id: int
+    mode_id: int
+    duration: int | None = None
+
+
+class CompactRoutineOut(BaseModel):
+    """The schema for a routine, whose actions reference the appliances and the modes by ID.
+    """
+
+    id: int
+    name: str
+    when: datetime
+    actions: list[CompactRoutineActionOut]
+    enabled: bool = True
+    recurrence: RecurrenceOut | None = None
+
+
+class CompactRoutinesOut(BaseModel):
+    """The schema for a list of routines, with a single table of the appliances they use.
+    """
+
+    appliances: list[ApplianceOut]
+    routines: list[CompactRoutineOut]
+
+
 class RoutineActionIn(BaseModel):
     """The schema for an input routine action.
     """
@@ -83,6 +169,16 @@ class RoutineActionIn(BaseModel):
     duration: int | None = None
 
 
+class RecurrenceIn(BaseModel):
+    """The schema for the recurrence of an input routine.
+    """
+
+    weekdays: list[Weekday] | None = None
+    every_n_days: int = 1
+    start_date: date | None = None
+    end_date: date | None = None
+
+
 class RoutineIn(BaseModel):
     """The schema for an input routine.
     """
@@ -92,6 +188,7 @@ class RoutineIn(BaseModel):
     when: str
     actions: list[RoutineActionIn]
     enabled: bool = True
+    recurrence: RecurrenceIn | None = None
 
 
 class ApplianceConsumption(BaseModel):
@@ -102,9 +199,96 @@ class ApplianceConsumption(BaseModel):
     consumption: float
 
 
+class ModeChangeOut(BaseModel):
+    """The schema for a change of the mode of an appliance, between two schedules.
+    Start and end are minutes of the day, the end is excluded.
+    """
+
+    appliance_id: int
+    start: int
+    end: int
+    mode_before_id: int
+    mode_after_id: int
+
+
+class SimulationDiffOut(BaseModel):
+    """The schema for the differences between the current schedule and a simulated one.
+    The delta power has a value, in watts, for each minute of the day.
+    The delta energy is in Wh, and the delta cost in €.
+    """
+
+    changes: list[ModeChangeOut]
+    delta_power: list[float]
+    delta_energy: float
+    delta_cost: float
+
+
+class IntervalOut(BaseModel):
+    """The schema for an interval of minutes of the day, the end is excluded.
+    """
+
+    start: int
+    end: int
+
+
+class FeasibilityOut(BaseModel):
+    """The schema for the start times at which a routine can be added without conflicts.
+    """
+
+    intervals: list[IntervalOut]
+    feasible_minutes: int
+
+
+class StartTimeOptionOut(BaseModel):
+    """The schema for a start time on the Pareto front of a routine.
+    The savings are in €, the peak power in W and the distance from the current start time in minutes.
+    """
+
+    when: datetime
+    savings: float
+    peak_power: float
+    distance: int
+    score: float
+
+    # Enable creating an instance of this schema from a model.
+    class Config:
+        from_attributes = True
+
+
+class LiveConsumptionOut(BaseModel):
+    """The schema for the messages of the live consumption channel.
+    """
+
+    when: datetime
+    total: float
+    consumptions: list[ApplianceConsumption]
+
+
+class LoadDelayOut(BaseModel):
+    """The schema for a run of an appliance changed by demand response.
+    The start and end are minutes of the day, and the energy is in Wh.
+    """
+
+    appliance: ApplianceOut
+    mode: OperationModeOut
+    requested_start: int
+    start: int | None = None
+    end: int | None = None
+    delay: int
+    interruptions: int
+    shifted_energy: float
+    unserved_energy: float
+
+    # Enable creating an instance of this schema from a model.
+    class Config:
+        from_attributes = True
+
+
 class RecommendationType(str, Enum):
     disable_routine = "DISABLE_ROUTINE"
+    disable_routines = "DISABLE_ROUTINES"
     change_start_time = "CHANGE_ROUTINE_START_TIME"
+    demand_response = "DEMAND_RESPONSE"
 
 
 class RecommendationOut(BaseModel):
@@ -0,0 +1,157 @@
+"""Fast serialization of the models for the API responses.
+
+Validating the models with the pydantic schemas is the safest way of building a response,
+but it is also slow for large lists, as every nested routine, action, appliance and mode is validated.
+The models created by the digital twin are trusted, so they can be converted directly to JSON,
+bypassing the validation. The output matches the corresponding schemas in `schemas`.
+
+The compact representation of the routines references the appliances and modes of the actions by ID,
+rather than embedding them, and returns the appliances once in a separate table.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+import numpy as np
+
+from dt.data import Appliance, ApplianceRegistry, OperationMode, Recurrence, Routine
+from dt.data.data_repository import WEEKDAY_NAMES
+from dt.energy import MatrixDiff, find_runs
+
+
+class RawJSONResponse(Response):
+    """A response whose content is already encoded as JSON.
+    """
+
+    media_type = "application/json"
+
+
+def dumps(content: Any) -> bytes:
+    """Encode a JSON-compatible value.
+
+    Args:
+        content (Any): The value to encode.
+
+    Returns:
+        bytes: The encoded value.
+    """
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def value_response(value: Any) -> RawJSONResponse:
+    """Create a response with the same shape of `schemas.ValueResponse` and `schemas.ListResponse`.
+
+    Args:
+        value (Any): The JSON-compatible value of the response.
+
+    Returns:
+        RawJSONResponse: The response.
+    """
+    return RawJSONResponse(dumps({"error": None, "value": value}))
+
+
+def serialize_mode(mode: OperationMode) -> dict[str, Any]:
+    """Convert an operation mode as `schemas.OperationModeOut`.
+    """
+    power_profile = [{"duration": duration, "power_consumption": float(power)}
+                     for duration, power in mode.power_profile] if mode.power_profile is not None else None
+
+    return {"id": mode.id, "name": mode.name, "power_consumption": float(mode.power_consumption),
+            "default_duration": mode.default_duration, "power_profile": power_profile}
+
+
+def serialize_appliance(appliance: Appliance) -> dict[str, Any]:
+    """Convert an appliance as `schemas.ApplianceOut`.
+    """
+    return {"id": appliance.id, "device": appliance.device, "manufacturer": appliance.manufacturer,
+            "model": appliance.model, "location": appliance.location,
+            "priority": appliance.priority, "interruptible": appliance.interruptible,
+            "modes": [serialize_mode(mode) for mode in appliance.modes]}
+
+
+def serialize_recurrence(recurrence: Recurrence | None) -> dict[str, Any] | None:
+    """Convert the recurrence of a routine as `schemas.RecurrenceOut`.
+    """
+    if recurrence is None:
+        return None
+
+    return {"weekdays": [WEEKDAY_NAMES[weekday] for weekday in sorted(recurrence.weekdays)] if recurrence.weekdays is not None else None,
+            "every_n_days": recurrence.every_n_days,
+            "start_date": recurrence.start_date.isoformat() if recurrence.start_date is not None else None,
+            "end_date": recurrence.end_date.isoformat() if recurrence.end_date is not None else None}
+
+
+def serialize_routine(routine: Routine, appliances: dict[int, dict[str, Any]] | None = None) -> dict[str, Any]:
+    """Convert a routine as `schemas.RoutineOut`.
+    Each appliance is serialized once, even if used by many actions, and the same dictionary is embedded in each of them.
+    Passing the same `appliances` cache to many calls reuses the serialized appliances across routines.
+    """
+    appliances = appliances if appliances is not None else {}
+    actions = []
+
+    for action in routine.actions:
+        if action.appliance.id not in appliances:
+            appliances[action.appliance.id] = serialize_appliance(
+                action.appliance)
+
+        actions.append({"id": action.id, "appliance": appliances[action.appliance.id],
+                        "mode": serialize_mode(action.mode), "duration": action.duration})
+
+    return {"id": routine.id, "name": routine.name, "when": routine.when.isoformat(),
+            "actions": actions, "enabled": routine.enabled, "recurrence": serialize_recurrence(routine.recurrence)}
+
+
+def serialize_routines(routines: list[Routine]) -> list[dict[str, Any]]:
+    """Convert a list of routines as a list of `schemas.RoutineOut`.
+    Each appliance is serialized once for the whole list.
+    """
+    appliances: dict[int, dict[str, Any]] = {}
+    return [serialize_routine(routine, appliances) for routine in routines]
+
+
+def serialize_compact_routine(routine: Routine) -> dict[str, Any]:
+    """Convert a routine as `schemas.CompactRoutineOut`.
+    """
+    return {"id": routine.id, "name": routine.name, "when": routine.when.isoformat(),
+            "actions": [{"id": action.id, "appliance_id": action.appliance.id, "mode_id": action.mode.id,
+                         "duration": action.duration} for action in routine.actions],
+            "enabled": routine.enabled, "recurrence": serialize_recurrence(routine.recurrence)}
+
+
+def serialize_compact_routines(routines: list[Routine]) -> dict[str, Any]:
+    """Convert a list of routines as `schemas.CompactRoutinesOut`.
+    Only the appliances used by the routines are included in the table.
+    """
+    appliances: dict[int, Appliance] = {}
+
+    for routine in routines:
+        for action in routine.actions:
+            appliances.setdefault(action.appliance.id, action.appliance)
+
+    return {"appliances": [serialize_appliance(appliance) for appliance in appliances.values()],
+            "routines": [serialize_compact_routine(routine) for routine in routines]}
+
+
+def serialize_diff(diff: MatrixDiff, registry: ApplianceRegistry) -> dict[str, Any]:
+    """Convert the differences between two state matrices as `schemas.SimulationDiffOut`.
+    Columns and mode indices are converted to IDs with the registry of the matrices.
+    """
+    changes = []
+
+    for column, start, end, mode_before, mode_after in zip(diff.columns.tolist(), diff.starts.tolist(), diff.ends.tolist(),
+                                                           diff.modes_before.tolist(), diff.modes_after.tolist()):
+        appliance = registry.appliances[column]
+        changes.append({"appliance_id": appliance.id, "start": start, "end": end,
+                        "mode_before_id": appliance.modes[mode_before].id, "mode_after_id": appliance.modes[mode_after].id})
+
+    return {"changes": changes, "delta_power": diff.delta_power.tolist(),
+            "delta_energy": diff.delta_energy, "delta_cost": diff.delta_cost}
+
+
+def serialize_feasibility(feasible: np.ndarray) -> dict[str, Any]:
+    """Convert the feasible start times of a routine, one flag for each minute, as `schemas.FeasibilityOut`.
+    """
+    starts, ends = find_runs(feasible)
+    return {"intervals": [{"start": start, "end": end} for start, end in zip(starts.tolist(), ends.tolist())],
+            "feasible_minutes": int(feasible.sum())}
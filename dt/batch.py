@@ -0,0 +1,208 @@
+"""Batch simulation of candidate routines, without the API.
+
+A batch is a JSON Lines file, or a directory of JSON files, with one scenario in each line or file:
+
+    {"id": "late-wash", "config": "homes/a.toml", "day": "2024-01-06", "routines": [...]}
+
+Each scenario adds candidate routines, with the same format of the routines JSON files, to the home of a
+configuration file, one routine at a time. Every field but `routines` is optional: the ID defaults to the
+position of the scenario, the configuration to the default one, and the day to the next day on which each
+routine runs. Each candidate is simulated as by the `/simulate` endpoint of the API, and the cheapest start
+time is searched for, which gives one result for each candidate.
+
+Scenarios are spread over a pool of processes, and the results are yielded as soon as they are ready,
+so they are not in the order of the scenarios. Each process loads the home of a configuration once,
+and reuses it for every scenario of the same home.
+"""
+
+import csv
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import date
+import json
+import os
+from typing import IO, Any, Iterable, Iterator
+
+from dt.config import Config
+from dt.data import ApplianceRegistry, RepositoryFactory
+from dt.data.data_repository import parse_routine
+from dt.energy import ConflictError, CostsMatrix, InconsistentRoutinesError, RoutineOptimizer
+from dt.timeline import Timeline
+
+RESULT_FIELDS = ["scenario", "config", "routine_id", "day", "status", "message",
+                 "peak_power", "energy_delta", "cost_delta", "best_start", "savings"]
+
+# Homes loaded by this process, by configuration file
+__homes: dict[str, tuple[Timeline, CostsMatrix, ApplianceRegistry]] = {}
+
+
+def read_scenarios(path: str) -> Iterator[dict[str, Any]]:
+    """Read the scenarios of a batch, lazily. Scenarios without an ID get their position, or their file name.
+
+    Args:
+        path (str): The path to a JSON Lines file, or to a directory of JSON files.
+
+    Yields:
+        dict[str, Any]: The decoded scenario.
+    """
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(".json"):
+                with open(os.path.join(path, filename), encoding="utf-8") as file:
+                    scenario = json.load(file)
+
+                scenario.setdefault("id", os.path.splitext(filename)[0])
+                yield scenario
+
+        return
+
+    with open(path, encoding="utf-8") as file:
+        for index, line in enumerate(file):
+            if line.strip():
+                scenario = json.loads(line)
+                scenario.setdefault("id", index)
+                yield scenario
+
+
+def run_scenario(scenario: dict[str, Any], default_config: str) -> list[dict[str, Any]]:
+    """Simulate the candidate routines of a scenario.
+
+    Args:
+        scenario (dict[str, Any]): The scenario.
+        default_config (str): The configuration file of the home, if the scenario does not have one.
+
+    Returns:
+        list[dict[str, Any]]: The result of each candidate routine, with the `RESULT_FIELDS`.
+        A scenario that can't be read has a single result with the `invalid` status.
+    """
+    config_file = scenario.get("config", default_config)
+    result = dict.fromkeys(RESULT_FIELDS)
+    result.update(scenario=scenario["id"], config=config_file)
+
+    try:
+        timeline, costs, registry = __load_home(config_file)
+        routines = [parse_routine(data, registry)
+                    for data in scenario["routines"]]
+        day = date.fromisoformat(scenario["day"]) if "day" in scenario else None
+    except KeyError as e:
+        return [{**result, "status": "invalid", "message": f"Missing field {e}"}]
+    except (OSError, ValueError) as e:
+        return [{**result, "status": "invalid", "message": str(e)}]
+
+    results = []
+
+    for routine in routines:
+        routine_day = day or routine.next_occurrence(date.today()) or date.today()
+        routine_result = {**result, "routine_id": routine.id,
+                          "day": routine_day.isoformat(), "status": "ok"}
+
+        # The routines of the home can themselves conflict on some days, which only fails this routine
+        try:
+            matrix = timeline.matrix(routine_day)
+        except ConflictError as e:
+            results.append({**routine_result, "status": __conflict_status(e),
+                            "message": f"The routines of the home conflict on this day: {e}"})
+            continue
+
+        try:
+            simulated = matrix.add_routine(routine)
+            delta = simulated.net_power - matrix.net_power
+            routine_result.update(peak_power=float(simulated.net_power.max()), energy_delta=float(delta.sum()) / 60,
+                                  cost_delta=costs.grid_cost(simulated.net_power, routine_day) -
+                                  costs.grid_cost(matrix.net_power, routine_day))
+        except ConflictError as e:
+            routine_result.update(status=__conflict_status(e), message=str(e))
+
+        try:
+            search_result = RoutineOptimizer(
+                matrix, costs, routine_day).find_best_start_time(routine)
+        except (ConflictError, ValueError) as e:
+            search_result = None
+            routine_result.update(message=f"The start time could not be optimized: {e}")
+
+        if search_result is not None:
+            best_start, savings = search_result
+            routine_result.update(best_start=best_start.strftime("%H:%M"), savings=savings)
+
+        results.append(routine_result)
+
+    return results
+
+
+def run_batch(scenarios: Iterable[dict[str, Any]], default_config: str, workers: int = 1) -> Iterator[dict[str, Any]]:
+    """Simulate the scenarios of a batch, yielding the results as soon as they are ready.
+
+    Args:
+        scenarios (Iterable[dict[str, Any]]): The scenarios, read lazily as the processes need more of them.
+        default_config (str): The configuration file of the homes of the scenarios without one.
+        workers (int, optional): The number of simulating processes. Defaults to 1.
+
+    Yields:
+        dict[str, Any]: The result of each candidate routine, with the `RESULT_FIELDS`.
+    """
+    if workers <= 1:
+        for scenario in scenarios:
+            yield from run_scenario(scenario, default_config)
+
+        return
+
+    iterator = iter(scenarios)
+    pending: set[Future] = set()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # Keep a few scenarios queued for each process, without reading the whole batch
+            for scenario in iterator:
+                pending.add(executor.submit(
+                    run_scenario, scenario, default_config))
+                if len(pending) >= workers * 4:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def write_results(results: Iterable[dict[str, Any]], file: IO[str], format: str = "jsonl") -> int:
+    """Write results as they are yielded, flushing each one.
+
+    Args:
+        results (Iterable[dict[str, Any]]): The results.
+        file (IO[str]): The file to write to.
+        format (str, optional): Either "jsonl" or "csv". Defaults to "jsonl".
+
+    Returns:
+        int: The number of written results.
+    """
+    writer = csv.DictWriter(file, RESULT_FIELDS) if format == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+
+    count = 0
+    for result in results:
+        if writer is not None:
+            writer.writerow(result)
+        else:
+            file.write(json.dumps(result) + "\n")
+
+        file.flush()
+        count += 1
+
+    return count
+
+
+def __conflict_status(error: ConflictError) -> str:
+    return "inconsistent" if isinstance(error, InconsistentRoutinesError) else "max_power_exceeded"
+
+
+def __load_home(config_file: str) -> tuple[Timeline, CostsMatrix, ApplianceRegistry]:
+    if config_file not in __homes:
+        config = Config.from_toml(config_file)
+        repository = RepositoryFactory.create(config.database_config)
+        timeline = Timeline(repository.get_appliances(), repository.get_routines(), config.home_config,
+                            repository.get_base_matrix(config.home_config))
+        __homes[config_file] = (timeline, CostsMatrix(config.home_config), repository.get_registry())
+
+    return __homes[config_file]
@@ -0,0 +1,148 @@
+"""Calibration of the power consumption of the operation modes from measured data.
+
+The power drawn by the house in each minute is modelled as the power of the idle modes of the appliances,
+plus, for each appliance that is not idle, the difference between the power of its mode and the power of its idle mode.
+Given the schedule of the modes simulated by the digital twin and the measured load, the differences are fitted
+by least squares, so the power of the idle modes, together with any load that is not modelled, is an intercept.
+
+The normal equations (XᵀX, Xᵀy) of the fit are accumulated one day at a time, so that any number of days
+can be used without keeping them in memory. The fit is regularized towards the current power of the modes,
+so that modes that were seldom observed stay close to their power. Modes that are always on at the same time
+can't be told apart from each other, nor from the intercept, and are only moved as much as the data allows.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from dt.data import Appliance, ApplianceRegistry, OperationMode
+from dt.energy import StateMatrix
+
+
+class Calibrator:
+    """Fits the power consumption of the operation modes of the appliances of a home.
+    """
+
+    def __init__(self, appliances: list[Appliance], regularization: float = 1.0):
+        """Constructor.
+
+        Args:
+            appliances (list[Appliance]): The appliances to calibrate.
+            regularization (float, optional): The weight of the current power of the modes, in minutes of measures.
+            Defaults to 1.0.
+        """
+        self.registry = ApplianceRegistry(appliances)
+        self.regularization = regularization
+
+        # One feature for each mode that is not idle, plus the intercept as the last one
+        self.features: list[tuple[Appliance, OperationMode]] = []
+        self.feature_table = np.full(
+            (len(self.registry), max((len(a.modes) for a in self.registry.appliances), default=0)), -1)
+
+        for column, appliance in enumerate(self.registry.appliances):
+            idle_index = self.registry.idle_mode_index(column)
+            for index, mode in enumerate(appliance.modes):
+                if index != idle_index:
+                    self.feature_table[column, index] = len(self.features)
+                    self.features.append((appliance, mode))
+
+        self.idle_power = np.array([appliance.modes[self.registry.idle_mode_index(column)].power_consumption
+                                    for column, appliance in enumerate(self.registry.appliances)])
+        self.prior = np.array([mode.power_consumption - self.idle_power[self.registry.column(appliance.id)]
+                               for appliance, mode in self.features] + [self.idle_power.sum()])
+
+        size = len(self.features) + 1
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.minutes = 0
+
+    def add_day(self, state_matrix: StateMatrix, measured: np.ndarray) -> None:
+        """Add the measures of a day to the fit.
+        The measures are of the power drawn from the grid, so the generation and the battery
+        simulated by the twin are removed from them.
+
+        Args:
+            state_matrix (StateMatrix): The state matrix of the day, with the same appliances of the calibrator.
+            measured (np.ndarray): The power drawn from the grid in each minute, in watts, NaN where there is no reading.
+        """
+        # The battery power is positive when it charges, see `DispatchResult`
+        load = measured + state_matrix.dispatch.generation - \
+            state_matrix.dispatch.battery_power
+        valid = ~np.isnan(load)
+
+        # The feature of each cell is the fraction of the power of the mode drawn in that minute,
+        # which is always 1 except for modes with a power profile.
+        columns = np.arange(len(self.registry))
+        feature_indices = self.feature_table[columns, state_matrix.matrix][valid]
+        nominal = state_matrix.power_table[columns, state_matrix.matrix][valid]
+        fractions = np.divide(state_matrix.power_matrix[valid], nominal, out=np.ones_like(
+            nominal), where=nominal != 0)
+
+        x = np.zeros((feature_indices.shape[0], len(self.features) + 1))
+        rows, cells = np.nonzero(feature_indices >= 0)
+        x[rows, feature_indices[rows, cells]] = fractions[rows, cells]
+        x[:, -1] = 1
+
+        self.xtx += x.T @ x
+        self.xty += x.T @ load[valid]
+        self.minutes += int(valid.sum())
+
+    def fit(self) -> dict[tuple[int, int], float]:
+        """Fit the power consumption of the modes to the measures added so far.
+
+        Returns:
+            dict[tuple[int, int], float]: The calibrated power consumption of each mode that is not idle
+            and was observed at least once, by appliance and mode ID, in watts.
+        """
+        penalty = self.regularization * np.eye(len(self.prior))
+        solution = np.linalg.lstsq(
+            self.xtx + penalty, self.xty + penalty @ self.prior, rcond=None)[0]
+
+        return {(appliance.id, mode.id): max(float(difference + self.idle_power[self.registry.column(appliance.id)]), 0.0)
+                for (appliance, mode), difference, observed in zip(self.features, solution, np.diag(self.xtx) > 0)
+                if observed}
+
+
+def write_calibrated_appliances(appliances_dir: str, output_dir: str, powers: dict[tuple[int, int], float]) -> list[str]:
+    """Write a copy of the appliances JSON files, with the calibrated power consumption of the modes.
+    The power profiles of the modes are scaled by the same factor as their power consumption.
+
+    Args:
+        appliances_dir (str): The path to the directory containing the appliances JSON files.
+        output_dir (str): The directory to write the files to. It is created if it does not exist.
+        powers (dict[tuple[int, int], float]): The power consumption of the modes, by appliance and mode ID, in watts.
+
+    Returns:
+        list[str]: The paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = []
+
+    for filename in sorted(os.listdir(appliances_dir)):
+        if not filename.endswith(".json"):
+            continue
+
+        with open(os.path.join(appliances_dir, filename), encoding="utf-8") as file:
+            data = json.load(file)
+
+        for mode_data in data["modes"]:
+            power = powers.get((data["id"], mode_data["id"]))
+            if power is None:
+                continue
+
+            if "power_profile" in mode_data and mode_data["power_consumption"]:
+                scale = power / mode_data["power_consumption"]
+                for segment in mode_data["power_profile"]:
+                    segment["power_consumption"] = round(
+                        segment["power_consumption"] * scale, 1)
+
+            mode_data["power_consumption"] = round(power, 1)
+
+        filepath = os.path.join(output_dir, filename)
+        with open(filepath, "w", encoding="utf-8") as file:
+            json.dump(data, file, indent="\t")
+
+        filepaths.append(filepath)
+
+    return filepaths
@@ -3,12 +3,43 @@ import tomllib
 from typing import Any
 
 
+class GenerationConfig:
+    def __init__(self, peak_power: float, sunrise: datetime, sunset: datetime):
+        self.peak_power = peak_power
+        self.sunrise = sunrise
+        self.sunset = sunset
+
+        if self.sunrise >= self.sunset:
+            raise ValueError("Sunrise must be before sunset")
+
+
+class BatteryConfig:
+    def __init__(self, capacity: float, max_charge_power: float, max_discharge_power: float, efficiency: float = 1.0, initial_charge: float = 0.0):
+        self.capacity = capacity
+        self.max_charge_power = max_charge_power
+        self.max_discharge_power = max_discharge_power
+        self.efficiency = efficiency
+        self.initial_charge = initial_charge
+
+        if not 0 < self.efficiency <= 1:
+            raise ValueError("Battery efficiency must be between 0 and 1")
+
+        if not 0 <= self.initial_charge <= 1:
+            raise ValueError("Battery initial charge must be between 0 and 1")
+
+
 class HomeConfig:
-    def __init__(self, max_power: float, energy_rates_number: int, energy_rates_prices: list[float], activity_hours: tuple[datetime, datetime] | None = None):
+    def __init__(self, max_power: float, energy_rates_number: int, energy_rates_prices: list[float], activity_hours: tuple[datetime, datetime] | None = None,
+                 tariff_file: str | None = None, generation: GenerationConfig | None = None, battery: BatteryConfig | None = None,
+                 demand_response: bool = False):
         self.max_power = max_power
         self.energy_rates_number = energy_rates_number
         self.energy_rates_prices = energy_rates_prices
         self.activity_hours = activity_hours
+        self.tariff_file = tariff_file
+        self.generation = generation
+        self.battery = battery
+        self.demand_response = demand_response
 
         if len(self.energy_rates_prices) != self.energy_rates_number:
             raise ValueError(
@@ -16,30 +47,55 @@ class HomeConfig:
 
 
 class DatabaseConfig:
-    def __init__(self, database_type: str, appliances_dir: str, routines_dir: str, test_routines_dir: str):
+    def __init__(self, database_type: str, appliances_dir: str, routines_dir: str, test_routines_dir: str, bundle_file: str | None = None,
+                 sqlite_file: str | None = None, home_id: str | None = None, snapshot_file: str | None = None):
         self.database_type = database_type
         self.appliances_dir = appliances_dir
         self.routines_dir = routines_dir
         self.test_routines_dir = test_routines_dir
+        self.bundle_file = bundle_file
+        self.sqlite_file = sqlite_file
+        self.home_id = home_id
+        self.snapshot_file = snapshot_file
 
 
 class Config:
     def __init__(self, config: dict[str, Any]) -> None:
         activity_hours = config["home"]["activity_hours"] if "activity_hours" in config["home"] else None
+        generation = config["home"].get("generation")
+        battery = config["home"].get("battery")
 
         self.home_config = HomeConfig(
             config["home"]["max_power"] * 1000,
             config["home"]["energy_rates_number"],
             [x / 1000 for x in config["home"]["energy_rates_prices"]],
             (datetime.strptime(activity_hours[0], "%H:%M"), datetime.strptime(
-                activity_hours[1], "%H:%M")) if activity_hours is not None else None
+                activity_hours[1], "%H:%M")) if activity_hours is not None else None,
+            config["home"].get("tariff_file"),
+            GenerationConfig(
+                generation["peak_power"] * 1000,
+                datetime.strptime(generation["sunrise"], "%H:%M"),
+                datetime.strptime(generation["sunset"], "%H:%M")
+            ) if generation is not None else None,
+            BatteryConfig(
+                battery["capacity"] * 1000,
+                battery["max_charge_power"] * 1000,
+                battery["max_discharge_power"] * 1000,
+                battery.get("efficiency", 1.0),
+                battery.get("initial_charge", 0.0)
+            ) if battery is not None else None,
+            config["home"].get("demand_response", False)
         )
 
         self.database_config = DatabaseConfig(
             config["database"]["type"],
             config["database"]["appliances_dir"],
             config["database"]["routines_dir"],
-            config["database"]["test_routines_dir"])
+            config["database"]["test_routines_dir"],
+            config["database"].get("bundle_file"),
+            config["database"].get("sqlite_file"),
+            config["database"].get("home_id"),
+            config["database"].get("snapshot_file"))
 
     @staticmethod
     def from_toml(config_path: str):
@@ -0,0 +1,201 @@
+"""Asynchronous access to the data of the digital twin.
+
+The repositories are synchronous, as reading files or querying SQLite is blocking.
+Calling them directly from async code, e.g. the API handlers, blocks the event loop
+for the whole duration of the call. This module wraps a repository so that its methods
+are run on a bounded pool of worker threads, and provides a request-scoped loader
+that collects the appliance lookups made during a request into a single bulk fetch.
+"""
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable, TypeVar
+
+from .data_repository import DataRepository
+from .models import Appliance, Routine
+
+T = TypeVar("T")
+
+
+class AsyncDataRepository:
+    """Asynchronous wrapper of a data repository.
+
+    The calls are run on a pool of worker threads, so the number of concurrent
+    calls to the underlying repository is bounded by the size of the pool.
+    The repository must be safe to use from multiple threads.
+    """
+
+    def __init__(self, repository: DataRepository, max_workers: int = 4):
+        """Constructor.
+
+        Args:
+            repository (DataRepository): The synchronous repository.
+            max_workers (int, optional): The number of worker threads. Defaults to 4.
+        """
+        self.repository = repository
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dt-repository")
+
+    async def aget_appliance(self, appliance_id: int) -> Appliance | None:
+        """Get an appliance by its ID.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            Appliance | None: The appliance, or None if not found.
+        """
+        return await self.__run(self.repository.get_appliance, appliance_id)
+
+    async def aget_appliances(self) -> list[Appliance]:
+        """Get the list of appliances.
+
+        Returns:
+            list[Appliance]: The list of appliances.
+        """
+        return await self.__run(self.repository.get_appliances)
+
+    async def aget_appliances_by_ids(self, appliance_ids: Iterable[int]) -> dict[int, Appliance]:
+        """Get many appliances by their IDs with a single fetch.
+
+        Args:
+            appliance_ids (Iterable[int]): The IDs of the appliances.
+
+        Returns:
+            dict[int, Appliance]: The appliances found, by ID. Missing IDs are not included.
+        """
+        return await self.__run(self.repository.get_appliances_by_ids, list(appliance_ids))
+
+    async def aget_routine(self, routine_id: int) -> Routine | None:
+        """Get a routine by its ID.
+
+        Args:
+            routine_id (int): The ID of the routine.
+
+        Returns:
+            Routine | None: The routine, or None if not found.
+        """
+        return await self.__run(self.repository.get_routine, routine_id)
+
+    async def aget_routines(self) -> list[Routine]:
+        """Get the list of routines.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return await self.__run(self.repository.get_routines)
+
+    async def aget_routines_with_appliance(self, appliance_id: int) -> list[Routine]:
+        """Get the routines with at least an action on the given appliance.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return await self.__run(self.repository.get_routines_with_appliance, appliance_id)
+
+    async def aget_test_routines(self) -> list[Routine]:
+        """Get the list of test routines.
+
+        Returns:
+            list[Routine]: The list of test routines.
+        """
+        return await self.__run(self.repository.get_test_routines)
+
+    def loader(self) -> ApplianceLoader:
+        """Create a loader for the appliances, to be used for the duration of a single request.
+
+        Returns:
+            ApplianceLoader: The loader.
+        """
+        return ApplianceLoader(self)
+
+    def close(self) -> None:
+        """Shut down the worker threads, waiting for the pending calls to complete.
+        """
+        self.__executor.shutdown()
+
+    async def __run(self, function: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, partial(function, *args))
+
+
+class ApplianceLoader:
+    """Request-scoped loader of appliances.
+
+    The appliances requested in the same iteration of the event loop, e.g. by
+    coroutines gathered together, are fetched with a single bulk call to the repository.
+    The results are cached for the lifetime of the loader, so it should not outlive the request.
+    """
+
+    def __init__(self, repository: AsyncDataRepository):
+        """Constructor.
+
+        Args:
+            repository (AsyncDataRepository): The repository to fetch the appliances from.
+        """
+        self.repository = repository
+        self.__cache: dict[int, asyncio.Future[Appliance | None]] = {}
+        self.__pending: list[int] = []
+        self.__tasks: set[asyncio.Task] = set()
+
+    async def load(self, appliance_id: int) -> Appliance | None:
+        """Load an appliance by its ID.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            Appliance | None: The appliance, or None if not found.
+        """
+        return (await self.load_many([appliance_id]))[appliance_id]
+
+    async def load_many(self, appliance_ids: Iterable[int]) -> dict[int, Appliance | None]:
+        """Load many appliances by their IDs.
+
+        Args:
+            appliance_ids (Iterable[int]): The IDs of the appliances.
+
+        Returns:
+            dict[int, Appliance | None]: The appliances by ID, None if not found.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+
+        for appliance_id in appliance_ids:
+            if appliance_id not in self.__cache:
+                self.__cache[appliance_id] = loop.create_future()
+
+                # Schedule the fetch when the first ID of a new batch is requested,
+                # so that it runs after the other coroutines had the chance to add theirs.
+                if not self.__pending:
+                    loop.call_soon(self.__start_dispatch)
+                self.__pending.append(appliance_id)
+
+            futures[appliance_id] = self.__cache[appliance_id]
+
+        return {appliance_id: await future for appliance_id, future in futures.items()}
+
+    def __start_dispatch(self) -> None:
+        # Keep a reference to the task, otherwise it could be garbage collected
+        task = asyncio.ensure_future(self.__dispatch())
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __dispatch(self) -> None:
+        appliance_ids, self.__pending = self.__pending, []
+
+        try:
+            appliances = await self.repository.aget_appliances_by_ids(appliance_ids)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            for appliance_id in appliance_ids:
+                self.__cache.pop(appliance_id).set_exception(e)
+            return
+
+        for appliance_id in appliance_ids:
+            self.__cache[appliance_id].set_result(
+                appliances.get(appliance_id))
@@ -1,17 +1,23 @@
 """Repositories for the data of the digital twin.
 
 This module provides an abstract repository for the data of the digital twin,
-along with concrete implementations. Currently only a JSON repository is available,
-which reads the data from JSON files. It also provides low-level functions to read data from JSON files.
+along with concrete implementations. A JSON repository reads the data from one JSON file per entity,
+while a JSON Lines repository reads all the data of a home from a single file.
+It also provides low-level functions to read data from JSON files.
 """
 
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import date, datetime
 import json
 import os
+from typing import TYPE_CHECKING, Iterable
 
-from dt.config import DatabaseConfig
-from .models import Appliance, OperationMode, Routine, RoutineAction
+from dt.config import DatabaseConfig, HomeConfig
+from .models import Appliance, OperationMode, Recurrence, Routine, RoutineAction
+from .registry import ApplianceRegistry
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 class DataRepository(ABC):
@@ -20,6 +26,13 @@ class DataRepository(ABC):
     Only `get` methods are defined because the app is not meant to create or modify data.
     """
 
+    def __init__(self):
+        """Constructor.
+        """
+        # The registry is stored with the version of the data it was built from, as a single tuple
+        # so that concurrent readers never see one without the other
+        self.__registry: tuple[object, ApplianceRegistry] | None = None
+
     def get_appliance(self, appliance_id: int) -> Appliance | None:
         """Get an appliance by its ID.
 
@@ -29,7 +42,7 @@ class DataRepository(ABC):
         Returns:
             Appliance | None: The appliance, or None if not found.
         """
-        return next((appliance for appliance in self.get_appliances() if appliance.id == appliance_id), None)
+        return self.get_registry().get(appliance_id)
 
     @abstractmethod
     def get_appliances(self) -> list[Appliance]:
@@ -39,6 +52,44 @@ class DataRepository(ABC):
             list[Appliance]: The list of appliances.
         """
 
+    def get_appliances_by_ids(self, appliance_ids: Iterable[int]) -> dict[int, Appliance]:
+        """Get many appliances by their IDs with a single fetch.
+
+        Args:
+            appliance_ids (Iterable[int]): The IDs of the appliances.
+
+        Returns:
+            dict[int, Appliance]: The appliances found, by ID. Missing IDs are not included.
+        """
+        registry = self.get_registry()
+        return {appliance_id: appliance for appliance_id in set(appliance_ids)
+                if (appliance := registry.get(appliance_id)) is not None}
+
+    def get_registry(self) -> ApplianceRegistry:
+        """Get the registry of the appliances, for lookups by ID.
+        The registry is built once, and built again only when the data is written, see `data_version`.
+
+        Returns:
+            ApplianceRegistry: The registry.
+        """
+        version = self.data_version()
+        cached = self.__registry
+
+        if cached is None or cached[0] != version:
+            cached = self.__registry = (
+                version, ApplianceRegistry(self.get_appliances()))
+
+        return cached[1]
+
+    def data_version(self) -> object:
+        """Get a value that changes whenever the data of the repository is written.
+        The data of the default implementation is never written after being read.
+
+        Returns:
+            object: The version of the data, comparable for equality.
+        """
+        return None
+
     def get_routine(self, routine_id: int) -> Routine | None:
         """Get a routine by its ID.
 
@@ -58,6 +109,19 @@ class DataRepository(ABC):
             list[Routine]: The list of routines.
         """
 
+    def get_routines_with_appliance(self, appliance_id: int) -> list[Routine]:
+        """Get the routines with at least an action on the given appliance.
+        Useful to find the routines that could conflict with an action on that appliance.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return [routine for routine in self.get_routines()
+                if any(action.appliance.id == appliance_id for action in routine.actions)]
+
     @abstractmethod
     def get_test_routines(self) -> list[Routine]:
         """Get the list of test routines.
@@ -66,9 +130,24 @@ class DataRepository(ABC):
             list[Routine]: The list of test routines.
         """
 
+    def get_base_matrix(self, config: HomeConfig) -> "np.ndarray | None":
+        """Get a precompiled base state matrix, if the repository provides one.
+        This allows skipping the simulation of the routines at startup.
+
+        Args:
+            config (HomeConfig): The configuration of the home the matrix must be valid for.
+
+        Returns:
+            np.ndarray | None: The matrix, or None if not available.
+        """
+        return None
+
 
 class JSONRepository(DataRepository):
     """Repository for the data of the digital twin, stored in JSON files.
+    The files are read on first access, and the models are then kept in memory,
+    so that the same instances are returned by every call.
+    The files are read again when they change, i.e. when a file of the directories is added, removed or modified.
     """
 
     def __init__(self, appliances_dir: str, routines_dir: str, test_routines_dir: str):
@@ -79,9 +158,12 @@ class JSONRepository(DataRepository):
             routines_dir (str): The path to the directory containing the routines JSON files.
             test_routines_dir (str): The path to the directory containing the test routines JSON files.
         """
+        super().__init__()
         self.appliances_dir = appliances_dir
         self.routines_dir = routines_dir
         self.test_routines_dir = test_routines_dir
+        # The models read from the files, with the version of the files they were read from
+        self.__models: tuple[object, dict[str, list]] = (None, {})
 
     def get_appliances(self) -> list[Appliance]:
         """Get the list of appliances.
@@ -89,7 +171,11 @@ class JSONRepository(DataRepository):
         Returns:
             list[Appliance]: The list of appliances.
         """
-        return read_appliances_json(self.appliances_dir)
+        models = self.__current_models()
+        if "appliances" not in models:
+            models["appliances"] = read_appliances_json(self.appliances_dir)
+
+        return models["appliances"]
 
     def get_routines(self) -> list[Routine]:
         """Get the list of routines.
@@ -97,9 +183,12 @@ class JSONRepository(DataRepository):
         Returns:
             list[Routine]: The list of routines.
         """
-        appliances = self.get_appliances()
-        routines = read_routines_json(self.routines_dir, appliances)
-        return routines
+        models = self.__current_models()
+        if "routines" not in models:
+            models["routines"] = read_routines_json(
+                self.routines_dir, self.get_appliances())
+
+        return models["routines"]
 
     def get_test_routines(self) -> list[Routine]:
         """Get the list of test routines.
@@ -107,42 +196,137 @@ class JSONRepository(DataRepository):
         Returns:
             list[Routine]: The list of test routines.
         """
-        appliances = self.get_appliances()
-        test_routines = read_routines_json(
-            self.test_routines_dir, appliances)
-        return test_routines
+        models = self.__current_models()
+        if "test_routines" not in models:
+            models["test_routines"] = read_routines_json(
+                self.test_routines_dir, self.get_appliances())
 
+        return models["test_routines"]
 
-def read_appliance_json(filepath: str) -> Appliance:
-    """Read an appliance from a JSON file.
+    def data_version(self) -> object:
+        """Get a value that changes whenever the JSON files are written.
+        The names, the sizes and the modification times of the files of the directories are used.
+
+        Returns:
+            object: The version of the data, comparable for equality.
+        """
+        return tuple(self.__directory_version(directory)
+                     for directory in (self.appliances_dir, self.routines_dir, self.test_routines_dir))
+
+    def __current_models(self) -> dict[str, list]:
+        # The models of the current version of the files, dropping the ones read from a previous version
+        version = self.data_version()
+        cached_version, models = self.__models
+
+        if cached_version is None or cached_version != version:
+            models = {}
+            self.__models = (version, models)
+
+        return models
+
+    def __directory_version(self, directory: str) -> frozenset[tuple[str, int, int]]:
+        try:
+            with os.scandir(directory) as entries:
+                return frozenset((entry.name, (stat := entry.stat()).st_mtime_ns, stat.st_size)
+                                 for entry in entries if entry.name.endswith(".json"))
+        except FileNotFoundError:
+            return frozenset()
+
+
+class JSONLinesRepository(DataRepository):
+    """Repository for the data of the digital twin, stored in a single JSON Lines file.
+
+    Each line of the file is a JSON object with the same fields of the per-file JSON layout,
+    plus a `type` field that is either "appliance", "routine" or "test_routine".
+    The file is read with a single sequential read on first access, and then kept in memory.
+    Use `convert_json_to_jsonl` to create the file from the per-file JSON layout.
+    """
+
+    def __init__(self, bundle_file: str):
+        """Constructor.
+
+        Args:
+            bundle_file (str): The path to the JSON Lines file.
+        """
+        super().__init__()
+        self.bundle_file = bundle_file
+        self.__data: tuple[list[Appliance],
+                           list[Routine], list[Routine]] | None = None
+
+    def get_appliances(self) -> list[Appliance]:
+        """Get the list of appliances.
+
+        Returns:
+            list[Appliance]: The list of appliances.
+        """
+        return self.__load()[0]
+
+    def get_routines(self) -> list[Routine]:
+        """Get the list of routines.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return self.__load()[1]
+
+    def get_test_routines(self) -> list[Routine]:
+        """Get the list of test routines.
+
+        Returns:
+            list[Routine]: The list of test routines.
+        """
+        return self.__load()[2]
+
+    def __load(self) -> tuple[list[Appliance], list[Routine], list[Routine]]:
+        if self.__data is None:
+            self.__data = read_jsonl(self.bundle_file)
+
+        return self.__data
+
+
+def parse_appliance(data: dict) -> Appliance:
+    """Create an appliance from its JSON representation.
 
     Args:
-        filepath (str): The path to the JSON file.
+        data (dict): The decoded JSON object.
 
     Returns:
         Appliance: The appliance.
     """
-    with open(filepath, encoding="utf-8") as file:
-        data = json.load(file)
+    appliance_id = data["id"]
+    device = data["device"]
+    manufacturer = data["manufacturer"]
+    model = data["model"]
+    location = data["location"]
+    modes = []
+
+    for mode_data in data["modes"]:
+        mode_id = mode_data["id"]
+        mode_name = mode_data["name"]
+        power_consumption = mode_data["power_consumption"]
+        default_duration = mode_data["default_duration"] // 60 if "default_duration" in mode_data else None
+        power_profile = [(segment["duration"] // 60, segment["power_consumption"])
+                         for segment in mode_data["power_profile"]] if "power_profile" in mode_data else None
+
+        mode = OperationMode(
+            mode_id, mode_name, power_consumption, default_duration, power_profile)
+        modes.append(mode)
 
-        appliance_id = data["id"]
-        device = data["device"]
-        manufacturer = data["manufacturer"]
-        model = data["model"]
-        location = data["location"]
-        modes = []
+    return Appliance(appliance_id, device, manufacturer, model, location, modes,
+                     data.get("priority", 0), data.get("interruptible", False))
 
-        for mode_data in data["modes"]:
-            mode_id = mode_data["id"]
-            mode_name = mode_data["name"]
-            power_consumption = mode_data["power_consumption"]
-            default_duration = mode_data["default_duration"] // 60 if "default_duration" in mode_data else None
 
-            mode = OperationMode(
-                mode_id, mode_name, power_consumption, default_duration)
-            modes.append(mode)
+def read_appliance_json(filepath: str) -> Appliance:
+    """Read an appliance from a JSON file.
+
+    Args:
+        filepath (str): The path to the JSON file.
 
-        return Appliance(appliance_id, device, manufacturer, model, location, modes)
+    Returns:
+        Appliance: The appliance.
+    """
+    with open(filepath, encoding="utf-8") as file:
+        return parse_appliance(json.load(file))
 
 
 def read_appliances_json(dir_path: str) -> list[Appliance]:
@@ -165,45 +349,124 @@ def read_appliances_json(dir_path: str) -> list[Appliance]:
     return appliances
 
 
-def read_routine_json(filepath: str, appliances: list[Appliance]) -> Routine:
-    """Read a routine from a JSON file.
+WEEKDAY_NAMES = ("monday", "tuesday", "wednesday",
+                 "thursday", "friday", "saturday", "sunday")
+
+
+def parse_recurrence(data: dict) -> Recurrence:
+    """Create a recurrence from its JSON representation, e.g.
+    `{"weekdays": ["saturday", "sunday"], "every_n_days": 1, "start_date": "2024-01-01", "end_date": "2024-12-31"}`.
+    Every field is optional.
 
     Args:
-        filepath (str): The path to the JSON file.
-        appliances (list[Appliance]): The list of appliances.
+        data (dict): The decoded JSON object.
+
+    Raises:
+        ValueError: A weekday is unknown, or the rules are invalid.
+
+    Returns:
+        Recurrence: The recurrence.
+    """
+    weekdays = None
+    if "weekdays" in data:
+        try:
+            weekdays = frozenset(WEEKDAY_NAMES.index(name.lower())
+                                 for name in data["weekdays"])
+        except ValueError:
+            raise ValueError(
+                f"Unknown weekday in {data['weekdays']}, expected one of {', '.join(WEEKDAY_NAMES)}") from None
+
+    start_date = date.fromisoformat(
+        data["start_date"]) if "start_date" in data else None
+    end_date = date.fromisoformat(
+        data["end_date"]) if "end_date" in data else None
+
+    return Recurrence(weekdays, data.get("every_n_days", 1), start_date, end_date)
+
+
+def serialize_recurrence(recurrence: Recurrence) -> dict:
+    """Convert a recurrence to its JSON representation, the inverse of `parse_recurrence`.
+
+    Args:
+        recurrence (Recurrence): The recurrence.
+
+    Returns:
+        dict: The JSON object, without the fields that are not set.
+    """
+    data: dict = {}
+
+    if recurrence.weekdays is not None:
+        data["weekdays"] = [WEEKDAY_NAMES[weekday]
+                            for weekday in sorted(recurrence.weekdays)]
+    if recurrence.every_n_days != 1:
+        data["every_n_days"] = recurrence.every_n_days
+    if recurrence.start_date is not None:
+        data["start_date"] = recurrence.start_date.isoformat()
+    if recurrence.end_date is not None:
+        data["end_date"] = recurrence.end_date.isoformat()
+
+    return data
+
+
+def parse_routine(data: dict, registry: ApplianceRegistry) -> Routine:
+    """Create a routine from its JSON representation.
+
+    Args:
+        data (dict): The decoded JSON object.
+        registry (ApplianceRegistry): The registry of the appliances.
+
+    Raises:
+        ValueError: An action refers to an appliance or a mode that does not exist.
 
     Returns:
         Routine: The routine.
     """
+    routine_id = data["id"]
+    name = data["name"]
+    enabled = data["enabled"]
+    when = data["when"]
+    when = datetime.strptime(when, "%H:%M")
 
-    with open(filepath, encoding="utf-8") as file:
-        data = json.load(file)
+    actions = []
+
+    for action_data in data["actions"]:
+        action_id = action_data["id"]
+        action_appliance_id = action_data["appliance_id"]
+        action_mode_id = action_data["mode_id"]
+        action_duration = action_data["duration"] // 60 if "duration" in action_data else None
+
+        appliance = registry.get(action_appliance_id)
+        mode = registry.get_mode(action_appliance_id, action_mode_id)
+        if appliance is None or mode is None:
+            raise ValueError(
+                f"Routine {routine_id} refers to an unknown appliance or mode")
 
-        routine_id = data["id"]
-        name = data["name"]
-        enabled = data["enabled"]
-        when = data["when"]
-        when = datetime.strptime(when, "%H:%M")
+        duration = action_duration if action_duration else mode.default_duration
 
-        actions = []
+        action = RoutineAction(action_id, appliance, mode, duration)
+        actions.append(action)
 
-        for action_data in data["actions"]:
-            action_id = action_data["id"]
-            action_appliance_id = action_data["appliance_id"]
-            action_mode_id = action_data["mode_id"]
-            action_duration = action_data["duration"] // 60 if "duration" in action_data else None
+    recurrence = parse_recurrence(
+        data["recurrence"]) if data.get("recurrence") is not None else None
 
-            appliance = next(a for a in appliances if a.id ==
-                             action_appliance_id)
-            mode = next(m for m in appliance.modes if m.id == action_mode_id)
-            duration = action_duration if action_duration else mode.default_duration
+    routine = Routine(routine_id, name, when, actions, enabled, recurrence)
 
-            action = RoutineAction(action_id, appliance, mode, duration)
-            actions.append(action)
+    return routine
 
-        routine = Routine(routine_id, name, when, actions, enabled)
 
-        return routine
+def read_routine_json(filepath: str, registry: ApplianceRegistry) -> Routine:
+    """Read a routine from a JSON file.
+
+    Args:
+        filepath (str): The path to the JSON file.
+        registry (ApplianceRegistry): The registry of the appliances.
+
+    Returns:
+        Routine: The routine.
+    """
+
+    with open(filepath, encoding="utf-8") as file:
+        return parse_routine(json.load(file), registry)
 
 
 def read_routines_json(dir_path: str, appliances: list[Appliance]) -> list[Routine]:
@@ -218,17 +481,89 @@ def read_routines_json(dir_path: str, appliances: list[Appliance]) -> list[Routi
     """
 
     routines = []
+    registry = ApplianceRegistry(appliances)
 
     for filename in os.listdir(dir_path):
         routine = read_routine_json(
-            os.path.join(dir_path, filename), appliances)
+            os.path.join(dir_path, filename), registry)
         routines.append(routine)
 
     return routines
 
 
+def read_jsonl(filepath: str) -> tuple[list[Appliance], list[Routine], list[Routine]]:
+    """Read the appliances, routines and test routines from a JSON Lines file.
+
+    Args:
+        filepath (str): The path to the JSON Lines file.
+
+    Raises:
+        ValueError: A line has an unknown type.
+
+    Returns:
+        tuple[list[Appliance], list[Routine], list[Routine]]: The appliances, the routines and the test routines.
+    """
+
+    # Read the whole file at once, as a sequential read is much faster
+    # than many small ones on network filesystems.
+    with open(filepath, encoding="utf-8") as file:
+        lines = file.read().splitlines()
+
+    appliances_data = []
+    routines_data = []
+    test_routines_data = []
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        data = json.loads(line)
+        data_type = data.pop("type")
+
+        if data_type == "appliance":
+            appliances_data.append(data)
+        elif data_type == "routine":
+            routines_data.append(data)
+        elif data_type == "test_routine":
+            test_routines_data.append(data)
+        else:
+            raise ValueError(f"Unknown type \"{data_type}\" in {filepath}")
+
+    # Routines can only be parsed after all the appliances are known
+    appliances = [parse_appliance(data) for data in appliances_data]
+    registry = ApplianceRegistry(appliances)
+    routines = [parse_routine(data, registry) for data in routines_data]
+    test_routines = [parse_routine(data, registry)
+                     for data in test_routines_data]
+
+    return appliances, routines, test_routines
+
+
+def convert_json_to_jsonl(appliances_dir: str, routines_dir: str, test_routines_dir: str, filepath: str) -> None:
+    """Convert the per-file JSON layout into a single JSON Lines file.
+    The JSON objects are copied as they are, so the two layouts contain exactly the same data.
+
+    Args:
+        appliances_dir (str): The path to the directory containing the appliances JSON files.
+        routines_dir (str): The path to the directory containing the routines JSON files.
+        test_routines_dir (str): The path to the directory containing the test routines JSON files.
+        filepath (str): The path of the JSON Lines file to write.
+    """
+
+    with open(filepath, "w", encoding="utf-8") as output:
+        for data_type, dir_path in [("appliance", appliances_dir), ("routine", routines_dir), ("test_routine", test_routines_dir)]:
+            for filename in sorted(os.listdir(dir_path)):
+                if not filename.endswith(".json"):
+                    continue
+
+                with open(os.path.join(dir_path, filename), encoding="utf-8") as file:
+                    data = json.load(file)
+
+                output.write(json.dumps({"type": data_type, **data}) + "\n")
+
+
 class RepositoryFactory:
-    """Factory for the data repository. Only supports JSON for now.
+    """Factory for the data repository. Supports JSON files, JSON Lines files, SQLite databases and precompiled snapshots.
     """
 
     @staticmethod
@@ -241,8 +576,29 @@ class RepositoryFactory:
         Returns:
             DataRepository: The data repository.
         """
-        if config.database_type != "json":
-            raise ValueError("Database type not supported")
+        if config.database_type == "json":
+            return JSONRepository(
+                config.appliances_dir, config.routines_dir, config.test_routines_dir)
+
+        if config.database_type == "jsonl":
+            if config.bundle_file is None:
+                raise ValueError("Bundle file not set")
+
+            return JSONLinesRepository(config.bundle_file)
+
+        if config.database_type == "sqlite":
+            if config.sqlite_file is None or config.home_id is None:
+                raise ValueError("SQLite file or home ID not set")
+
+            from .sqlite_repository import SQLiteRepository
+            return SQLiteRepository(config.sqlite_file, config.home_id)
+
+        if config.database_type == "snapshot":
+            if config.snapshot_file is None:
+                raise ValueError("Snapshot file not set")
+
+            # Imported here to avoid loading numpy when it's not needed
+            from .snapshot import SnapshotRepository
+            return SnapshotRepository(config.snapshot_file)
 
-        return JSONRepository(
-            config.appliances_dir, config.routines_dir, config.test_routines_dir)
+        raise ValueError("Database type not supported")
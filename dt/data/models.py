@@ -6,10 +6,19 @@ They are meant to be independent from the data layer implementation, e.g. JSON f
 All IDs are integers, and they should be unique for each entity type (appliance, operation mode, routine, etc.).
 Integers were chosen as they are more efficient in memory, easy to assign as they can be incremented,
 easy to compare, and they allow more than enough IDs for the scope of this project.
+
+The models use `__slots__` to reduce their memory footprint, as a fleet of homes can contain millions of them.
+Operation modes are immutable and interned, so that equal modes, e.g. the "off" modes, are shared by all appliances.
+Appliances are compared and hashed by ID, so they can be used as dictionary keys.
+Routines are not modified once created: a routine at another time is a copy sharing the same actions,
+and lists of routines are extended by creating new versions that share the previous ones.
 """
 
 from __future__ import annotations
-from datetime import datetime, timedelta
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta
+from typing import Any, Iterable, Iterator, overload
+import weakref
 
 
 class OperationMode:
@@ -21,13 +30,73 @@ class OperationMode:
         power_consumption (float): The power consumption of the operation mode, in watts.
         default_duration (int | None): The default duration of the operation mode, in minutes.
         If None, the duration is unlimited by default.
+        power_profile (tuple[tuple[int, float], ...] | None): How the power consumption varies while the mode runs,
+        as a sequence of (duration in minutes, power consumption in watts) segments starting when the mode is set.
+        After the last segment, the power consumption is `power_consumption`.
+        If None, the power consumption is always `power_consumption`.
     """
 
-    def __init__(self, id: int, name: str, power_consumption: float, default_duration: int | None = None):
-        self.id = id
-        self.name = name
-        self.power_consumption = power_consumption
-        self.default_duration = default_duration
+    __slots__ = ("id", "name", "power_consumption",
+                 "default_duration", "power_profile", "__weakref__")
+
+    # Modes are only kept alive by the appliances using them
+    __instances: weakref.WeakValueDictionary[tuple,
+                                             OperationMode] = weakref.WeakValueDictionary()
+
+    id: int
+    name: str
+    power_consumption: float
+    default_duration: int | None
+    power_profile: tuple[tuple[int, float], ...] | None
+
+    def __new__(cls, id: int, name: str, power_consumption: float, default_duration: int | None = None,
+                power_profile: list[tuple[int, float]] | tuple[tuple[int, float], ...] | None = None):
+        if power_profile is not None:
+            power_profile = tuple((duration, power)
+                                  for duration, power in power_profile)
+
+        key = (id, name, power_consumption, default_duration, power_profile)
+        mode = cls.__instances.get(key)
+
+        if mode is None:
+            mode = super().__new__(cls)
+            for attribute, value in zip(cls.__slots__, key):
+                object.__setattr__(mode, attribute, value)
+            mode = cls.__instances.setdefault(key, mode)
+
+        return mode
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("Operation modes are immutable, as they are shared")
+
+    def power_at(self, minute: int) -> float:
+        """Get the power consumption of the mode at a given minute since it was set.
+
+        Args:
+            minute (int): The number of minutes since the mode was set.
+
+        Returns:
+            float: The power consumption, in watts.
+        """
+        for duration, power in self.power_profile or ():
+            if minute < duration:
+                return power
+            minute -= duration
+
+        return self.power_consumption
+
+    def __key(self) -> tuple:
+        return (self.id, self.name, self.power_consumption, self.default_duration, self.power_profile)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, OperationMode) and self.__key() == other.__key()
+
+    def __hash__(self) -> int:
+        return hash(self.__key())
+
+    def __reduce__(self):
+        # Go through the constructor when unpickling, so that modes are interned
+        return (OperationMode, self.__key())
 
 
 class Appliance:
@@ -41,15 +110,26 @@ class Appliance:
         location (str): The location of the appliance (e.g. kitchen, bedroom, etc.)
         modes (list[OperationMode]): The operation modes of the appliance.
         An "off" mode is required, and it's a good practice to have it as the first one in the list.
+        priority (int): The priority of the appliance in demand response. Appliances with lower priorities are
+        delayed first when the house would exceed its maximum power.
+        interruptible (bool): Whether the appliance can be paused and resumed in demand response,
+        otherwise it can only be delayed before it starts.
     """
 
-    def __init__(self, id: int, device: str, manufacturer: str, model: str, location: str, modes: list[OperationMode]):
+    __slots__ = ("id", "device", "manufacturer",
+                 "model", "location", "modes", "priority", "interruptible", "__modes_by_id")
+
+    def __init__(self, id: int, device: str, manufacturer: str, model: str, location: str, modes: list[OperationMode],
+                 priority: int = 0, interruptible: bool = False):
         self.id = id
         self.device = device
         self.manufacturer = manufacturer
         self.model = model
         self.location = location
         self.modes = modes
+        self.priority = priority
+        self.interruptible = interruptible
+        self.__modes_by_id = {mode.id: mode for mode in modes}
 
     def get_mode(self, mode_id: int) -> OperationMode | None:
         """Get an operation mode of the appliance by ID.
@@ -60,7 +140,13 @@ class Appliance:
         Returns:
             OperationMode | None: The operation mode if found, None otherwise.
         """
-        return next((mode for mode in self.modes if mode.id == mode_id), None)
+        return self.__modes_by_id.get(mode_id)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Appliance) and self.id == other.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
 
 
 class RoutineAction:
@@ -76,6 +162,8 @@ class RoutineAction:
         and an explicit action to change the mode of the appliance is required.
     """
 
+    __slots__ = ("id", "appliance", "mode", "duration")
+
     def __init__(self, id: int, appliance: Appliance, mode: OperationMode, duration: int | None = None):
         self.id = id
         self.appliance = appliance
@@ -94,6 +182,77 @@ class RoutineAction:
         return self.appliance == other.appliance and self.mode != other.mode
 
 
+class Recurrence:
+    """The days on which a routine is executed. A day must satisfy every rule.
+
+    Attributes:
+        weekdays (frozenset[int] | None): The days of the week, from 0 (Monday) to 6 (Sunday). If None, every day of the week.
+        every_n_days (int): The interval between the days, counted from the start date,
+        or from the first day of the proleptic Gregorian calendar if there is none.
+        start_date (date | None): The first day, included. If None, there is no first day.
+        end_date (date | None): The last day, included. If None, there is no last day.
+    """
+
+    __slots__ = ("weekdays", "every_n_days", "start_date", "end_date")
+
+    def __init__(self, weekdays: frozenset[int] | None = None, every_n_days: int = 1,
+                 start_date: date | None = None, end_date: date | None = None):
+        if weekdays is not None and not weekdays <= set(range(7)):
+            raise ValueError("Weekdays must be between 0 (Monday) and 6 (Sunday)")
+
+        if every_n_days < 1:
+            raise ValueError("The interval between the days must be at least 1")
+
+        self.weekdays = weekdays
+        self.every_n_days = every_n_days
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def occurs_on(self, day: date) -> bool:
+        """Check if a day satisfies the rules.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            bool: True if the routine is executed on the day, False otherwise.
+        """
+        if self.start_date is not None and day < self.start_date:
+            return False
+
+        if self.end_date is not None and day > self.end_date:
+            return False
+
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+
+        origin = self.start_date.toordinal() if self.start_date is not None else 1
+        return (day.toordinal() - origin) % self.every_n_days == 0
+
+    def next_occurrence(self, day: date) -> date | None:
+        """Find the first day satisfying the rules, from a given day.
+
+        Args:
+            day (date): The day to start from, included.
+
+        Returns:
+            date | None: The day, or None if the rules are never satisfied again.
+        """
+        if self.start_date is not None and day < self.start_date:
+            day = self.start_date
+
+        # The weekdays and the interval repeat every 7 intervals at most
+        for offset in range(7 * self.every_n_days):
+            candidate = day + timedelta(days=offset)
+            if self.end_date is not None and candidate > self.end_date:
+                return None
+
+            if self.occurs_on(candidate):
+                return candidate
+
+        return None
+
+
 class Routine:
     """A routine.
 
@@ -103,14 +262,44 @@ class Routine:
         when (datetime): The date and time when the routine should be executed.
         actions (list[RoutineAction]): The actions of the routine.
         enabled (bool): Whether the routine is enabled. If False, the routine is not executed.
+        recurrence (Recurrence | None): The days on which the routine is executed. If None, every day.
     """
 
-    def __init__(self, id: int, name: str, when: datetime, actions: list[RoutineAction], enabled: bool = True):
+    __slots__ = ("id", "name", "enabled", "when", "actions", "recurrence")
+
+    def __init__(self, id: int, name: str, when: datetime, actions: list[RoutineAction], enabled: bool = True,
+                 recurrence: Recurrence | None = None):
         self.id = id
         self.name = name
         self.enabled = enabled
         self.when = when
         self.actions = actions
+        self.recurrence = recurrence
+
+    def occurs_on(self, day: date) -> bool:
+        """Check if the routine is executed on a day.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            bool: True if the routine is enabled and its recurrence includes the day, False otherwise.
+        """
+        return self.enabled and (self.recurrence is None or self.recurrence.occurs_on(day))
+
+    def next_occurrence(self, day: date) -> date | None:
+        """Find the first day on which the routine is executed, from a given day.
+
+        Args:
+            day (date): The day to start from, included.
+
+        Returns:
+            date | None: The day, or None if the routine is disabled or never executed again.
+        """
+        if not self.enabled:
+            return None
+
+        return day if self.recurrence is None else self.recurrence.next_occurrence(day)
 
     def conflicting_actions(self, other: Routine) -> tuple[RoutineAction, RoutineAction] | None:
         """Check if any action in the routine conflicts with any action in another routine.
@@ -132,16 +321,16 @@ class Routine:
             if self_action.mode.id == other_action.mode.id:
                 return False
 
+            # Actions without a duration run until the end of the day, so they overlap the actions that end after they start
             if self_action.duration is None and other_action.duration is None:
                 return True
 
-            if self_action.duration is None and other_action.duration is not None and other.when + timedelta(minutes=other_action.duration) > self.when:
-                return True
+            if self_action.duration is None:
+                return other.when + timedelta(minutes=other_action.duration) > self.when
 
-            if self_action.duration is not None and other_action.duration is None and self.when + timedelta(minutes=self_action.duration) > other.when:
-                return True
+            if other_action.duration is None:
+                return self.when + timedelta(minutes=self_action.duration) > other.when
 
-            assert self_action.duration is not None and other_action.duration is not None
             return self.when < other.when + timedelta(minutes=other_action.duration) and other.when < self.when + timedelta(minutes=self_action.duration)
 
         for action in self.actions:
@@ -151,6 +340,17 @@ class Routine:
 
         return None
 
+    def at(self, when: datetime) -> Routine:
+        """Get a copy of the routine starting at another time. The copy shares the actions and the recurrence.
+
+        Args:
+            when (datetime): The start time of the copy.
+
+        Returns:
+            Routine: The copy.
+        """
+        return Routine(self.id, self.name, when, self.actions, self.enabled, self.recurrence)
+
     def power_consumption_at(self, when: datetime) -> float:
         """Calculate the power consumption of the routine at a given time.
 
@@ -160,6 +360,89 @@ class Routine:
         Returns:
             float: The power consumption of the routine at the given time.
         """
-        return sum(action.mode.power_consumption for action in self.actions
+        minute = int((when - self.when).total_seconds() // 60)
+        return sum(action.mode.power_at(minute) for action in self.actions
                    if (not action.duration and self.when <= when) or
                    (action.duration and self.when <= when <= self.when + timedelta(minutes=action.duration)))
+
+
+class RoutineList(Sequence[Routine]):
+    """An immutable list of routines, with versions that share their routines.
+
+    Appending a routine creates a new version in constant time, which references the version
+    it was appended to rather than copying it. So any number of simulations can add a routine
+    to the same list at the same time, without copies and without locks.
+    """
+
+    __slots__ = ("__base", "__parent", "__routine", "__length")
+
+    def __init__(self, routines: Iterable[Routine] = ()):
+        """Constructor.
+
+        Args:
+            routines (Iterable[Routine], optional): The routines of the first version. Defaults to none.
+        """
+        self.__base = tuple(routines)
+        self.__parent: RoutineList | None = None
+        self.__routine: Routine | None = None
+        self.__length = len(self.__base)
+
+    def append(self, routine: Routine) -> RoutineList:
+        """Create a new version with a routine appended.
+
+        Args:
+            routine (Routine): The routine to append.
+
+        Returns:
+            RoutineList: The new version.
+        """
+        appended = RoutineList.__new__(RoutineList)
+        appended.__base = self.__base
+        appended.__parent = self
+        appended.__routine = routine
+        appended.__length = self.__length + 1
+        return appended
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __iter__(self) -> Iterator[Routine]:
+        yield from self.__base
+        yield from reversed(self.__appended())
+
+    @overload
+    def __getitem__(self, index: int) -> Routine: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Routine]: ...
+
+    def __getitem__(self, index: int | slice) -> Routine | list[Routine]:
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError("Routine index out of range")
+
+        if index < len(self.__base):
+            return self.__base[index]
+
+        return self.__appended()[self.__length - 1 - index]
+
+    def __add__(self, routines: Iterable[Routine]) -> RoutineList:
+        extended = self
+        for routine in routines:
+            extended = extended.append(routine)
+
+        return extended
+
+    def __appended(self) -> list[Routine]:
+        # The routines appended after the base, from the newest
+        appended = []
+        version = self
+        while version.__parent is not None:
+            appended.append(version.__routine)
+            version = version.__parent
+
+        return appended
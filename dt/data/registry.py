@@ -0,0 +1,111 @@
+"""Registry of the appliances of a home, indexed by ID.
+
+IDs are not required to be contiguous, nor to start from zero, so they can't be used
+directly as positions in lists or arrays. The registry assigns each appliance a dense
+column index, ordered by ID, and each operation mode a dense index within its appliance,
+following the order of the modes of the appliance. All lookups are dictionary lookups.
+"""
+
+from .models import Appliance, OperationMode
+
+
+class ApplianceRegistry:
+    """Registry of the appliances of a home.
+
+    Attributes:
+        appliances (list[Appliance]): The appliances, ordered by column index, i.e. by ID.
+    """
+
+    def __init__(self, appliances: list[Appliance]):
+        """Constructor.
+
+        Args:
+            appliances (list[Appliance]): The list of appliances.
+
+        Raises:
+            ValueError: Two appliances have the same ID.
+        """
+        self.appliances = sorted(appliances, key=lambda a: a.id)
+        self.__columns = {appliance.id: column for column,
+                          appliance in enumerate(self.appliances)}
+        self.__mode_indices = [{mode.id: index for index, mode in enumerate(appliance.modes)}
+                               for appliance in self.appliances]
+
+        if len(self.__columns) != len(self.appliances):
+            raise ValueError("Appliance IDs must be unique")
+
+    def __len__(self) -> int:
+        return len(self.appliances)
+
+    def __contains__(self, appliance_id: int) -> bool:
+        return appliance_id in self.__columns
+
+    def get(self, appliance_id: int) -> Appliance | None:
+        """Get an appliance by its ID.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            Appliance | None: The appliance, or None if not found.
+        """
+        column = self.__columns.get(appliance_id)
+        return self.appliances[column] if column is not None else None
+
+    def get_mode(self, appliance_id: int, mode_id: int) -> OperationMode | None:
+        """Get an operation mode of an appliance by their IDs.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+            mode_id (int): The ID of the operation mode.
+
+        Returns:
+            OperationMode | None: The operation mode, or None if the appliance or the mode are not found.
+        """
+        column = self.__columns.get(appliance_id)
+        if column is None:
+            return None
+
+        index = self.__mode_indices[column].get(mode_id)
+        return self.appliances[column].modes[index] if index is not None else None
+
+    def column(self, appliance_id: int) -> int:
+        """Get the column index of an appliance.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Raises:
+            KeyError: The appliance is not in the registry.
+
+        Returns:
+            int: The column index.
+        """
+        return self.__columns[appliance_id]
+
+    def mode_index(self, appliance_id: int, mode_id: int) -> int:
+        """Get the index of an operation mode within its appliance.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+            mode_id (int): The ID of the operation mode.
+
+        Raises:
+            KeyError: The appliance or the mode are not in the registry.
+
+        Returns:
+            int: The mode index.
+        """
+        return self.__mode_indices[self.__columns[appliance_id]][mode_id]
+
+    def idle_mode_index(self, column: int) -> int:
+        """Get the index of the mode an appliance is in when no routine is acting on it.
+        This is the mode with ID 0, which by convention is the "off" mode, or the first mode if there is no such mode.
+
+        Args:
+            column (int): The column index of the appliance.
+
+        Returns:
+            int: The mode index.
+        """
+        return self.__mode_indices[column].get(0, 0)
@@ -0,0 +1,259 @@
+"""Precompiled home snapshots.
+
+A snapshot is a single binary file containing everything the digital twin needs to
+answer queries about a home: the appliances, the routines, the test routines,
+the lookup table mapping matrix columns to appliance IDs and the base state matrix.
+It is meant to be compiled once from another repository (e.g. the JSON files)
+and then loaded at startup, so that nothing has to be parsed or simulated before
+the API can answer.
+
+The file layout is the following:
+- 8 bytes of magic number, which also encodes the format version.
+- 4 bytes with the length of the header, as a little-endian unsigned integer.
+- The header, a JSON object with the offsets of the sections, the metadata of the matrix
+  and a hash of the inputs the matrix was compiled from.
+- The models section, containing the pickled appliances and routines.
+- The matrix section, containing the raw bytes of the base state matrix.
+
+The file is loaded with `mmap`, so the matrix is not copied in memory
+but read directly from the page cache when needed.
+The matrix is only used if the models and the configuration of the home are the same it was compiled and
+validated with, e.g. the maximum power or the battery, otherwise it is compiled again with every check.
+Snapshots are pickled, so only load snapshots from trusted sources.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import pickle
+import struct
+from typing import Any
+
+import numpy as np
+
+from dt.config import HomeConfig
+from .data_repository import DataRepository
+from .models import Appliance, Routine
+
+SNAPSHOT_MAGIC = b"DTSNAP05"
+__HEADER_LENGTH = struct.Struct("<I")
+__ALIGNMENT = 64
+
+
+class HomeSnapshot:
+    """The content of a snapshot file.
+
+    Attributes:
+        appliances (list[Appliance]): The list of appliances.
+        routines (list[Routine]): The list of routines.
+        test_routines (list[Routine]): The list of test routines.
+        appliance_ids (list[int]): The ID of the appliance of each column of the matrix.
+        routine_ids (list[int]): The IDs of the routines whose modes are set in the matrix.
+        matrix (np.ndarray): The base state matrix. It is read-only, as it is backed by the file.
+        max_power (float): The maximum power the matrix was validated against, in watts.
+        models (bytes): The pickled appliances and routines, as stored in the file.
+        inputs_hash (str): The hash of the models and of the configuration the matrix was compiled with.
+    """
+
+    def __init__(self, appliances: list[Appliance], routines: list[Routine], test_routines: list[Routine],
+                 appliance_ids: list[int], routine_ids: list[int], matrix: np.ndarray, max_power: float, models: bytes,
+                 inputs_hash: str):
+        self.appliances = appliances
+        self.routines = routines
+        self.test_routines = test_routines
+        self.appliance_ids = appliance_ids
+        self.routine_ids = routine_ids
+        self.matrix = matrix
+        self.max_power = max_power
+        self.models = models
+        self.inputs_hash = inputs_hash
+
+
+class SnapshotRepository(DataRepository):
+    """Repository for the data of the digital twin, stored in a snapshot file.
+    The snapshot is loaded lazily on first access and kept in memory.
+    """
+
+    def __init__(self, snapshot_file: str):
+        """Constructor.
+
+        Args:
+            snapshot_file (str): The path to the snapshot file.
+        """
+        super().__init__()
+        self.snapshot_file = snapshot_file
+        self.__snapshot: HomeSnapshot | None = None
+
+    @property
+    def snapshot(self) -> HomeSnapshot:
+        """The loaded snapshot.
+        """
+        if self.__snapshot is None:
+            self.__snapshot = read_snapshot(self.snapshot_file)
+
+        return self.__snapshot
+
+    def get_appliances(self) -> list[Appliance]:
+        """Get the list of appliances.
+
+        Returns:
+            list[Appliance]: The list of appliances.
+        """
+        return self.snapshot.appliances
+
+    def get_routines(self) -> list[Routine]:
+        """Get the list of routines.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return self.snapshot.routines
+
+    def get_test_routines(self) -> list[Routine]:
+        """Get the list of test routines.
+
+        Returns:
+            list[Routine]: The list of test routines.
+        """
+        return self.snapshot.test_routines
+
+    def get_base_matrix(self, config: HomeConfig) -> np.ndarray | None:
+        """Get the precompiled base state matrix.
+
+        Args:
+            config (HomeConfig): The configuration of the home the matrix must be valid for.
+
+        Returns:
+            np.ndarray | None: The matrix, or None if it was compiled from different models or configuration,
+            or if it is not the matrix of all the enabled routines, e.g. as they never run on the same day.
+        """
+        if inputs_hash(self.snapshot.models, config) != self.snapshot.inputs_hash:
+            return None
+
+        # The columns must follow the order of the registry
+        if self.snapshot.appliance_ids != [a.id for a in self.get_registry().appliances]:
+            return None
+
+        # The timeline uses the base matrix for the days on which every enabled routine runs
+        if self.snapshot.routine_ids != [routine.id for routine in self.get_routines() if routine.enabled]:
+            return None
+
+        return self.snapshot.matrix
+
+
+def write_snapshot(filepath: str, repository: DataRepository, appliance_ids: list[int], routine_ids: list[int], matrix: np.ndarray,
+                   config: HomeConfig) -> None:
+    """Compile the data of a repository into a snapshot file.
+
+    Args:
+        filepath (str): The path of the snapshot file to write.
+        repository (DataRepository): The repository to read the data from.
+        appliance_ids (list[int]): The ID of the appliance of each column of the matrix.
+        routine_ids (list[int]): The IDs of the routines whose modes are set in the matrix.
+        matrix (np.ndarray): The base state matrix, already validated.
+        config (HomeConfig): The configuration of the home the matrix was validated with.
+    """
+    appliances = repository.get_appliances()
+
+    # Pickle everything together, so that shared instances are stored only once
+    models = pickle.dumps((appliances, repository.get_routines(),
+                          repository.get_test_routines()), protocol=pickle.HIGHEST_PROTOCOL)
+    matrix = np.ascontiguousarray(matrix)
+
+    header: dict[str, Any] = {
+        "appliance_ids": appliance_ids,
+        "routine_ids": routine_ids,
+        "max_power": config.max_power,
+        "inputs_hash": inputs_hash(models, config),
+        "models": [0, len(models)],
+        "matrix": {"offset": 0, "dtype": matrix.dtype.str, "shape": list(matrix.shape)},
+    }
+
+    # The offsets depend on the header length, which depends on the offsets.
+    # Reserve enough space for the offsets by iterating until the header length is stable.
+    header_bytes = b""
+    while True:
+        header_length = len(header_bytes)
+        start = len(SNAPSHOT_MAGIC) + __HEADER_LENGTH.size + header_length
+        header["models"][0] = start
+        header["matrix"]["offset"] = __align(start + len(models))
+        header_bytes = json.dumps(header).encode("utf-8")
+
+        if len(header_bytes) == header_length:
+            break
+
+    with open(filepath, "wb") as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(__HEADER_LENGTH.pack(len(header_bytes)))
+        file.write(header_bytes)
+        file.write(models)
+        file.write(b"\0" * (header["matrix"]["offset"] - file.tell()))
+        file.write(matrix.tobytes())
+
+
+def read_snapshot(filepath: str) -> HomeSnapshot:
+    """Read a snapshot file.
+
+    Args:
+        filepath (str): The path to the snapshot file.
+
+    Raises:
+        ValueError: The file is not a snapshot, or it was written by an incompatible version.
+
+    Returns:
+        HomeSnapshot: The content of the snapshot.
+    """
+    with open(filepath, "rb") as file:
+        # The mapping stays valid after the file is closed
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f"{filepath} is not a valid snapshot file")
+
+    header_start = len(SNAPSHOT_MAGIC) + __HEADER_LENGTH.size
+    (header_length,) = __HEADER_LENGTH.unpack_from(buffer, len(SNAPSHOT_MAGIC))
+    header = json.loads(buffer[header_start:header_start + header_length])
+
+    models_start, models_length = header["models"]
+    models = buffer[models_start:models_start + models_length]
+    appliances, routines, test_routines = pickle.loads(models)
+
+    # Zero-copy view over the mapped file
+    matrix_info = header["matrix"]
+    dtype = np.dtype(matrix_info["dtype"])
+    shape = tuple(matrix_info["shape"])
+    matrix = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)),
+                           offset=matrix_info["offset"]).reshape(shape)
+
+    return HomeSnapshot(appliances, routines, test_routines, header["appliance_ids"], header["routine_ids"], matrix, header["max_power"],
+                        models, header["inputs_hash"])
+
+
+def inputs_hash(models: bytes, config: HomeConfig) -> str:
+    """Hash the inputs a base state matrix is compiled from, to tell whether it is still valid.
+    Besides the models, these are the settings of the home the power drawn from the grid depends on,
+    as the matrix is checked against the maximum power.
+
+    Args:
+        models (bytes): The pickled appliances and routines.
+        config (HomeConfig): The configuration of the home.
+
+    Returns:
+        str: The hexadecimal SHA-256 hash.
+    """
+    settings = {
+        "max_power": config.max_power,
+        "generation": vars(config.generation) if config.generation is not None else None,
+        "battery": vars(config.battery) if config.battery is not None else None,
+        "demand_response": config.demand_response,
+    }
+
+    digest = hashlib.sha256(models)
+    digest.update(json.dumps(settings, sort_keys=True,
+                  default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def __align(offset: int) -> int:
+    return (offset + __ALIGNMENT - 1) // __ALIGNMENT * __ALIGNMENT
@@ -0,0 +1,379 @@
+"""SQLite repository for the data of the digital twin.
+
+The data of many homes can be stored in the same database file, each identified by a home ID.
+Every table is keyed by the home ID and the IDs of the entities, so that looking up a single
+appliance or routine is a primary key lookup. The actions are also indexed by appliance,
+so that finding the routines that use an appliance does not require reading every routine.
+
+Test routines are stored in the same tables of the routines, distinguished by the `kind` column,
+as their IDs can overlap with the IDs of the routines.
+
+Durations are stored in minutes, as in the models.
+The power profiles of the modes are stored as JSON arrays of [duration, power consumption] segments,
+and the recurrences of the routines as JSON objects, as in the JSON files.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import queue
+import sqlite3
+from typing import Iterable, Iterator
+
+from .data_repository import DataRepository, parse_recurrence, serialize_recurrence
+from .models import Appliance, OperationMode, Routine, RoutineAction
+from .registry import ApplianceRegistry
+
+__SCHEMA = """
+CREATE TABLE IF NOT EXISTS appliances (
+    home_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    manufacturer TEXT NOT NULL,
+    model TEXT NOT NULL,
+    location TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    interruptible INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (home_id, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS modes (
+    home_id TEXT NOT NULL,
+    appliance_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    power_consumption REAL NOT NULL,
+    default_duration INTEGER,
+    power_profile TEXT,
+    PRIMARY KEY (home_id, appliance_id, id),
+    FOREIGN KEY (home_id, appliance_id) REFERENCES appliances (home_id, id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS routines (
+    home_id TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('routine', 'test')),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    "when" TEXT NOT NULL,
+    enabled INTEGER NOT NULL,
+    recurrence TEXT,
+    PRIMARY KEY (home_id, kind, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS actions (
+    home_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    routine_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    appliance_id INTEGER NOT NULL,
+    mode_id INTEGER NOT NULL,
+    duration INTEGER,
+    PRIMARY KEY (home_id, kind, routine_id, id),
+    FOREIGN KEY (home_id, kind, routine_id) REFERENCES routines (home_id, kind, id) ON DELETE CASCADE,
+    FOREIGN KEY (home_id, appliance_id, mode_id) REFERENCES modes (home_id, appliance_id, id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS actions_by_appliance ON actions (home_id, appliance_id, kind, routine_id);
+"""
+
+# Columns added to the tables after their first version, in order.
+# The version of the schema of a database, stored in its `user_version`, is the number of migrations applied to it.
+__MIGRATIONS = [
+    ("modes", "power_profile", "TEXT"),
+    ("routines", "recurrence", "TEXT"),
+    ("appliances", "priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("appliances", "interruptible", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+ROUTINE_KIND = "routine"
+TEST_ROUTINE_KIND = "test"
+
+
+class ConnectionPool:
+    """A pool of read-only connections to a SQLite database.
+
+    Connections are opened lazily, up to the size of the pool, and reused afterwards.
+    When all the connections are in use, callers wait for one to be released.
+    """
+
+    def __init__(self, sqlite_file: str, size: int = 4):
+        """Constructor.
+
+        Args:
+            sqlite_file (str): The path to the SQLite database file.
+            size (int, optional): The maximum number of open connections. Defaults to 4.
+        """
+        self.sqlite_file = sqlite_file
+        self.size = size
+        self.__idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self.__slots = queue.Queue(size)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection from the pool, for the duration of the context.
+
+        Yields:
+            sqlite3.Connection: The connection.
+        """
+        # A slot is taken for each borrowed connection, blocking when the pool is exhausted
+        self.__slots.put(None)
+
+        try:
+            try:
+                connection = self.__idle.get_nowait()
+            except queue.Empty:
+                # Connections move between threads, but are never used by two at the same time
+                connection = sqlite3.connect(
+                    f"file:{self.sqlite_file}?mode=ro", uri=True, check_same_thread=False)
+
+            try:
+                yield connection
+            finally:
+                self.__idle.put(connection)
+        finally:
+            self.__slots.get_nowait()
+
+
+class SQLiteRepository(DataRepository):
+    """Repository for the data of a home, stored in a SQLite database.
+
+    The database is opened in read-only mode through a pool of connections,
+    so that many readers can query it concurrently.
+    """
+
+    def __init__(self, sqlite_file: str, home_id: str, pool_size: int = 4):
+        """Constructor.
+
+        Args:
+            sqlite_file (str): The path to the SQLite database file.
+            home_id (str): The ID of the home to read the data of.
+            pool_size (int, optional): The maximum number of open connections. Defaults to 4.
+        """
+        super().__init__()
+        self.sqlite_file = sqlite_file
+        self.home_id = home_id
+        self.__pool = ConnectionPool(sqlite_file, pool_size)
+
+    def get_appliance(self, appliance_id: int) -> Appliance | None:
+        """Get an appliance by its ID.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            Appliance | None: The appliance, or None if not found.
+        """
+        appliances = self.__query_appliances(
+            "AND a.id = ?", (appliance_id,))
+        return appliances[0] if appliances else None
+
+    def get_appliances(self) -> list[Appliance]:
+        """Get the list of appliances.
+
+        Returns:
+            list[Appliance]: The list of appliances.
+        """
+        return self.__query_appliances()
+
+    def get_appliances_by_ids(self, appliance_ids: Iterable[int]) -> dict[int, Appliance]:
+        """Get many appliances by their IDs with a single query.
+
+        Args:
+            appliance_ids (Iterable[int]): The IDs of the appliances.
+
+        Returns:
+            dict[int, Appliance]: The appliances found, by ID. Missing IDs are not included.
+        """
+        appliance_ids = list(set(appliance_ids))
+        if not appliance_ids:
+            return {}
+
+        placeholders = ", ".join("?" * len(appliance_ids))
+        appliances = self.__query_appliances(
+            f"AND a.id IN ({placeholders})", tuple(appliance_ids))
+        return {appliance.id: appliance for appliance in appliances}
+
+    def get_routine(self, routine_id: int) -> Routine | None:
+        """Get a routine by its ID.
+
+        Args:
+            routine_id (int): The ID of the routine.
+
+        Returns:
+            Routine | None: The routine, or None if not found.
+        """
+        routines = self.__query_routines(
+            ROUTINE_KIND, "AND r.id = ?", (routine_id,))
+        return routines[0] if routines else None
+
+    def get_routines(self) -> list[Routine]:
+        """Get the list of routines.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return self.__query_routines(ROUTINE_KIND)
+
+    def get_test_routines(self) -> list[Routine]:
+        """Get the list of test routines.
+
+        Returns:
+            list[Routine]: The list of test routines.
+        """
+        return self.__query_routines(TEST_ROUTINE_KIND)
+
+    def get_routines_with_appliance(self, appliance_id: int) -> list[Routine]:
+        """Get the routines with at least an action on the given appliance.
+        Uses the index on the appliances of the actions.
+
+        Args:
+            appliance_id (int): The ID of the appliance.
+
+        Returns:
+            list[Routine]: The list of routines.
+        """
+        return self.__query_routines(
+            ROUTINE_KIND,
+            "AND r.id IN (SELECT routine_id FROM actions WHERE home_id = r.home_id AND appliance_id = ? AND kind = r.kind)",
+            (appliance_id,))
+
+    def data_version(self) -> object:
+        """Get a value that changes whenever the database is written.
+        The database is written by other connections, e.g. by `import_to_sqlite`, into the database file
+        or its write-ahead log, so the size and the modification time of both files are used.
+        An empty log, as created by the first reader, is the same as a missing one.
+
+        Returns:
+            object: The version of the data, comparable for equality.
+        """
+        return tuple(self.__file_version(path) for path in (self.sqlite_file, f"{self.sqlite_file}-wal"))
+
+    def __file_version(self, path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size) if stat.st_size else None
+
+    def __query_appliances(self, condition: str = "", params: tuple = ()) -> list[Appliance]:
+        with self.__pool.connection() as connection:
+            rows = connection.execute(
+                f"""SELECT a.id, a.device, a.manufacturer, a.model, a.location, a.priority, a.interruptible,
+                           m.id, m.name, m.power_consumption, m.default_duration, m.power_profile
+                    FROM appliances a JOIN modes m ON m.home_id = a.home_id AND m.appliance_id = a.id
+                    WHERE a.home_id = ? {condition}
+                    ORDER BY a.id, m.id""",
+                (self.home_id, *params)).fetchall()
+
+        appliances_data: dict[int, tuple] = {}
+        modes: dict[int, list[OperationMode]] = {}
+
+        for (appliance_id, device, manufacturer, model, location, priority, interruptible,
+             mode_id, mode_name, power_consumption, default_duration, power_profile) in rows:
+            if appliance_id not in appliances_data:
+                appliances_data[appliance_id] = (
+                    appliance_id, device, manufacturer, model, location, priority, bool(interruptible))
+                modes[appliance_id] = []
+
+            modes[appliance_id].append(OperationMode(mode_id, mode_name, power_consumption, default_duration,
+                                                     json.loads(power_profile) if power_profile is not None else None))
+
+        return [Appliance(*data[:5], modes[appliance_id], *data[5:]) for appliance_id, data in appliances_data.items()]
+
+    def __query_routines(self, kind: str, condition: str = "", params: tuple = ()) -> list[Routine]:
+        with self.__pool.connection() as connection:
+            rows = connection.execute(
+                f"""SELECT r.id, r.name, r."when", r.enabled, r.recurrence,
+                           ac.id, ac.appliance_id, ac.mode_id, ac.duration
+                    FROM routines r LEFT JOIN actions ac
+                        ON ac.home_id = r.home_id AND ac.kind = r.kind AND ac.routine_id = r.id
+                    WHERE r.home_id = ? AND r.kind = ? {condition}
+                    ORDER BY r.id, ac.id""",
+                (self.home_id, kind, *params)).fetchall()
+
+        # Only the appliances used by the actions are read, with a lookup by ID
+        registry = ApplianceRegistry(list(self.get_appliances_by_ids(
+            row[6] for row in rows if row[5] is not None).values()))
+        routines: list[Routine] = []
+
+        for routine_id, name, when, enabled, recurrence, action_id, appliance_id, mode_id, duration in rows:
+            if not routines or routines[-1].id != routine_id:
+                routines.append(Routine(routine_id, name, datetime.strptime(when, "%H:%M"), [], bool(enabled),
+                                        parse_recurrence(json.loads(recurrence)) if recurrence is not None else None))
+
+            # Routines without actions have a single row with null actions
+            if action_id is None:
+                continue
+
+            appliance = registry.get(appliance_id)
+            mode = registry.get_mode(appliance_id, mode_id)
+            routines[-1].actions.append(
+                RoutineAction(action_id, appliance, mode, duration))
+
+        return routines
+
+
+def import_to_sqlite(repository: DataRepository, sqlite_file: str, home_id: str) -> None:
+    """Copy the data of a repository into a SQLite database, replacing the previous data of the home.
+    The database is created if it does not exist, and set in WAL mode to allow concurrent readers.
+
+    Args:
+        repository (DataRepository): The repository to read the data from.
+        sqlite_file (str): The path to the SQLite database file.
+        home_id (str): The ID of the home to write the data of.
+    """
+    connection = sqlite3.connect(sqlite_file)
+
+    try:
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.executescript(__SCHEMA)
+        __migrate(connection)
+
+        with connection:
+            # Removing the routines and appliances removes actions and modes as well
+            connection.execute(
+                "DELETE FROM routines WHERE home_id = ?", (home_id,))
+            connection.execute(
+                "DELETE FROM appliances WHERE home_id = ?", (home_id,))
+
+            for appliance in repository.get_appliances():
+                connection.execute("INSERT INTO appliances VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (home_id, appliance.id, appliance.device, appliance.manufacturer, appliance.model, appliance.location,
+                                    appliance.priority, int(appliance.interruptible)))
+                connection.executemany("INSERT INTO modes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       [(home_id, appliance.id, mode.id, mode.name, mode.power_consumption, mode.default_duration,
+                                         json.dumps(mode.power_profile) if mode.power_profile is not None else None) for mode in appliance.modes])
+
+            for kind, routines in [(ROUTINE_KIND, repository.get_routines()), (TEST_ROUTINE_KIND, repository.get_test_routines())]:
+                for routine in routines:
+                    connection.execute("INSERT INTO routines VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (home_id, kind, routine.id, routine.name, routine.when.strftime("%H:%M"), int(routine.enabled),
+                                        json.dumps(serialize_recurrence(routine.recurrence)) if routine.recurrence is not None else None))
+                    connection.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                           [(home_id, kind, routine.id, action.id, action.appliance.id, action.mode.id, action.duration) for action in routine.actions])
+    finally:
+        connection.close()
+
+
+def __migrate(connection: sqlite3.Connection) -> None:
+    """Add the columns missing from the tables of a database, created with an older version of the schema.
+
+    Databases created before the version was recorded have version 0, whatever columns they have,
+    and new databases are created with every column, so each migration checks whether its column exists.
+
+    Args:
+        connection (sqlite3.Connection): The connection to the database.
+    """
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+
+    with connection:
+        for table, column, definition in __MIGRATIONS[version:]:
+            if column not in [info[1] for info in connection.execute(f"PRAGMA table_info({table})")]:
+                connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+        # PRAGMA arguments can't be bound as parameters
+        connection.execute(f"PRAGMA user_version = {len(__MIGRATIONS)}")
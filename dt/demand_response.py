@@ -0,0 +1,217 @@
+"""Demand response: keeping the house under its maximum power by delaying the appliances with lower priorities.
+
+Instead of rejecting the routines that would exceed the maximum power, the load controller reschedules the runs
+of the appliances, i.e. the intervals in which an appliance stays in a mode other than its idle one, as a smart
+load controller with the schedule of the day would:
+- runs are served in order of priority of their appliances, and then of requested start,
+so that the runs with lower priorities are the ones to be delayed;
+- interruptible appliances are paused in the minutes without enough power, and resumed as soon as there is;
+- other appliances are delayed as a whole, to the first start at which the whole run fits;
+- the runs of an appliance keep their order, so delaying a run delays the following ones of the same appliance.
+Runs, or parts of them, that can't be served before the end of the day are reported as unserved.
+
+State matrices of homes with demand response reschedule their requested modes with the load controller
+whenever they are built, so every consumer of the matrix sees the delayed runs.
+
+The schedule is built one run, or one segment of a power profile, at a time: the minutes in which each segment
+fits are found at once over the whole day, so the cost depends on the number of mode changes, not of minutes.
+As in `StateMatrix.feasible_starts`, the load is checked against the generation only, without the battery,
+which is dispatched again over the new schedule.
+"""
+
+import numpy as np
+
+from dt.data import Appliance, OperationMode
+from dt.dispatch import DispatchResult, dispatch, solar_profile
+from dt.energy import StateMatrix
+from dt import const
+
+
+class LoadDelay:
+    """The changes to a run of an appliance made by the load controller.
+
+    Attributes:
+        appliance (Appliance): The appliance.
+        mode (OperationMode): The mode of the appliance during the run.
+        requested_start (int): The minute of the day in which the run was meant to start.
+        start (int | None): The minute of the day in which the run started, None if it was not served at all.
+        end (int | None): The minute of the day after the last one served, None if it was not served at all.
+        delay (int): The minutes by which the end of the run was delayed.
+        interruptions (int): The number of times the run was paused.
+        shifted_energy (float): The energy served in other minutes than requested, in Wh.
+        unserved_energy (float): The energy that could not be served before the end of the day, in Wh.
+    """
+
+    def __init__(self, appliance: Appliance, mode: OperationMode, requested_start: int, start: int | None, end: int | None,
+                 delay: int, interruptions: int, shifted_energy: float, unserved_energy: float):
+        self.appliance = appliance
+        self.mode = mode
+        self.requested_start = requested_start
+        self.start = start
+        self.end = end
+        self.delay = delay
+        self.interruptions = interruptions
+        self.shifted_energy = shifted_energy
+        self.unserved_energy = unserved_energy
+
+
+class DemandResponseResult:
+    """The schedule of the load controller.
+
+    Attributes:
+        matrix (np.ndarray): The mode index of each appliance in each minute, as in `StateMatrix.matrix`.
+        power_matrix (np.ndarray): The power drawn by each appliance in each minute, in watts.
+        dispatch (DispatchResult): The flows of power of the house with the new schedule.
+        net_power (np.ndarray): The power drawn from the grid in each minute, in watts.
+        delays (list[LoadDelay]): The runs that were delayed, interrupted or not fully served.
+    """
+
+    def __init__(self, matrix: np.ndarray, power_matrix: np.ndarray, dispatch: DispatchResult, delays: list[LoadDelay]):
+        self.matrix = matrix
+        self.power_matrix = power_matrix
+        self.dispatch = dispatch
+        self.net_power = dispatch.net_power
+        self.delays = delays
+
+    @property
+    def shifted_energy(self) -> float:
+        """The energy served in other minutes than requested, in Wh.
+        """
+        return sum(delay.shifted_energy for delay in self.delays)
+
+    @property
+    def unserved_energy(self) -> float:
+        """The energy that could not be served before the end of the day, in Wh.
+        """
+        return sum(delay.unserved_energy for delay in self.delays)
+
+
+class LoadController:
+    """Reschedules the runs of the appliances requested by the routines of a state matrix,
+    to keep the house under its maximum power.
+    """
+
+    def __init__(self, state_matrix: StateMatrix) -> None:
+        """Constructor.
+
+        Args:
+            state_matrix (StateMatrix): The state matrix, whose requested modes are rescheduled.
+        """
+        self.state_matrix = state_matrix
+        self.registry = state_matrix.registry
+        self.config = state_matrix.config
+
+    def schedule(self) -> DemandResponseResult:
+        """Reschedule the runs of the appliances.
+
+        Returns:
+            DemandResponseResult: The new schedule, with the changed runs.
+        """
+        registry = self.registry
+        columns = np.arange(len(registry))
+        idle_modes = np.array([registry.idle_mode_index(column)
+                              for column in columns], dtype=np.int16)
+        idle_power = self.state_matrix.power_table[columns, idle_modes]
+        generation = solar_profile(self.config.generation)
+
+        # Power left under the maximum, with every appliance in its idle mode
+        headroom = self.config.max_power - idle_power.sum() + generation
+
+        matrix = np.empty_like(self.state_matrix.requested_matrix)
+        matrix[:] = idle_modes
+        power_matrix = np.empty_like(self.state_matrix.requested_power_matrix)
+        power_matrix[:] = idle_power
+
+        # Minute after the last served one of each appliance, so that its runs keep their order
+        ready = np.zeros(len(registry), dtype=int)
+        delays = []
+
+        for column, mode_index, start, end in sorted(self.__runs(idle_modes),
+                                                     key=lambda run: (-registry.appliances[run[0]].priority, run[2], run[0])):
+            appliance = registry.appliances[column]
+
+            # Power added over the idle mode in each minute of the run
+            power = self.state_matrix.requested_power_matrix[start:end,
+                                                             column] - idle_power[column]
+            requested = np.arange(start, end)
+
+            if appliance.interruptible:
+                served = self.__fill(power, headroom, max(start, ready[column]))
+            else:
+                served = self.__fit(power, headroom, max(start, ready[column]))
+
+            # Served minutes of each minute of the run, -1 for the unserved ones
+            is_served = served >= 0
+            headroom[served[is_served]] -= power[is_served]
+            matrix[served[is_served], column] = mode_index
+            power_matrix[served[is_served], column] += power[is_served]
+
+            if is_served.any():
+                ready[column] = served[is_served][-1] + 1
+
+            if np.array_equal(served, requested):
+                continue
+
+            mode_power = power + idle_power[column]
+            served_minutes = served[is_served]
+            delays.append(LoadDelay(
+                appliance, appliance.modes[mode_index], start,
+                int(served_minutes[0]) if served_minutes.size else None,
+                int(served_minutes[-1]) + 1 if served_minutes.size else None,
+                int(served_minutes[-1]) + 1 - end if served_minutes.size else 0,
+                int(np.count_nonzero(np.diff(served_minutes) > 1)),
+                float(mode_power[is_served & (served != requested)].sum()) / 60,
+                float(mode_power[~is_served].sum()) / 60))
+
+        return DemandResponseResult(matrix, power_matrix,
+                                    dispatch(power_matrix.sum(axis=1), generation, self.config.battery), delays)
+
+    def __runs(self, idle_modes: np.ndarray) -> list[tuple[int, int, int, int]]:
+        # Column, mode index, start and end of each interval with the same non-idle mode
+        runs = []
+
+        for column in range(len(self.registry)):
+            modes = self.state_matrix.requested_matrix[:, column]
+            bounds = np.r_[0, np.flatnonzero(
+                np.diff(modes)) + 1, const.MINUTES_IN_DAY]
+
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                if modes[start] != idle_modes[column]:
+                    runs.append((column, int(modes[start]), int(start), int(end)))
+
+        return runs
+
+    def __fill(self, power: np.ndarray, headroom: np.ndarray, earliest: int) -> np.ndarray:
+        # Serve each segment of constant power of an interruptible run in the first minutes with enough headroom
+        served = np.full(len(power), -1)
+        bounds = np.r_[0, np.flatnonzero(np.diff(power)) + 1, len(power)]
+        cursor = earliest
+
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            minutes = cursor + \
+                np.flatnonzero(headroom[cursor:] >= power[start])[:end - start]
+            served[start:start + len(minutes)] = minutes
+
+            if len(minutes) < end - start:
+                break
+
+            cursor = int(minutes[-1]) + 1 if len(minutes) else cursor
+
+        return served
+
+    def __fit(self, power: np.ndarray, headroom: np.ndarray, earliest: int) -> np.ndarray:
+        # Serve a run that can't be paused at the first start from which every minute has enough headroom.
+        # Runs are cut at the end of the day, so the minutes after it are free.
+        padded = np.r_[headroom, np.full(len(power), np.inf)]
+        windows = np.lib.stride_tricks.sliding_window_view(padded, len(power))[
+            earliest:const.MINUTES_IN_DAY]
+        starts = np.flatnonzero((windows >= power).all(axis=1))
+
+        served = np.full(len(power), -1)
+        if starts.size == 0:
+            return served
+
+        minutes = earliest + starts[0] + np.arange(len(power))
+        served[minutes < const.MINUTES_IN_DAY] = minutes[minutes <
+                                                         const.MINUTES_IN_DAY]
+        return served
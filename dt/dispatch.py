@@ -0,0 +1,141 @@
+"""On-site generation and battery storage.
+
+The power drawn by the appliances is partly covered by the generation of the home, e.g. solar panels.
+A battery stores the surplus of the generation and releases it when the load exceeds the generation,
+within its capacity and power limits. What is left is drawn from, or fed into, the grid.
+
+The dispatch works on the power of each minute of the day as a whole array. The only sequential part
+is the state of charge of the battery, which is bounded by its capacity: it is computed with cumulative sums
+between the minutes in which the battery becomes full or empty, see `state_of_charge`.
+
+As the battery only charges with the surplus of the generation, the power drawn from the grid is never
+higher than the load minus the generation. The checks of the maximum power and the costs of the start times
+of the routines use this bound, i.e. they are computed without the battery, whose dispatch depends on the
+whole day and would have to be computed again for each start time.
+"""
+
+import numpy as np
+
+from dt.config import BatteryConfig, GenerationConfig
+from dt import const
+
+
+class DispatchResult:
+    """The flows of power of a home in each minute of the day, in watts.
+
+    Attributes:
+        load (np.ndarray): The power drawn by the appliances.
+        generation (np.ndarray): The power generated on site.
+        battery_power (np.ndarray): The power drawn by the battery, positive when it charges and negative when it discharges.
+        state_of_charge (np.ndarray): The energy stored in the battery at the end of each minute, in Wh.
+        net_power (np.ndarray): The power drawn from the grid, negative when it is fed into it.
+        It is `load - generation + battery_power`, so the load is `net_power + generation - battery_power`.
+    """
+
+    def __init__(self, load: np.ndarray, generation: np.ndarray, battery_power: np.ndarray, state_of_charge: np.ndarray, net_power: np.ndarray):
+        self.load = load
+        self.generation = generation
+        self.battery_power = battery_power
+        self.state_of_charge = state_of_charge
+        self.net_power = net_power
+
+
+def solar_profile(config: GenerationConfig | None) -> np.ndarray:
+    """Get the power generated in each minute of the day, as a half-sine between sunrise and sunset.
+
+    Args:
+        config (GenerationConfig | None): The configuration of the generation, None if there is none.
+
+    Returns:
+        np.ndarray: The power generated in each minute, in watts.
+    """
+    generation = np.zeros(const.MINUTES_IN_DAY)
+    if config is None:
+        return generation
+
+    sunrise = config.sunrise.hour * 60 + config.sunrise.minute
+    sunset = config.sunset.hour * 60 + config.sunset.minute
+
+    # Sample the middle of each minute, so that the profile is symmetric
+    minutes = np.arange(sunrise, sunset) + 0.5
+    generation[sunrise:sunset] = config.peak_power * \
+        np.sin(np.pi * (minutes - sunrise) / (sunset - sunrise))
+    return generation
+
+
+def dispatch(load: np.ndarray, generation: np.ndarray, battery: BatteryConfig | None) -> DispatchResult:
+    """Dispatch the generation and the battery over the load of the day.
+    The battery charges with the surplus of the generation and discharges to cover the rest of the load.
+    The power drawn by the battery is added to the load, i.e. it is positive when the battery charges.
+
+    Args:
+        load (np.ndarray): The power drawn by the appliances in each minute, in watts.
+        generation (np.ndarray): The power generated in each minute, in watts.
+        battery (BatteryConfig | None): The configuration of the battery, None if there is none.
+
+    Returns:
+        DispatchResult: The flows of power.
+    """
+    if battery is None:
+        return DispatchResult(load, generation, np.zeros_like(load), np.zeros_like(load), load - generation)
+
+    surplus = generation - load
+
+    # Energy that the battery would store, or release, in each minute within its power limits, in Wh
+    stored = np.clip(surplus, 0, battery.max_charge_power) * \
+        battery.efficiency / 60
+    released = np.clip(-surplus, 0, battery.max_discharge_power) / 60
+
+    initial_charge = battery.initial_charge * battery.capacity
+    charge = np.r_[initial_charge, state_of_charge(
+        stored - released, initial_charge, battery.capacity)]
+
+    # The actual change of charge of each minute, converted back to power at the terminals of the battery
+    change = np.diff(charge)
+    battery_power = np.where(
+        change > 0, change * 60 / battery.efficiency, change * 60)
+
+    return DispatchResult(load, generation, battery_power, charge[1:], load - generation + battery_power)
+
+
+def state_of_charge(changes: np.ndarray, initial_charge: float, capacity: float) -> np.ndarray:
+    """Get the charge of a battery at the end of each minute, i.e. the cumulative sum of the changes of charge
+    clamped between 0 and the capacity at each minute.
+
+    The charge is a plain cumulative sum until the first minute in which it would go out of bounds.
+    There it is clamped, and stays at the bound until the first minute in which the changes move it back,
+    from which a new cumulative sum starts. So the loop runs once for each time the battery becomes full or empty,
+    rather than once for each minute.
+
+    Args:
+        changes (np.ndarray): The energy the battery would store, positive, or release, negative, in each minute, in Wh.
+        initial_charge (float): The charge before the first minute, in Wh.
+        capacity (float): The capacity of the battery, in Wh.
+
+    Returns:
+        np.ndarray: The charge at the end of each minute, in Wh.
+    """
+    charge = np.empty(len(changes))
+    level = initial_charge
+    start = 0
+
+    while start < len(changes):
+        path = level + np.cumsum(changes[start:])
+        outside = np.flatnonzero((path < 0) | (path > capacity))
+
+        if outside.size == 0:
+            charge[start:] = path
+            break
+
+        bound = start + int(outside[0])
+        charge[start:bound] = path[:outside[0]]
+        full = path[outside[0]] > capacity
+        level = capacity if full else 0.0
+
+        # The charge stays at the bound until a change moves it back inside, which is never the one at the bound
+        inward = np.flatnonzero(
+            changes[bound:] < 0 if full else changes[bound:] > 0)
+        start = bound + int(inward[0]) if inward.size else len(changes)
+        charge[bound:start] = level
+
+    return charge
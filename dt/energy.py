@@ -1,12 +1,19 @@
 from __future__ import annotations
-from datetime import datetime, timedelta
-from typing import Any
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import time
+from typing import TYPE_CHECKING, Any
 import numpy as np
 
 from dt.config import HomeConfig
-from dt.data import Appliance, Routine, RoutineAction
+from dt.data import Appliance, ApplianceRegistry, OperationMode, Routine, RoutineAction, RoutineList
+from dt.dispatch import DispatchResult, dispatch, solar_profile
+from dt.tariff import TariffSeries
 from dt import const
 
+if TYPE_CHECKING:
+    from dt.demand_response import DemandResponseResult
+
 
 class ConflictError(Exception):
     """Error raised when there is a conflict in the routines.
@@ -42,30 +49,234 @@ class MaxPowerExceededError(ConflictError):
         self.when = when
 
 
+def action_span(routine: Routine, action: RoutineAction) -> tuple[int, int]:
+    """Get the minutes of the day in which an action of a routine runs.
+    Actions without a duration run until the end of the day.
+
+    Args:
+        routine (Routine): The routine.
+        action (RoutineAction): The action of the routine.
+
+    Returns:
+        tuple[int, int]: The first minute and the minute after the last one.
+    """
+    start = routine.when.hour * 60 + routine.when.minute
+    end = min(action.duration + start,
+              const.MINUTES_IN_DAY) if action.duration else const.MINUTES_IN_DAY
+
+    return start, end
+
+
+@lru_cache(maxsize=1024)
+def mode_power_vector(mode: OperationMode, length: int) -> np.ndarray:
+    """Get the power consumption of a mode in each minute since it was set.
+    Power profiles are expanded with a single `np.repeat` of their segments.
+    The vectors are cached, as modes are immutable, so they must not be modified.
+
+    Args:
+        mode (OperationMode): The operation mode.
+        length (int): The number of minutes.
+
+    Returns:
+        np.ndarray: The power consumption in each minute, in watts.
+    """
+    vector = np.full(length, mode.power_consumption, dtype=float)
+
+    if mode.power_profile is not None:
+        durations, powers = zip(*mode.power_profile)
+        samples = np.repeat(powers, durations)[:length]
+        vector[:samples.size] = samples
+
+    vector.setflags(write=False)
+    return vector
+
+
+def find_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Find the runs of consecutive true values of a boolean array.
+
+    Args:
+        mask (np.ndarray): The 1-D boolean array.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The index of the first value of each run, and the index after the last one.
+    """
+    # Pad with false values, so that runs touching the edges also have two boundaries
+    edges = np.diff(np.r_[False, mask, False].astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def conflicting_starts(routine: Routine, others: list[Routine]) -> np.ndarray:
+    """Find the minutes of the day in which a routine can't start, because one of its actions would set
+    an appliance to a mode other than the one set by an action of another routine at the same time.
+    The start time of the routine is ignored.
+
+    Args:
+        routine (Routine): The routine.
+        others (list[Routine]): The other routines. Disabled routines are ignored.
+
+    Returns:
+        np.ndarray: Whether the routine would conflict, for each minute of the day.
+    """
+    minutes = const.MINUTES_IN_DAY
+    if not routine.enabled:
+        return np.zeros(minutes, dtype=bool)
+
+    # The starts in which each action would overlap each conflicting action are an interval,
+    # so the occupancy of the appliances is painted with a difference array
+    firsts = []
+    lasts = []
+    for routine_action in routine.actions:
+        for other in others:
+            if not other.enabled:
+                continue
+
+            other_start = other.when.hour * 60 + other.when.minute
+            for other_action in other.actions:
+                if other_action.appliance.id != routine_action.appliance.id or other_action.mode.id == routine_action.mode.id:
+                    continue
+
+                firsts.append(0 if routine_action.duration is None else max(
+                    other_start - routine_action.duration + 1, 0))
+                lasts.append(minutes if other_action.duration is None else min(
+                    other_start + other_action.duration, minutes))
+
+    occupancy = np.zeros(minutes + 1, dtype=int)
+    np.add.at(occupancy, firsts, 1)
+    np.add.at(occupancy, lasts, -1)
+    return np.cumsum(occupancy[:-1]) > 0
+
+
+def routine_power_vector(routine: Routine) -> np.ndarray:
+    """Get the power drawn by a routine in each minute since its start.
+    Actions without a duration are assumed to run for a whole day.
+
+    Args:
+        routine (Routine): The routine.
+
+    Returns:
+        np.ndarray: The power drawn in each minute, in watts, as long as the longest action.
+    """
+    durations = [action.duration or const.MINUTES_IN_DAY for action in routine.actions]
+    power = np.zeros(max(durations, default=0))
+
+    for action, duration in zip(routine.actions, durations):
+        power[:duration] += mode_power_vector(action.mode, duration)
+
+    return power
+
+
+class ModeRuns:
+    """The runs of consecutive minutes in which appliances stay in the same mode.
+
+    Attributes:
+        columns (np.ndarray): The column of the appliance of each run.
+        starts (np.ndarray): The first minute of each run.
+        ends (np.ndarray): The minute after the last one of each run.
+        modes (np.ndarray): The index of the mode of each run.
+    """
+
+    def __init__(self, columns: np.ndarray, starts: np.ndarray, ends: np.ndarray, modes: np.ndarray):
+        self.columns = columns
+        self.starts = starts
+        self.ends = ends
+        self.modes = modes
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+
+class MatrixDiff:
+    """The differences between two state matrices of the same appliances.
+
+    The changes are the runs of consecutive minutes in which an appliance is in a different mode
+    in the two matrices, and in which neither of the two modes changes.
+
+    Attributes:
+        columns (np.ndarray): The column of the appliance of each change.
+        starts (np.ndarray): The first minute of each change.
+        ends (np.ndarray): The minute after the last one of each change.
+        modes_before (np.ndarray): The index of the mode in the first matrix, for each change.
+        modes_after (np.ndarray): The index of the mode in the second matrix, for each change.
+        delta_power (np.ndarray): The difference of the power drawn from the grid in each minute, in watts.
+        delta_energy (float): The difference of the energy drawn from the grid, in Wh.
+        delta_cost (float): The difference of the cost of the energy drawn from the grid, in €.
+    """
+
+    def __init__(self, columns: np.ndarray, starts: np.ndarray, ends: np.ndarray, modes_before: np.ndarray, modes_after: np.ndarray,
+                 delta_power: np.ndarray, delta_energy: float, delta_cost: float):
+        self.columns = columns
+        self.starts = starts
+        self.ends = ends
+        self.modes_before = modes_before
+        self.modes_after = modes_after
+        self.delta_power = delta_power
+        self.delta_energy = delta_energy
+        self.delta_cost = delta_cost
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+
 class StateMatrix():
     """A matrix that represents the operation mode of each appliance in each minute of the day.
     A row is created for each minute of the day, and a column for each appliance.
     So if there are 10 appliances, the matrix will have 1440 rows and 10 columns.
     Currently the matrix is implemented as a numpy array of integers.
 
+    Columns and values are dense indices assigned by the `ApplianceRegistry` of the appliances,
+    rather than IDs: columns follow the order of the appliance IDs, and each value is the index
+    of the mode within the modes of the appliance. This way IDs don't need to be contiguous.
+
+    The power consumption of each appliance in each minute is computed once, when the matrix is created,
+    so that consumption queries are simple array lookups. Modes with a power profile are expanded
+    over the minutes in which their actions run.
+
+    The generation and the battery of the home, if any, are dispatched over the power of the appliances,
+    and the resulting net power drawn from the grid is what is checked against the maximum power.
+
+    If the home has demand response, the modes set by the routines are only requested: they are kept in
+    `requested_matrix` and `requested_power_matrix`, and the appliances run as rescheduled by the load controller,
+    whose result is kept in `demand_response`. `matrix`, `power_matrix`, `dispatch` and everything computed from them
+    follow the rescheduled runs. Otherwise the requested arrays are the same as the actual ones.
+
     Methods are provided to calculate the total consumption of the house at a given time,
     the consumption of a specific appliance at a given time, and to simulate a new matrix
     with a new set of routines.
     """
 
-    def __init__(self, appliances: list[Appliance], routines: list[Routine], config: HomeConfig):
+    def __init__(self, appliances: list[Appliance], routines: list[Routine], config: HomeConfig, matrix: np.ndarray | None = None,
+                 check_max_power: bool = True):
         """Constructor.
 
         Args:
             appliances (list[Appliance]): The list of appliances.
             routines (list[Routine]): The list of routines.
+            matrix (np.ndarray | None, optional): A precompiled matrix of the modes requested by the given routines,
+            e.g. loaded from a snapshot. If given, the routines are trusted to be consistent and are not simulated again.
+            Defaults to None.
+            check_max_power (bool, optional): Whether to raise `MaxPowerExceededError` if the routines exceed
+            the maximum power, e.g. to inspect a schedule over it. Defaults to True.
         """
 
         self.appliances = appliances
-        self.routines = routines
+        self.routines = routines if isinstance(
+            routines, RoutineList) else RoutineList(routines)
         self.config = config
-        self.matrix = np.zeros(
-            (const.MINUTES_IN_DAY, len(appliances)), dtype=np.float16)
+        self.registry = ApplianceRegistry(appliances)
+
+        # Power consumption of each mode, by column and mode index.
+        # Appliances with fewer modes are padded with zeros.
+        self.power_table = np.zeros(
+            (len(self.registry), max((len(a.modes) for a in self.registry.appliances), default=0)))
+        for column, appliance in enumerate(self.registry.appliances):
+            self.power_table[column, :len(appliance.modes)] = [
+                mode.power_consumption for mode in appliance.modes]
+        self.power_table.setflags(write=False)
+
+        if matrix is not None:
+            self.requested_matrix = matrix
+            self.__compute_power()
+            return
 
         for routine in routines:
             for other_routine in routines:
@@ -80,42 +291,135 @@ class StateMatrix():
                 raise InconsistentRoutinesError(
                     [routine, other_routine], conflicting_actions[0].appliance)
 
+        # Appliances are in their idle mode unless a routine says otherwise
+        self.requested_matrix = np.empty(
+            (const.MINUTES_IN_DAY, len(self.registry)), dtype=np.int16)
+        self.requested_matrix[:] = [self.registry.idle_mode_index(
+            column) for column in range(len(self.registry))]
+
         for routine in routines:
-            if not routine.enabled:
+            self.__set_modes(self.requested_matrix, routine)
+
+        self.__compute_power()
+        if check_max_power:
+            self.__check_max_power()
+
+    def __set_modes(self, matrix: np.ndarray, routine: Routine):
+        if not routine.enabled:
+            return
+
+        for action in routine.actions:
+            start, end = action_span(routine, action)
+            matrix[start:end, self.registry.column(action.appliance.id)] = self.registry.mode_index(
+                action.appliance.id, action.mode.id)
+
+    def __set_power(self, power_matrix: np.ndarray, routine: Routine):
+        # The power of modes with a profile depends on when they were set,
+        # so the slices of their actions are replaced with the expanded profiles.
+        if not routine.enabled:
+            return
+
+        for action in routine.actions:
+            if action.mode.power_profile is None:
                 continue
 
-            for action in routine.actions:
-                # Convert start and end time to minutes of the day
-                start = routine.when.hour * 60 + routine.when.minute
-                end = min(action.duration + start,
-                          const.MINUTES_IN_DAY) if action.duration else const.MINUTES_IN_DAY - start
-
-                for minute in range(start, end+1):
-                    self.matrix[minute-1][action.appliance.id] = action.mode.id
-
-        # Check that the power consumption of each appliance is not greater than the maximum power consumption of the house
-        for minute_of_day in range(const.MINUTES_IN_DAY):
-            sum = 0
-            for appliance_id, mode_id in enumerate(self.matrix[minute_of_day]):
-                appliance = next(
-                    a for a in self.appliances if a.id == appliance_id)
-                mode = next(m for m in appliance.modes if m.id == mode_id)
-                sum += mode.power_consumption
-
-            if sum > config.max_power:
-                time = datetime.today().replace(hour=minute_of_day//60, minute=minute_of_day % 60)
-                raise MaxPowerExceededError(config.max_power, time)
-
-    def add_routine(self, routine: Routine) -> StateMatrix:
+            start, end = action_span(routine, action)
+            power_matrix[start:end, self.registry.column(
+                action.appliance.id)] = mode_power_vector(action.mode, end - start)
+
+    def __compute_power(self):
+        # Look up the power of the mode of every cell at once
+        self.requested_power_matrix = self.power_table[np.arange(
+            len(self.registry)), self.requested_matrix]
+
+        for routine in self.routines:
+            self.__set_power(self.requested_power_matrix, routine)
+
+        self.__dispatch()
+
+    def __dispatch(self):
+        self.demand_response: DemandResponseResult | None = None
+
+        if self.config.demand_response:
+            # Imported here, as the load controller depends on this module
+            from dt.demand_response import LoadController
+
+            self.demand_response = LoadController(self).schedule()
+            self.matrix = self.demand_response.matrix
+            self.power_matrix = self.demand_response.power_matrix
+            self.dispatch: DispatchResult = self.demand_response.dispatch
+        else:
+            self.matrix = self.requested_matrix
+            self.power_matrix = self.requested_power_matrix
+            self.dispatch = dispatch(self.power_matrix.sum(axis=1), solar_profile(
+                self.config.generation), self.config.battery)
+
+        self.power = self.dispatch.load
+        self.net_power = self.dispatch.net_power
+
+        # Matrices are shared by every request and by the matrices derived from them, so they are never modified
+        for array in [self.requested_matrix, self.requested_power_matrix, self.matrix, self.power_matrix, self.power,
+                      self.dispatch.generation, self.dispatch.battery_power, self.dispatch.state_of_charge, self.net_power]:
+            array.setflags(write=False)
+
+    def __check_max_power(self):
+        # Check that the power drawn from the grid is not greater than the maximum power consumption of the house
+        exceeding_minutes = np.flatnonzero(
+            self.net_power > self.config.max_power)
+        if exceeding_minutes.size > 0:
+            minute_of_day = int(exceeding_minutes[0])
+            time = datetime.today().replace(hour=minute_of_day//60, minute=minute_of_day % 60)
+            raise MaxPowerExceededError(self.config.max_power, time)
+
+    def add_routine(self, routine: Routine, check_max_power: bool = True) -> StateMatrix:
         """Creates a new matrix with a new routine added.
 
+        The new matrix shares the appliances, the lookup tables and the routines of this one,
+        which are already consistent, so only the new routine is checked and simulated.
+        This matrix is not modified, so routines can be added to it from many threads at once.
+
         Args:
             routine (Routine): The routine to add.
+            check_max_power (bool, optional): Whether to check the maximum power. Defaults to True.
+
+        Raises:
+            InconsistentRoutinesError: The routine conflicts with a routine of this matrix.
+            MaxPowerExceededError: The routine makes the house exceed its maximum power.
 
         Returns:
             StateMatrix: The new matrix with the new routine added.
         """
-        return StateMatrix(self.appliances, self.routines + [routine], self.config)
+        for other_routine in self.routines:
+            conflicting_actions = other_routine.conflicting_actions(routine)
+            if conflicting_actions is not None:
+                raise InconsistentRoutinesError(
+                    [other_routine, routine], conflicting_actions[0].appliance)
+
+        simulated = StateMatrix.__new__(StateMatrix)
+        simulated.appliances = self.appliances
+        simulated.routines = self.routines.append(routine)
+        simulated.config = self.config
+        simulated.registry = self.registry
+        simulated.power_table = self.power_table
+
+        # Only the cells of the actions of the new routine change.
+        # With demand response the whole day is rescheduled again by the dispatch, from the requested modes.
+        simulated.requested_matrix = self.requested_matrix.copy()
+        self.__set_modes(simulated.requested_matrix, routine)
+        simulated.requested_power_matrix = self.requested_power_matrix.copy()
+
+        if routine.enabled:
+            for action in routine.actions:
+                start, end = action_span(routine, action)
+                column = self.registry.column(action.appliance.id)
+                simulated.requested_power_matrix[start:end, column] = self.power_table[column,
+                                                                                       simulated.requested_matrix[start, column]]
+        self.__set_power(simulated.requested_power_matrix, routine)
+
+        simulated.__dispatch()
+        if check_max_power:
+            simulated.__check_max_power()
+        return simulated
 
     def total_consumption(self, when: datetime) -> float:
         """Calculate the total consumption of the house at a given time.
@@ -127,19 +431,20 @@ class StateMatrix():
             float: The total consumption of the house at the given time.
         """
         minute_of_day = when.hour * 60 + when.minute
-        row_now = self.matrix[minute_of_day]
-
-        total_consumption = 0
+        return float(self.power[minute_of_day])
 
-        for i, mode_id in enumerate(row_now):
-            if mode_id == 0:
-                continue
+    def grid_consumption(self, when: datetime) -> float:
+        """Calculate the power drawn from the grid at a given time,
+        after the generation and the battery of the house.
 
-            appliance = next(a for a in self.appliances if a.id == i)
-            mode = next(m for m in appliance.modes if m.id == mode_id)
-            total_consumption += mode.power_consumption
+        Args:
+            when (datetime): The time to calculate the consumption.
 
-        return total_consumption
+        Returns:
+            float: The power drawn from the grid, negative if fed into it.
+        """
+        minute_of_day = when.hour * 60 + when.minute
+        return float(self.net_power[minute_of_day])
 
     def consumptions(self, when: datetime) -> dict[Appliance, float]:
         """Calculate the consumption of the appliances at a given time.
@@ -152,16 +457,7 @@ class StateMatrix():
         """
 
         minute_of_day = when.hour * 60 + when.minute
-        modes_ids = self.matrix[minute_of_day]
-
-        consumptions_dict = {}
-        for appliance_id, mode_id in enumerate(modes_ids):
-            appliance = next(
-                a for a in self.appliances if a.id == appliance_id)
-            mode = next(m for m in appliance.modes if m.id == mode_id)
-            consumptions_dict[appliance] = mode.power_consumption
-
-        return consumptions_dict
+        return dict(zip(self.registry.appliances, self.power_matrix[minute_of_day].tolist()))
 
     def appliance_consumption(self, appliance: Appliance, when: datetime) -> float:
         """Calculate the consumption of a specific appliance at a given time.
@@ -175,11 +471,139 @@ class StateMatrix():
         """
 
         minute_of_day = when.hour * 60 + when.minute
-        mode_id = self.matrix[minute_of_day][appliance.id]
-        return appliance.modes[mode_id].power_consumption
+        return float(self.power_matrix[minute_of_day, self.registry.column(appliance.id)])
+
+    def mode_runs(self, include_idle: bool = False) -> ModeRuns:
+        """Find the runs of consecutive minutes in which each appliance stays in the same mode.
+        The runs of all the appliances are found at once, ordered by column and then by start.
+
+        Args:
+            include_idle (bool, optional): Whether to include the runs in which appliances are idle. Defaults to False.
+
+        Returns:
+            ModeRuns: The runs.
+        """
+        minutes = self.matrix.shape[0]
+
+        # Lay out the columns one after the other, so that a new run starts
+        # wherever the mode changes or a new column begins.
+        flat = self.matrix.T.ravel()
+        boundaries = np.ones(flat.size, dtype=bool)
+        boundaries[1:] = flat[1:] != flat[:-1]
+        boundaries[::minutes] = True
+
+        starts = np.flatnonzero(boundaries)
+        ends = np.r_[starts[1:], flat.size]
+        columns = starts // minutes
+        modes = flat[starts]
+
+        if not include_idle:
+            idle_modes = np.array([self.registry.idle_mode_index(column)
+                                   for column in range(len(self.registry))], dtype=modes.dtype)
+            active = modes != idle_modes[columns]
+            starts, ends, columns, modes = starts[active], ends[active], columns[active], modes[active]
+
+        offsets = columns * minutes
+        return ModeRuns(columns, starts - offsets, ends - offsets, modes)
+
+    def feasible_starts(self, routine: Routine) -> np.ndarray:
+        """Find every minute of the day in which a routine could start without conflicts,
+        i.e. without setting an appliance to a mode other than the one set by another routine at the same time,
+        and without exceeding the maximum power of the house. The start time of the routine is ignored.
+
+        The peak load of the house is found for every start at once, with a sliding window over the load.
+        The power is checked without the battery, whose dispatch depends on the whole day,
+        which can only reject starts that would be feasible with it, see `dt.dispatch`.
+
+        Args:
+            routine (Routine): The routine.
+
+        Returns:
+            np.ndarray: Whether the routine can start, for each minute of the day.
+        """
+        feasible = np.ones(const.MINUTES_IN_DAY, dtype=bool)
+        if not routine.enabled:
+            return feasible
+
+        feasible &= ~conflicting_starts(routine, self.routines)
+        feasible &= self.peak_loads(routine) <= self.config.max_power
+
+        return feasible
+
+    def peak_loads(self, routine: Routine) -> np.ndarray:
+        """Find the highest load of the house while a routine runs, for every start at once, as in `feasible_starts`.
+        The load is checked without the battery, and conflicts are not checked.
+
+        Args:
+            routine (Routine): The routine.
+
+        Returns:
+            np.ndarray: The highest load, in watts, for each minute of the day in which the routine could start.
+        """
+        minutes = const.MINUTES_IN_DAY
+
+        # The load of the house in the minutes the routine would run in, for each start, at once.
+        # The actions replace the power of their appliances, rather than adding to it.
+        # The load is padded after the end of the day, where the actions are cut off.
+        length = len(routine_power_vector(routine))
+        padding = np.full(length, -np.inf)
+        load = np.lib.stride_tricks.sliding_window_view(
+            np.r_[self.power - self.dispatch.generation, padding], length)[:minutes].copy()
+
+        for routine_action in routine.actions:
+            duration = routine_action.duration or minutes
+            appliance_power = np.lib.stride_tricks.sliding_window_view(
+                np.r_[self.power_matrix[:, self.registry.column(routine_action.appliance.id)], np.zeros(duration)], duration)[:minutes]
+            load[:, :duration] += mode_power_vector(routine_action.mode,
+                                                    duration) - appliance_power
+
+        return load.max(axis=1, initial=-np.inf)
+
+    def diff(self, other: StateMatrix, costs: CostsMatrix, day: date | None = None) -> MatrixDiff:
+        """Compare this matrix with another one of the same appliances, e.g. the result of `add_routine`.
+        The matrices are compared as a whole, as in `mode_runs`.
+
+        Args:
+            other (StateMatrix): The matrix to compare with.
+            costs (CostsMatrix): The costs of electricity.
+            day (date | None, optional): The day to get the prices of. Defaults to today.
+
+        Raises:
+            ValueError: The matrices are not of the same appliances.
+
+        Returns:
+            MatrixDiff: The differences from this matrix to the other one.
+        """
+        if [a.id for a in self.registry.appliances] != [a.id for a in other.registry.appliances]:
+            raise ValueError("Only matrices of the same appliances can be compared")
+
+        minutes = self.matrix.shape[0]
+        before = self.matrix.T.ravel()
+        after = other.matrix.T.ravel()
+
+        # A new run starts wherever either of the modes changes or a new column begins
+        boundaries = np.ones(before.size, dtype=bool)
+        boundaries[1:] = (before[1:] != before[:-1]) | (after[1:] != after[:-1])
+        boundaries[::minutes] = True
+
+        starts = np.flatnonzero(boundaries)
+        ends = np.r_[starts[1:], before.size]
+        changed = before[starts] != after[starts]
+        starts, ends = starts[changed], ends[changed]
+
+        columns = starts // minutes
+        offsets = columns * minutes
+
+        day = day if day is not None else date.today()
+        delta_power = other.net_power - self.net_power
+        delta_cost = costs.grid_cost(other.net_power, day) - \
+            costs.grid_cost(self.net_power, day)
+
+        return MatrixDiff(columns, starts - offsets, ends - offsets, before[starts], after[starts],
+                          delta_power, float(delta_power.sum() / 60), delta_cost)
 
     def raw_matrix(self) -> np.ndarray:
-        """Return the raw matrix.
+        """Return the raw matrix. Columns and values are indices assigned by the registry, not IDs.
 
         Returns:
             np.ndarray: The raw matrix.
@@ -193,10 +617,24 @@ class CostsMatrix:
     The consumption at each time depends on the number of energy rates,
     according to the italian energy market:
     https://www.arera.it/bolletta/glossario-dei-termini/dettaglio/fasce-orarie
+
+    Homes on a dynamic tariff can provide a series of prices, which replace the
+    energy rates in the range of time it covers.
     """
 
-    def __init__(self, config: HomeConfig) -> None:
+    def __init__(self, config: HomeConfig, tariff: TariffSeries | None = None) -> None:
+        """Constructor.
+
+        Args:
+            config (HomeConfig): The configuration of the home.
+            tariff (TariffSeries | None, optional): The dynamic prices. Defaults to the tariff file of the configuration, if any.
+        """
         self.config = config
+        self.tariff = tariff
+        self.__day_prices: dict[date, np.ndarray] = {}
+
+        if self.tariff is None and config.tariff_file is not None:
+            self.tariff = TariffSeries.from_csv(config.tariff_file)
         self.matrix = np.zeros(
             (const.DAYS_IN_WEEK, const.HOURS_IN_DAY), dtype=float)
 
@@ -231,6 +669,29 @@ class CostsMatrix:
                         self.matrix[day_of_week,
                                     7:22+1] = config.energy_rates_prices[1]
 
+    def prices(self, day: date) -> np.ndarray:
+        """Get the price of electricity in each minute of a day.
+        The prices of the tariff are used where available, the energy rates elsewhere.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            np.ndarray: The price of each minute, in €/Wh.
+        """
+        if day not in self.__day_prices:
+            prices = np.repeat(self.matrix[day.weekday()], 60)
+
+            if self.tariff is not None:
+                tariff_prices = self.tariff.day_prices(day)
+                covered = ~np.isnan(tariff_prices)
+                prices[covered] = tariff_prices[covered]
+
+            prices.setflags(write=False)
+            self.__day_prices[day] = prices
+
+        return self.__day_prices[day]
+
     def get_cost(self, when: datetime) -> float:
         """Calculate the eletricity cost at a given time.
 
@@ -238,23 +699,62 @@ class CostsMatrix:
             when (datetime): The time to calculate the cost.
 
         Returns:
-            float: The cost of the electricity at the given time.
+            float: The cost of the electricity at the given time, in €/Wh.
         """
-        return self.matrix[when.weekday(), when.hour]
+        return self.prices(when.date())[when.hour * 60 + when.minute]
 
     def get_duration_cost(self, when: datetime, duration: timedelta) -> float:
-        """Calculate the eletricity cost of a sequence of time,
-        starting from a given time and lasting for a given duration.
+        """Calculate the eletricity cost of drawing one watt for a sequence of time,
+        starting from a given time and lasting for a given duration, within the same day.
 
         Args:
             when (datetime): The start time of the sequence.
             duration (timedelta): The duration of the sequence.
 
         Returns:
-            float: The cost of the electricity for the sequence.
+            float: The cost of the electricity for the sequence, in €/W.
+        """
+        start = when.hour * 60 + when.minute
+        end = start + int(duration.total_seconds()) // 60
+        return self.prices(when.date())[start:end].sum() / 60
+
+    def energy_cost(self, power: np.ndarray, day: date) -> float:
+        """Calculate the cost of a power draw over a day.
+
+        Args:
+            power (np.ndarray): The power drawn in each minute of the day, in watts.
+            day (date): The day.
+
+        Returns:
+            float: The cost of the electricity, in €.
         """
-        return self.matrix[when.weekday(), when.hour:(
-            when + duration).hour + 1].sum()
+        return float(np.dot(power, self.prices(day))) / 60
+
+    def grid_costs(self, net_power: np.ndarray, day: date) -> np.ndarray:
+        """Calculate the cost of the power drawn from the grid in each minute of a day.
+        Power fed into the grid, i.e. negative, is neither paid nor credited, as there is no feed-in tariff.
+        This is the convention of every cost of the power drawn by the house.
+
+        Args:
+            net_power (np.ndarray): The power drawn from the grid in each minute of the day, in watts.
+            day (date): The day.
+
+        Returns:
+            np.ndarray: The cost of each minute, in €.
+        """
+        return np.maximum(net_power, 0) * self.prices(day) / 60
+
+    def grid_cost(self, net_power: np.ndarray, day: date) -> float:
+        """Calculate the cost of the power drawn from the grid over a day, as in `grid_costs`.
+
+        Args:
+            net_power (np.ndarray): The power drawn from the grid in each minute of the day, in watts.
+            day (date): The day.
+
+        Returns:
+            float: The cost, in €.
+        """
+        return self.energy_cost(np.maximum(net_power, 0), day)
 
     def raw_matrix(self) -> np.ndarray:
         """Return the raw matrix.
@@ -265,39 +765,67 @@ class CostsMatrix:
         return self.matrix
 
 
+class StartTimeOption:
+    """A start time of a routine on the Pareto front of the multi-objective optimizer.
+
+    Attributes:
+        when (datetime): The start time.
+        savings (float): The savings over the current start time, in €.
+        peak_power (float): The peak load of the house with the routine, in watts, without the battery.
+        distance (int): The minutes between the start time and the current one, which is the preferred one.
+        score (float): The weighted sum of the objectives, each scaled to [0, 1] over the front. Lower is better.
+    """
+
+    def __init__(self, when: datetime, savings: float, peak_power: float, distance: int, score: float):
+        self.when = when
+        self.savings = savings
+        self.peak_power = peak_power
+        self.distance = distance
+        self.score = score
+
+
 class RoutineOptimizer:
-    def __init__(self, state_matrix: StateMatrix, costs_matrix: CostsMatrix) -> None:
+    """Finds the cheapest time to start a routine.
+
+    The cost of a routine is the sum, over the minutes in which its actions run,
+    of the power it adds to what is drawn from the grid times the price of electricity in that minute.
+    Power covered by the generation of the house is free, so routines are moved towards its surplus.
+    The battery is not dispatched again for each start time, as its state depends on the whole day:
+    costs are those of the power drawn from the grid before the battery, which can only be higher than after it,
+    see `dt.dispatch`. The start time found is then added to the matrix, which dispatches the battery over it.
+    """
+
+    def __init__(self, state_matrix: StateMatrix, costs_matrix: CostsMatrix, day: date | None = None) -> None:
+        """Constructor.
+
+        Args:
+            state_matrix (StateMatrix): The state matrix to add the routine to.
+            costs_matrix (CostsMatrix): The costs of electricity.
+            day (date | None, optional): The day the routine runs on, to get the prices of. Defaults to today.
+        """
         self.state_matrix = state_matrix
         self.costs_matrix = costs_matrix
         self.config = state_matrix.config
+        self.day = day if day is not None else date.today()
 
     def find_best_start_time(self, routine: Routine) -> tuple[datetime, float] | None:
-        if self.config.activity_hours is not None:
-            start = self.config.activity_hours[0].hour * \
-                60 + self.config.activity_hours[0].minute
-            end = self.config.activity_hours[1].hour * \
-                60 + self.config.activity_hours[1].minute
-        else:
-            start = 0
-            end = const.MINUTES_IN_DAY
-
-        print(start)
+        start, end = self.__activity_period()
 
-        # Calculate the latest end time of the routine so that
-        # the longest running action is completed before the end of the day.
-        latest_end_time = min(
-            end - action.duration for action in routine.actions if action.duration is not None)
+        routine_power = self.__routine_power(routine)
 
-        # Calculate the cost of starting the routine at each minute of the day
-        routine_costs_per_minute = np.array([self.__routine_cost(routine, routine.when.replace(
-            hour=minute//60, minute=minute % 60)) for minute in range(0, latest_end_time+1)])
+        # Calculate the latest start time of the routine so that
+        # the longest running action is completed before the end of the activity period.
+        latest_start_time = end - len(routine_power)
+        if latest_start_time < start:
+            return None
 
-        # Calculate the cost of the original routine
+        routine_costs_per_minute = self.__routine_costs(routine_power)
         original_routine_cost = routine_costs_per_minute[routine.when.hour *
                                                          60 + routine.when.minute]
+        routine_costs_per_minute = routine_costs_per_minute[:latest_start_time + 1]
 
         # Get the list of indices of the routine costs ordered by cost
-        sorted_minutes = np.argsort(routine_costs_per_minute)
+        sorted_minutes = np.argsort(routine_costs_per_minute, kind="stable")
 
         # Iterate the ordered indices of the routine costs
         for m in sorted_minutes:
@@ -308,24 +836,242 @@ class RoutineOptimizer:
             if routine_costs_per_minute[m] >= original_routine_cost:
                 return None
 
-            old_when = routine.when
             new_when = routine.when.replace(
                 hour=m//60, minute=m % 60)
 
-            # Try to add the routine to the matrix at the new time.
+            # Try to add a copy of the routine to the matrix at the new time, leaving the routine unchanged.
             # If it fails, continue to the next iteration.
             try:
-                routine.when = new_when
-                self.state_matrix.add_routine(routine)
-                return new_when, original_routine_cost - routine_costs_per_minute[m]
+                self.state_matrix.add_routine(routine.at(new_when))
+                return new_when, float(original_routine_cost - routine_costs_per_minute[m])
             except ConflictError:
-                routine.when = old_when
                 continue
 
         return None
 
-    def __routine_cost(self, routine: Routine, when: datetime) -> float:
-        costs = [self.costs_matrix.get_duration_cost(when, timedelta(minutes=action.duration))*action.mode.power_consumption
-                 for action in routine.actions if action.duration is not None]
+    def find_approximate_start_time(self, routine: Routine, resolution: int = 15,
+                                    budget: float | None = None) -> tuple[datetime, float, float] | None:
+        """Find a cheap start time for a routine quickly, e.g. for interactive hints.
+
+        The costs are first sampled on a coarse grid, one start time for each block of `resolution` minutes,
+        and a lower bound of the cost of every start time of each block is computed from the minimum
+        power and price in the minutes the routine would run in. Blocks are then refined at minute resolution
+        in order of sampled cost, and their cheapest start times are verified exactly by adding the routine
+        to the matrix, until no other block can be cheaper or the budget is spent.
+        Start times that would exceed the maximum power with the current dispatch are not verified.
 
-        return np.sum(costs)
+        Args:
+            routine (Routine): The routine, which is not modified.
+            resolution (int, optional): The minutes of each block of the coarse grid. Defaults to 15.
+            budget (float | None, optional): The seconds after which no more blocks are refined, once a start time
+            has been verified. Defaults to None, for which blocks are refined until the result is optimal.
+
+        Returns:
+            tuple[datetime, float, float] | None: The start time, the savings, in €, and the most that a better
+            start time could save in addition, which is 0 if the start time is optimal.
+            None if no start time is cheaper than the current one.
+        """
+        deadline = time.perf_counter() + budget if budget is not None else None
+        start, end = self.__activity_period()
+
+        routine_power = self.__routine_power(routine)
+        latest_start_time = end - len(routine_power)
+        if latest_start_time < start:
+            return None
+
+        original_cost = float(self.__window_costs(
+            routine_power, np.array([routine.when.hour * 60 + routine.when.minute]))[0])
+
+        # Sample the middle of each block, and bound its costs from below
+        blocks = np.arange(start, latest_start_time + 1, resolution)
+        samples = np.minimum(blocks + resolution // 2, latest_start_time)
+        sampled_costs = self.__window_costs(routine_power, samples)
+        lower_bounds = self.__lower_bounds(routine_power, blocks, resolution)
+
+        # The grid power and the maximum power, to skip the start times that clearly exceed it
+        headroom = np.r_[self.config.max_power - self.state_matrix.net_power,
+                         np.full(len(routine_power), np.inf)]
+
+        best_start, best_cost = None, original_cost
+        # Lowest cost that a start time not proven to be more expensive or infeasible could have
+        unexplored = np.ones(len(blocks), dtype=bool)
+        skipped_cost = np.inf
+
+        for block in np.argsort(sampled_costs, kind="stable"):
+            if lower_bounds[block] >= best_cost:
+                unexplored[block] = False
+                continue
+
+            if best_start is not None and deadline is not None and time.perf_counter() > deadline:
+                break
+
+            unexplored[block] = False
+            minutes = np.arange(blocks[block], min(
+                blocks[block] + resolution, latest_start_time + 1))
+            costs = self.__window_costs(routine_power, minutes)
+            windows = minutes[:, np.newaxis] + np.arange(len(routine_power))
+            fits = (routine_power <= headroom[windows]).all(axis=1)
+
+            for index in np.argsort(costs, kind="stable"):
+                if costs[index] >= best_cost:
+                    break
+
+                if not fits[index]:
+                    skipped_cost = min(skipped_cost, float(costs[index]))
+                    continue
+
+                minute = int(minutes[index])
+                when = routine.when.replace(hour=minute // 60, minute=minute % 60)
+
+                try:
+                    self.state_matrix.add_routine(routine.at(when))
+                except ConflictError:
+                    continue
+
+                best_start, best_cost = when, float(costs[index])
+                break
+
+        if best_start is None:
+            return None
+
+        bound = min(float(lower_bounds[unexplored].min(initial=np.inf)), skipped_cost)
+        return best_start, original_cost - best_cost, max(best_cost - bound, 0.0)
+
+    def find_pareto_start_times(self, routine: Routine, cost_weight: float = 1.0, peak_weight: float = 1.0,
+                                distance_weight: float = 1.0) -> list[StartTimeOption]:
+        """Find the start times of a routine that trade off its cost, the peak load of the house and the distance
+        from the current start time, which is taken as the one preferred by the user.
+
+        Every feasible start time of the activity period is evaluated at once, and only the ones on the Pareto front
+        are kept, i.e. the ones for which no other start time is at least as good in every objective and better in one.
+        The front is ranked by a weighted sum of the objectives, each scaled to [0, 1] over the front.
+
+        Args:
+            routine (Routine): The routine, which is not modified.
+            cost_weight (float, optional): The weight of the cost. Defaults to 1.0.
+            peak_weight (float, optional): The weight of the peak load. Defaults to 1.0.
+            distance_weight (float, optional): The weight of the distance from the current start time. Defaults to 1.0.
+
+        Returns:
+            list[StartTimeOption]: The start times on the Pareto front, from the lowest score.
+        """
+        start, end = self.__activity_period()
+        # The costs and the peaks are computed on the same minutes, as actions without a duration run until
+        # the end of the day in the state matrix. Only the actions with a duration must end in the activity period.
+        routine_power = routine_power_vector(routine)
+        latest_start_time = min(end - len(self.__routine_power(routine)), const.MINUTES_IN_DAY - 1)
+        if latest_start_time < start:
+            return []
+
+        minutes = np.arange(start, latest_start_time + 1)
+        preferred = routine.when.hour * 60 + routine.when.minute
+
+        routine_costs_per_minute = self.__routine_costs(routine_power)
+        costs = routine_costs_per_minute[minutes]
+
+        # The peak of the day is the highest of the peak while the routine runs, and of the load before and after it
+        peak_loads = self.state_matrix.peak_loads(routine)
+        load = self.state_matrix.power - self.state_matrix.dispatch.generation
+        before = np.r_[-np.inf, np.maximum.accumulate(load)][minutes]
+        after = np.r_[np.maximum.accumulate(load[::-1])[::-1], -np.inf][np.minimum(
+            minutes + len(routine_power), const.MINUTES_IN_DAY)]
+        peaks = np.maximum(peak_loads[minutes], np.maximum(before, after))
+
+        feasible = ~conflicting_starts(routine, self.state_matrix.routines)[minutes] & \
+            (peak_loads[minutes] <= self.config.max_power)
+        minutes = minutes[feasible]
+        objectives = np.c_[costs[feasible], peaks[feasible],
+                           np.abs(minutes - preferred)]
+
+        # A start time is dominated if another one is at least as good in every objective, and not equal in all.
+        # The pairs are compared one objective at a time, which avoids a three-dimensional array.
+        at_least_as_good = np.ones((len(minutes), len(minutes)), dtype=bool)
+        equal = np.ones_like(at_least_as_good)
+        for objective in objectives.T:
+            at_least_as_good &= objective[:, np.newaxis] <= objective
+            equal &= objective[:, np.newaxis] == objective
+        front = ~(at_least_as_good & ~equal).any(axis=0)
+        minutes, objectives = minutes[front], objectives[front]
+        if len(minutes) == 0:
+            return []
+
+        spans = np.ptp(objectives, axis=0)
+        scaled = (objectives - objectives.min(axis=0)) / \
+            np.where(spans > 0, spans, 1)
+        scores = scaled @ np.array([cost_weight, peak_weight, distance_weight])
+
+        original_cost = routine_costs_per_minute[preferred]
+        return [StartTimeOption(routine.when.replace(hour=int(minute) // 60, minute=int(minute) % 60),
+                                float(original_cost - cost), float(peak), int(distance), float(score))
+                for minute, (cost, peak, distance), score in sorted(zip(minutes, objectives, scores), key=lambda option: option[2])]
+
+    def __activity_period(self) -> tuple[int, int]:
+        # First and last minute in which routines can run
+        if self.config.activity_hours is None:
+            return 0, const.MINUTES_IN_DAY
+
+        return (self.config.activity_hours[0].hour * 60 + self.config.activity_hours[0].minute,
+                self.config.activity_hours[1].hour * 60 + self.config.activity_hours[1].minute)
+
+    def __series(self, length: int) -> tuple[np.ndarray, np.ndarray]:
+        # Power drawn from the grid before the battery and prices, padded as in __routine_costs
+        return (np.r_[self.state_matrix.power - self.state_matrix.dispatch.generation, np.zeros(length)],
+                np.r_[self.costs_matrix.prices(self.day), np.zeros(length)])
+
+    def __window_costs(self, routine_power: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        # Costs of the routine for some start times only
+        base, prices = self.__series(len(routine_power))
+        windows = starts[:, np.newaxis] + np.arange(len(routine_power))
+
+        added_power = np.maximum(base[windows] + routine_power, 0) - \
+            np.maximum(base[windows], 0)
+        return (added_power * prices[windows]).sum(axis=1) / 60
+
+    def __lower_bounds(self, routine_power: np.ndarray, blocks: np.ndarray, resolution: int) -> np.ndarray:
+        # The added power grows with the power already drawn, so the costs of the start times of a block are
+        # bounded by the minimum power and price over the minutes each action minute can fall in
+        base, prices = self.__series(len(routine_power) + resolution)
+        min_base = np.lib.stride_tricks.sliding_window_view(
+            base, resolution).min(axis=1)
+        min_prices = np.lib.stride_tricks.sliding_window_view(
+            prices, resolution).min(axis=1)
+
+        windows = blocks[:, np.newaxis] + np.arange(len(routine_power))
+        added_power = np.maximum(min_base[windows] + routine_power, 0) - \
+            np.maximum(min_base[windows], 0)
+
+        # Negative prices are paid at most for the whole power of the routine
+        return np.where(min_prices[windows] >= 0, added_power * min_prices[windows],
+                        routine_power * min_prices[windows]).sum(axis=1) / 60
+
+    def __routine_costs(self, routine_power: np.ndarray) -> np.ndarray:
+        # Power already drawn from the grid, before the battery, and prices of the day.
+        # Both are padded, so that routines running past the end of the day are only costed until midnight.
+        length = len(routine_power)
+        base = np.r_[self.state_matrix.power -
+                     self.state_matrix.dispatch.generation, np.zeros(length)]
+        prices = np.r_[self.costs_matrix.prices(self.day), np.zeros(length)]
+
+        # Windows of the minutes the routine would run in, for each start time, at once
+        base_windows = np.lib.stride_tricks.sliding_window_view(base, length)[
+            :const.MINUTES_IN_DAY]
+        price_windows = np.lib.stride_tricks.sliding_window_view(prices, length)[
+            :const.MINUTES_IN_DAY]
+
+        # Only the power that is not covered by the generation is paid for
+        added_power = np.maximum(base_windows + routine_power, 0) - \
+            np.maximum(base_windows, 0)
+        return (added_power * price_windows).sum(axis=1) / 60
+
+    def __routine_power(self, routine: Routine) -> np.ndarray:
+        # Power drawn by the actions with a duration in each minute since the start of the routine
+        durations = [
+            action.duration for action in routine.actions if action.duration]
+        power = np.zeros(max(durations, default=0))
+
+        for action in routine.actions:
+            if action.duration:
+                power[:action.duration] += mode_power_vector(
+                    action.mode, action.duration)
+
+        return power
@@ -0,0 +1,204 @@
+"""Columnar export of the simulations, for analytics.
+
+The state of a home over a range of days is exported as a table with one row for each minute and the following columns:
+- `timestamp`: the start of the minute.
+- `load`, `generation`, `battery_power`, `state_of_charge` and `net_power`: the dispatch of the home, in watts (Wh for the charge).
+- `price` and `cost`: the price of electricity, in €/Wh, and the cost of the power drawn from the grid in the minute, in €,
+  where the power fed into the grid is not credited.
+- `mode_<id>` and `power_<id>`: the ID of the mode of each appliance, and the power it draws, in watts.
+
+Each home is written to its own directory, with one file for each exported range of days, so that
+the homes of a fleet can be exported in parallel and new days can be appended without rewriting the older ones.
+The supported formats are:
+- `npz`: compressed NumPy archives, always available. Each column can be decompressed on its own, e.g. with `np.load`.
+- `parquet`: compressed Parquet files, readable as a single dataset by most analytics tools. Requires pyarrow.
+- `arrow`: uncompressed Arrow IPC files, which are memory-mapped when read, so columns are reloaded without copies.
+Requires pyarrow.
+
+The results of the batch optimizations can be written in the same formats, as a table with one row for each routine.
+"""
+
+from datetime import date
+import os
+from typing import Any
+
+import numpy as np
+
+from dt.energy import CostsMatrix
+from dt.timeline import Timeline
+from dt import const
+
+EXPORT_FORMATS = ("npz", "parquet", "arrow")
+
+
+def home_columns(timeline: Timeline, costs: CostsMatrix, start: date, end: date) -> dict[str, np.ndarray]:
+    """Get the columns of the state of a home over a range of days.
+
+    Args:
+        timeline (Timeline): The timeline of the home.
+        costs (CostsMatrix): The costs of electricity.
+        start (date): The first day.
+        end (date): The day after the last one.
+
+    Returns:
+        dict[str, np.ndarray]: The columns, by name, with one value for each minute.
+    """
+    days = max((end - start).days, 0)
+    minutes = days * const.MINUTES_IN_DAY
+    registry = timeline.matrix(start).registry if days else None
+
+    columns: dict[str, np.ndarray] = {
+        "timestamp": (np.datetime64(start, "m") + np.arange(minutes)).astype("datetime64[s]")}
+    for name in ["load", "generation", "battery_power", "state_of_charge", "net_power"]:
+        columns[name] = np.empty(minutes, dtype=np.float32)
+    columns["price"] = np.empty(minutes)
+    columns["cost"] = np.empty(minutes)
+
+    if registry is None:
+        return columns
+
+    # Mode ID of each mode index, by column, for the mode columns
+    mode_ids = np.zeros((len(registry), max(len(a.modes) for a in registry.appliances)), dtype=np.int16)
+    for column, appliance in enumerate(registry.appliances):
+        mode_ids[column, :len(appliance.modes)] = [mode.id for mode in appliance.modes]
+
+    modes = np.empty((minutes, len(registry)), dtype=np.int16)
+    power = np.empty((minutes, len(registry)), dtype=np.float32)
+
+    for index, (day, matrix) in enumerate(timeline.days(start, end)):
+        rows = slice(index * const.MINUTES_IN_DAY, (index + 1) * const.MINUTES_IN_DAY)
+        dispatch = matrix.dispatch
+
+        columns["load"][rows] = dispatch.load
+        columns["generation"][rows] = dispatch.generation
+        columns["battery_power"][rows] = dispatch.battery_power
+        columns["state_of_charge"][rows] = dispatch.state_of_charge
+        columns["net_power"][rows] = dispatch.net_power
+        columns["price"][rows] = costs.prices(day)
+        columns["cost"][rows] = costs.grid_costs(dispatch.net_power, day)
+        modes[rows] = mode_ids[np.arange(len(registry)), matrix.matrix]
+        power[rows] = matrix.power_matrix
+
+    for column, appliance in enumerate(registry.appliances):
+        columns[f"mode_{appliance.id}"] = modes[:, column]
+        columns[f"power_{appliance.id}"] = power[:, column]
+
+    return columns
+
+
+def results_columns(results: list[dict[str, Any]]) -> dict[str, np.ndarray]:
+    """Get the columns of a list of results, e.g. of the batch optimizations.
+    Numeric fields become float columns with NaN for missing values, the others string columns.
+
+    Args:
+        results (list[dict[str, Any]]): The results, with the same fields.
+
+    Returns:
+        dict[str, np.ndarray]: The columns, by name.
+    """
+    fields = list(results[0]) if results else []
+    columns = {}
+
+    for field in fields:
+        values = [result[field] for result in results]
+
+        if all(value is None or isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            columns[field] = np.array([np.nan if value is None else value for value in values], dtype=float)
+        else:
+            columns[field] = np.array(["" if value is None else str(value) for value in values])
+
+    return columns
+
+
+def write_columns(columns: dict[str, np.ndarray], filepath: str, format: str | None = None) -> str:
+    """Write columns to a file.
+
+    Args:
+        columns (dict[str, np.ndarray]): The columns, by name, all with the same length.
+        filepath (str): The path of the file. Its directory is created if it does not exist.
+        format (str | None, optional): One of `EXPORT_FORMATS`. Defaults to the extension of the file.
+
+    Raises:
+        ValueError: The format is not supported.
+        ImportError: The format requires pyarrow, which is not installed.
+
+    Returns:
+        str: The path of the file.
+    """
+    format = format or os.path.splitext(filepath)[1].lstrip(".")
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
+    if format == "npz":
+        np.savez_compressed(filepath, **columns)
+        return filepath
+
+    pa = __import_pyarrow(format)
+    table = pa.table(columns)
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, filepath, compression="zstd")
+    else:
+        with pa.OSFile(filepath, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    return filepath
+
+
+def read_columns(filepath: str) -> dict[str, np.ndarray]:
+    """Read the columns of an exported file, in the format of its extension.
+    Arrow files are memory-mapped, so their numeric columns are not copied.
+
+    Args:
+        filepath (str): The path of the file.
+
+    Returns:
+        dict[str, np.ndarray]: The columns, by name.
+    """
+    format = os.path.splitext(filepath)[1].lstrip(".")
+
+    if format == "npz":
+        with np.load(filepath) as archive:
+            return {name: archive[name] for name in archive.files}
+
+    pa = __import_pyarrow(format)
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(filepath)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(filepath, "r")).read_all()
+
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def export_home(timeline: Timeline, costs: CostsMatrix, start: date, end: date, output_dir: str, home: str,
+                format: str = "npz") -> str:
+    """Export the state of a home over a range of days, to a file in the directory of the home.
+
+    Args:
+        timeline (Timeline): The timeline of the home.
+        costs (CostsMatrix): The costs of electricity.
+        start (date): The first day.
+        end (date): The day after the last one.
+        output_dir (str): The directory of the fleet.
+        home (str): The name of the home, and of its directory.
+        format (str, optional): One of `EXPORT_FORMATS`. Defaults to "npz".
+
+    Returns:
+        str: The path of the written file.
+    """
+    filepath = os.path.join(output_dir, home, f"{start.isoformat()}_{end.isoformat()}.{format}")
+    return write_columns(home_columns(timeline, costs, start, end), filepath, format)
+
+
+def __import_pyarrow(format: str):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(f"The {format} format requires pyarrow, e.g. pip install pyarrow") from None
+
+    return pa
@@ -0,0 +1,319 @@
+"""Measured consumption of a home, compared with the digital twin.
+
+The readings of the meter of a home are stored as the average power drawn from the grid in each minute,
+in a binary file that is memory-mapped, so that histories of many years can be queried without loading
+them in memory. The file layout is the following:
+- 8 bytes of magic number, which also encodes the format version.
+- 8 bytes with the first day of the history, as a little-endian proleptic Gregorian ordinal.
+- One row of 1440 little-endian float32 values for each day, in watts, NaN where there is no reading.
+
+The file grows by whole days as newer readings are ingested. Readings are read in chunks, from a CSV file
+with a `timestamp,power` header or from any iterable, e.g. a live stream, so large exports are never loaded at once.
+"""
+
+from __future__ import annotations
+import csv
+from datetime import date, datetime, timedelta
+from itertools import islice
+import os
+import struct
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from dt.energy import find_runs
+from dt import const
+
+METER_MAGIC = b"DTMETR01"
+METER_HEADER = struct.Struct("<8sq")
+
+
+class MeterComparison:
+    """The differences between the measured power and the power simulated by the digital twin.
+    Only the minutes with a reading are compared.
+
+    Attributes:
+        minutes (int): The number of compared minutes.
+        mean_absolute_error (float): The mean absolute error, in watts.
+        root_mean_squared_error (float): The root mean squared error, in watts.
+        bias (float): The mean of the simulated power minus the measured one, in watts.
+        energy_error (float): The simulated energy minus the measured one, in Wh.
+        daily_errors (np.ndarray): The mean absolute error of each day, in watts, NaN for days without readings.
+        divergent_intervals (list[tuple[datetime, datetime]]): The intervals in which the twin diverges from the measures.
+    """
+
+    def __init__(self, minutes: int, mean_absolute_error: float, root_mean_squared_error: float, bias: float,
+                 energy_error: float, daily_errors: np.ndarray, divergent_intervals: list[tuple[datetime, datetime]]):
+        self.minutes = minutes
+        self.mean_absolute_error = mean_absolute_error
+        self.root_mean_squared_error = root_mean_squared_error
+        self.bias = bias
+        self.energy_error = energy_error
+        self.daily_errors = daily_errors
+        self.divergent_intervals = divergent_intervals
+
+
+class MeterHistory:
+    """The history of the readings of the meter of a home, backed by a memory-mapped file.
+
+    Attributes:
+        filepath (str): The path to the file.
+        start (date): The first day of the history.
+    """
+
+    def __init__(self, filepath: str):
+        """Open an existing history.
+
+        Args:
+            filepath (str): The path to the file.
+
+        Raises:
+            ValueError: The file is not a meter history.
+        """
+        with open(filepath, "rb") as f:
+            magic, start = METER_HEADER.unpack(f.read(METER_HEADER.size))
+
+        if magic != METER_MAGIC:
+            raise ValueError(f"{filepath} is not a meter history file")
+
+        self.filepath = filepath
+        self.start = date.fromordinal(start)
+        self.__readings: np.ndarray | None = None
+        self.__map()
+
+    @staticmethod
+    def create(filepath: str, start: date) -> MeterHistory:
+        """Create an empty history, replacing the file if it exists.
+
+        Args:
+            filepath (str): The path to the file.
+            start (date): The first day of the history.
+
+        Returns:
+            MeterHistory: The history.
+        """
+        with open(filepath, "wb") as f:
+            f.write(METER_HEADER.pack(METER_MAGIC, start.toordinal()))
+
+        return MeterHistory(filepath)
+
+    @property
+    def days(self) -> int:
+        """The number of days in the history."""
+        return 0 if self.__readings is None else self.__readings.shape[0]
+
+    @property
+    def readings(self) -> np.ndarray:
+        """The readings, with shape (days, minutes), in watts. NaN where there is no reading."""
+        if self.__readings is None:
+            return np.empty((0, const.MINUTES_IN_DAY), dtype=np.float32)
+
+        return self.__readings
+
+    def day(self, day: date) -> np.ndarray:
+        """Get the readings of a day.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            np.ndarray: The power drawn in each minute, in watts, NaN where there is no reading.
+        """
+        index = (day - self.start).days
+        if not 0 <= index < self.days:
+            return np.full(const.MINUTES_IN_DAY, np.nan, dtype=np.float32)
+
+        return self.readings[index]
+
+    def ingest(self, readings: Iterable[tuple[datetime, float]], chunk_size: int = 100_000) -> int:
+        """Store readings, in chunks. Readings of the same minute within a chunk are averaged,
+        and replace the readings of that minute stored before.
+
+        Args:
+            readings (Iterable[tuple[datetime, float]]): The time and the power of each reading, in watts.
+            The times are naive, in the local time of the home, as the days of the digital twin.
+            chunk_size (int, optional): The number of readings processed at once. Defaults to 100000.
+
+        Raises:
+            ValueError: A reading is older than the start of the history, or its time has a timezone.
+
+        Returns:
+            int: The number of ingested readings.
+        """
+        origin = datetime.combine(self.start, datetime.min.time())
+        iterator = iter(readings)
+        count = 0
+
+        while chunk := list(islice(iterator, chunk_size)):
+            try:
+                minutes = np.fromiter(((when - origin) // timedelta(minutes=1) for when, _ in chunk),
+                                      dtype=np.int64, count=len(chunk))
+            except TypeError as e:
+                # Aware times can't be subtracted from the naive origin
+                raise ValueError(
+                    "Readings must have naive times, in the local time of the home") from e
+            power = np.fromiter((power for _, power in chunk),
+                                dtype=float, count=len(chunk))
+
+            if minutes.min() < 0:
+                raise ValueError(
+                    f"Readings before {self.start} can't be stored in the history")
+
+            self.__grow(int(minutes.max()) // const.MINUTES_IN_DAY + 1)
+
+            # Average the readings of the same minute
+            unique_minutes, inverse = np.unique(minutes, return_inverse=True)
+            sums = np.bincount(inverse, weights=power)
+            counts = np.bincount(inverse)
+            self.readings.reshape(-1)[unique_minutes] = sums / counts
+
+            count += len(chunk)
+
+        if self.__readings is not None:
+            self.__readings.flush()
+
+        return count
+
+    def compare(self, simulated: np.ndarray | Callable[[date], np.ndarray], start: date | None = None, end: date | None = None,
+                threshold: float = 500, min_duration: int = 5, chunk_days: int = 32) -> MeterComparison:
+        """Compare the readings of a range of days with the power simulated by the twin.
+
+        The range is clamped to the days of the history, and is compared in chunks of days,
+        so that only a chunk of the readings and of the simulated power is in memory at once.
+
+        Args:
+            simulated (np.ndarray | Callable[[date], np.ndarray]): The power drawn from the grid in each minute,
+            as simulated by the twin, in watts. Either a single day, compared with every day, one row for each day
+            from `start`, or a function returning the power of a day, called only for the compared days.
+            start (date | None, optional): The first day to compare. Defaults to the start of the history.
+            end (date | None, optional): The day after the last one to compare. Defaults to the end of the history.
+            threshold (float, optional): The difference, in watts, above which the twin diverges. Defaults to 500.
+            min_duration (int, optional): The minimum number of consecutive divergent minutes of an interval. Defaults to 5.
+            chunk_days (int, optional): The number of days compared at once. Defaults to 32.
+
+        Returns:
+            MeterComparison: The comparison.
+        """
+        # Rows of the simulated power are counted from the requested start, which can precede the history
+        requested = (start - self.start).days if start is not None else 0
+        first = max(requested, 0)
+        last = max(min((end - self.start).days if end is not None else self.days, self.days), first)
+
+        minutes = 0
+        absolute_sum = squared_sum = error_sum = 0.0
+        daily_errors = np.empty(last - first)
+        run_starts: list[int] = []
+        run_ends: list[int] = []
+
+        for chunk_start in range(first, last, chunk_days):
+            chunk_end = min(chunk_start + chunk_days, last)
+
+            if callable(simulated):
+                chunk_simulated = np.array([simulated(self.start + timedelta(days=day))
+                                            for day in range(chunk_start, chunk_end)])
+            elif simulated.ndim == 1:
+                # A single simulated day is broadcast over every measured day
+                chunk_simulated = simulated
+            else:
+                chunk_simulated = simulated[chunk_start -
+                                            requested:chunk_end - requested]
+
+            errors = chunk_simulated - self.readings[chunk_start:chunk_end]
+            valid = ~np.isnan(errors)
+            valid_errors = errors[valid]
+
+            minutes += valid_errors.size
+            absolute_sum += float(np.abs(valid_errors).sum())
+            squared_sum += float(np.square(valid_errors).sum())
+            error_sum += float(valid_errors.sum())
+
+            with np.errstate(invalid="ignore"):
+                daily_errors[chunk_start - first:chunk_end - first] = np.nansum(
+                    np.abs(errors), axis=1) / valid.sum(axis=1)
+
+            # Runs are counted in minutes from the first compared day, and joined across the chunks
+            divergent = (np.abs(np.nan_to_num(errors)) > threshold).ravel()
+            chunk_starts, chunk_ends = find_runs(divergent)
+            offset = (chunk_start - first) * const.MINUTES_IN_DAY
+            chunk_starts, chunk_ends = (chunk_starts + offset).tolist(), (chunk_ends + offset).tolist()
+
+            if run_ends and chunk_starts and run_ends[-1] == chunk_starts[0]:
+                run_ends[-1] = chunk_ends.pop(0)
+                chunk_starts.pop(0)
+
+            run_starts.extend(chunk_starts)
+            run_ends.extend(chunk_ends)
+
+        origin = datetime.combine(self.start, datetime.min.time()) + timedelta(days=first)
+        intervals = [(origin + timedelta(minutes=run_start), origin + timedelta(minutes=run_end))
+                     for run_start, run_end in zip(run_starts, run_ends) if run_end - run_start >= min_duration]
+
+        if minutes == 0:
+            return MeterComparison(0, float("nan"), float("nan"), float("nan"), 0.0, daily_errors, intervals)
+
+        return MeterComparison(minutes, absolute_sum / minutes, float(np.sqrt(squared_sum / minutes)),
+                               error_sum / minutes, error_sum / 60, daily_errors, intervals)
+
+    def __grow(self, days: int) -> None:
+        if days <= self.days:
+            return
+
+        # Append the missing days, without readings
+        with open(self.filepath, "ab") as f:
+            f.write(np.full((days - self.days) * const.MINUTES_IN_DAY,
+                    np.nan, dtype="<f4").tobytes())
+
+        self.__map()
+
+    def __map(self) -> None:
+        if self.__readings is not None:
+            self.__readings.flush()
+
+        days = (os.path.getsize(self.filepath) - METER_HEADER.size) // (
+            const.MINUTES_IN_DAY * 4)
+        self.__readings = np.memmap(self.filepath, dtype="<f4", mode="r+", offset=METER_HEADER.size,
+                                    shape=(days, const.MINUTES_IN_DAY)) if days > 0 else None
+
+
+def read_meter_csv(filepath: str) -> Iterator[tuple[datetime, float]]:
+    """Read the readings of a meter from a CSV file, lazily.
+    Timestamps with an offset, e.g. `2024-03-01T10:00:00+01:00`, are read as the local time they show,
+    i.e. the offset is dropped, as the meter is in the home.
+
+    Args:
+        filepath (str): The path to the CSV file, with a `timestamp,power` header and the power in watts.
+
+    Yields:
+        tuple[datetime, float]: The naive time and the power of each reading.
+    """
+    with open(filepath, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            yield datetime.fromisoformat(row["timestamp"]).replace(tzinfo=None), float(row["power"])
+
+
+def ingest_meter_csv(csv_file: str, history_file: str, chunk_size: int = 100_000) -> MeterHistory:
+    """Store the readings of a CSV file in a history, which is created if it does not exist.
+    A new history starts from the day of the first reading.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        history_file (str): The path to the history file.
+        chunk_size (int, optional): The number of readings processed at once. Defaults to 100000.
+
+    Returns:
+        MeterHistory: The history.
+    """
+    readings = read_meter_csv(csv_file)
+
+    if os.path.exists(history_file):
+        history = MeterHistory(history_file)
+    else:
+        first = next(readings, None)
+        if first is None:
+            raise ValueError(f"No readings found in {csv_file}")
+
+        history = MeterHistory.create(history_file, first[0].date())
+        history.ingest([first])
+
+    history.ingest(readings, chunk_size)
+    return history
@@ -5,16 +5,13 @@
 This script plots the consumptions matrix of the appliances in the database.
 """
 
-import datetime
+from concurrent.futures import ProcessPoolExecutor
 import os
-from pdb import run
-from fastapi import background
 import matplotlib
+from matplotlib.axes import Axes
 from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
-from matplotlib import cm
-from matplotlib import patheffects
-import matplotlib.patches as mpatches
 import numpy as np
 
 from dt.config import Config, HomeConfig
@@ -22,7 +19,7 @@ from dt.data import RepositoryFactory, Appliance, Routine, DataRepository
 from dt.energy import StateMatrix, CostsMatrix
 from dt.const import MINUTES_IN_DAY
 
-matplotlib.use("GTK4Agg")
+INTERACTIVE_BACKEND = "GTK4Agg"
 
 SAVE = True
 
@@ -38,62 +35,93 @@ def __get_appliance_name(appliance: Appliance):
     return f"{appliance.device.title()}"
 
 
-def __prepare_matrix_figure(appliances: list[Appliance], routines: list[Routine], config: HomeConfig, title: str = "Consumptions"):
-    sorted_appliances = list(sorted(appliances, key=lambda a: a.id))
+def __draw_state_matrix(ax: Axes, state_matrix: StateMatrix):
+    sorted_appliances = state_matrix.registry.appliances
     appliances_names = [__get_appliance_name(a) for a in sorted_appliances]
     hours_in_day = [f"{h:02d}:00" for h in range(0, 24)]
 
-    matrix_raw = StateMatrix(appliances, routines, config).raw_matrix()
-    matrix_masked = np.ma.masked_where(matrix_raw == 0, matrix_raw)
+    matrix_raw = state_matrix.raw_matrix()
+    idle_modes = np.array([state_matrix.registry.idle_mode_index(column)
+                          for column in range(len(sorted_appliances))])
+    matrix_masked = np.ma.masked_where(matrix_raw == idle_modes, matrix_raw)
 
     c_map = ListedColormap(["#aaaaaa"])
     c_map.set_bad('whitesmoke')
 
-    plt.figure(title, figsize=(10, 10))
-    plt.matshow(matrix_masked, fignum=plt.gcf().number,  # type: ignore
-                aspect="auto", cmap=c_map)
-
-    for appliance_id, column in enumerate(matrix_raw.T):
-        sequences = []
-        start = -1
-        end = -1
-
-        for j, value in enumerate(column):
-            if value != 0:
-                if start == -1:
-                    start = j
-                end = j
-            elif start != -1:
-                sequences.append((start, end))
-                start = -1
-                end = -1
-
-        if start != -1:
-            sequences.append((start, end))
-
-        # Compute middle points of sequences
-        middle_points = [(start + end) // 2 for start, end in sequences]
-        appliance_modes = sorted_appliances[appliance_id].modes
-
-        for m in middle_points:
-            mode = next(
-                mode for mode in appliance_modes if mode.id == column[m])
-            plt.text(appliance_id, m, mode.name.title(), ha="center", va="center", color="k", bbox=dict(boxstyle="round", facecolor='w', edgecolor='#aaaaaa',pad=0.3))
-
-    plt.xticks(range(len(appliances)), appliances_names,
-               rotation=45, ha="left", rotation_mode="anchor")
-    plt.yticks(range(0, MINUTES_IN_DAY, 60), hours_in_day)
+    ax.matshow(matrix_masked, aspect="auto", cmap=c_map)
+
+    # Label each run of non-idle modes at its middle point
+    runs = state_matrix.mode_runs()
+    middle_points = (runs.starts + runs.ends - 1) // 2
+
+    for column, m, mode_index in zip(runs.columns.tolist(), middle_points.tolist(), runs.modes.tolist()):
+        mode = sorted_appliances[column].modes[mode_index]
+        ax.text(column, m, mode.name.title(), ha="center", va="center", color="k", bbox=dict(boxstyle="round", facecolor='w', edgecolor='#aaaaaa',pad=0.3))
+
+    ax.set_xticks(range(len(sorted_appliances)), appliances_names,
+                  rotation=45, ha="left", rotation_mode="anchor")
+    ax.set_yticks(range(0, MINUTES_IN_DAY, 60), hours_in_day)
 
     # Gridlines
-    plt.xticks(np.arange(len(appliances))-0.5, minor=True)
-    plt.yticks(np.arange(0, MINUTES_IN_DAY, 60)-0.5, minor=True)
-    plt.grid(which="minor", color="k", linestyle="--", linewidth=1, alpha=0.4)
-    plt.tick_params(which="minor", top=False, bottom=False, left=False)
-    plt.tick_params(bottom=False)
+    ax.set_xticks(np.arange(len(sorted_appliances))-0.5, minor=True)
+    ax.set_yticks(np.arange(0, MINUTES_IN_DAY, 60)-0.5, minor=True)
+    ax.grid(which="minor", color="k", linestyle="--", linewidth=1, alpha=0.4)
+    ax.tick_params(which="minor", top=False, bottom=False, left=False)
+    ax.tick_params(bottom=False)
 
-    plt.tight_layout()
+
+def __prepare_matrix_figure(appliances: list[Appliance], routines: list[Routine], config: HomeConfig, title: str = "Consumptions"):
+    fig = plt.figure(title, figsize=(10, 10))
+    __draw_state_matrix(fig.add_subplot(), StateMatrix(appliances, routines, config))
+
+    fig.tight_layout()
     if SAVE:
-        plt.savefig(f"{title}.png", dpi=300, transparent=True)
+        fig.savefig(f"{title}.png", dpi=300, transparent=True)
+
+
+def render_state_matrix(state_matrix: StateMatrix, filepath: str, dpi: int = 100):
+    """Render the map of the appliances modes to a file, without showing it.
+    The figure is not managed by pyplot, so this works with any backend,
+    and it can be called from multiple processes at the same time.
+
+    Args:
+        state_matrix (StateMatrix): The state matrix to render.
+        filepath (str): The path of the file to write. The format is inferred from the extension, e.g. PNG or SVG.
+        dpi (int, optional): The resolution of raster formats. Defaults to 100.
+    """
+    fig = Figure(figsize=(10, 10))
+    __draw_state_matrix(fig.add_subplot(), state_matrix)
+
+    fig.tight_layout()
+    fig.savefig(filepath, dpi=dpi, transparent=True)
+
+
+def render_homes(homes: dict[str, StateMatrix], output_dir: str, file_format: str = "png", dpi: int = 100, workers: int = 1) -> list[str]:
+    """Render the maps of the appliances modes of many homes, one file for each home.
+
+    Args:
+        homes (dict[str, StateMatrix]): The state matrices to render, by home name. The name is used as file name.
+        output_dir (str): The directory to write the files to. It is created if it does not exist.
+        file_format (str, optional): The format of the files, e.g. "png" or "svg". Defaults to "png".
+        dpi (int, optional): The resolution of raster formats. Defaults to 100.
+        workers (int, optional): The number of processes rendering in parallel. Defaults to 1.
+
+    Returns:
+        list[str]: The paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = [os.path.join(output_dir, f"{name}.{file_format}")
+                 for name in homes]
+
+    if workers <= 1:
+        for state_matrix, filepath in zip(homes.values(), filepaths):
+            render_state_matrix(state_matrix, filepath, dpi)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_state_matrix, homes.values(),
+                 filepaths, [dpi] * len(filepaths)))
+
+    return filepaths
 
 
 def plot_state_matrix(repository: DataRepository, config: HomeConfig):
@@ -113,6 +141,10 @@ def plot_simulated_matrix(repository: DataRepository, config: HomeConfig):
 
 
 def run_plots():
+    # The interactive backend is only selected when showing the plots,
+    # so that importing this module works on headless machines.
+    matplotlib.use(INTERACTIVE_BACKEND)
+
     config = Config.from_toml(os.environ["DT_CONFIG_FILE"])
     repository = RepositoryFactory.create(config.database_config)
 
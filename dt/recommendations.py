@@ -0,0 +1,204 @@
+"""Recommendations to resolve the exceeding of the maximum power of the house.
+
+When a new routine would make the house draw more than its maximum power, the resolver looks for
+the smallest changes to the routines that bring the load back under the maximum, in every minute:
+- disabling a minimal set of routines, i.e. no smaller set included in it would be enough;
+- shifting a single routine, the new one included, to the nearest start time where it fits.
+
+Each routine is reduced to its contribution to the load, i.e. the power it adds over the idle modes
+of its appliances in each minute. A set of routines resolves the problem if its contributions cover
+the excess power in each of the minutes over the maximum, which is checked for all the sets
+of the same size at once. Only the routines contributing to those minutes are considered.
+
+The load is checked without the battery, as in `StateMatrix.feasible_starts`, so the resolutions keep the house
+under its maximum power with the battery as well, but they may change more routines than needed.
+The costs of the resolutions are also those of the load before the battery, see `dt.dispatch`.
+"""
+
+from datetime import date, datetime
+from itertools import combinations
+
+import numpy as np
+
+from dt.data import Routine
+from dt.energy import CostsMatrix, StateMatrix, action_span, conflicting_starts, mode_power_vector
+from dt import const
+
+
+class Resolution:
+    """A change to the routines that keeps the house under its maximum power.
+
+    Attributes:
+        disabled (list[Routine]): The routines to disable, empty if a routine is shifted instead.
+        shifted (Routine | None): The routine to shift, None if routines are disabled instead.
+        when (datetime | None): The new start time of the shifted routine.
+        comfort_loss (int): The minutes of running time lost by disabling, or the minutes a routine is shifted by.
+        cost_delta (float): The difference of the cost of the energy drawn by the routines, in €.
+    """
+
+    def __init__(self, disabled: list[Routine], shifted: Routine | None, when: datetime | None, comfort_loss: int, cost_delta: float):
+        self.disabled = disabled
+        self.shifted = shifted
+        self.when = when
+        self.comfort_loss = comfort_loss
+        self.cost_delta = cost_delta
+
+
+class ConflictResolver:
+    """Finds the resolutions of the exceeding of the maximum power caused by a new routine.
+    """
+
+    def __init__(self, state_matrix: StateMatrix, costs_matrix: CostsMatrix, day: date | None = None,
+                 max_set_size: int = 2, max_candidates: int = 16):
+        """Constructor.
+
+        Args:
+            state_matrix (StateMatrix): The state matrix of the current routines.
+            costs_matrix (CostsMatrix): The costs of electricity.
+            day (date | None, optional): The day to get the prices of. Defaults to today.
+            max_set_size (int, optional): The largest number of routines to disable together. Defaults to 2.
+            max_candidates (int, optional): The number of routines, contributing the most to the excess, that are considered. Defaults to 16.
+        """
+        self.state_matrix = state_matrix
+        self.costs_matrix = costs_matrix
+        self.day = day if day is not None else date.today()
+        self.max_set_size = max_set_size
+        self.max_candidates = max_candidates
+
+        registry = state_matrix.registry
+        self.idle_power = np.array([state_matrix.power_table[column, registry.idle_mode_index(column)]
+                                    for column in range(len(registry))])
+
+    def resolve(self, routine: Routine, limit: int = 5) -> list[Resolution]:
+        """Find the resolutions for the addition of a routine, ranked by comfort loss and then by cost.
+
+        Args:
+            routine (Routine): The new routine.
+            limit (int, optional): The maximum number of resolutions. Defaults to 5.
+
+        Returns:
+            list[Resolution]: The resolutions, empty if the maximum power is not exceeded or no resolution is found.
+        """
+        routines = [r for r in self.state_matrix.routines if r.enabled] + [routine]
+        contributions = np.array([self.__contribution(r) for r in routines])
+        prices = self.costs_matrix.prices(self.day)
+        max_power = self.state_matrix.config.max_power
+
+        load = self.idle_power.sum() + contributions.sum(axis=0) - \
+            self.state_matrix.dispatch.generation
+        exceeding = load > max_power
+        if not exceeding.any():
+            return []
+
+        excess = load[exceeding] - max_power
+
+        # Only the routines that contribute the most to the exceeding minutes can resolve them
+        relevance = contributions[:, exceeding].clip(min=0).sum(axis=1)
+        candidates = [index for index in np.argsort(-relevance, kind="stable")[:self.max_candidates]
+                      if relevance[index] > 0]
+
+        resolutions = self.__disable_resolutions(
+            routines, contributions, candidates, exceeding, excess, prices)
+        resolutions += [resolution for index in candidates
+                        if (resolution := self.__shift_resolution(routines, index, load - contributions[index], prices)) is not None]
+
+        resolutions.sort(key=lambda r: (r.comfort_loss, r.cost_delta))
+        return resolutions[:limit]
+
+    def __disable_resolutions(self, routines: list[Routine], contributions: np.ndarray, candidates: list[int],
+                              exceeding: np.ndarray, excess: np.ndarray, prices: np.ndarray) -> list[Resolution]:
+        # The new routine is the one being simulated, so it is not disabled
+        candidates = np.array(
+            [index for index in candidates if index != len(routines) - 1], dtype=int)
+        covered = contributions[candidates][:, exceeding]
+        solutions: list[np.ndarray] = []
+
+        for size in range(1, min(self.max_set_size, len(candidates)) + 1):
+            sets = np.array(list(combinations(range(len(candidates)), size)))
+
+            # Skip the supersets of the solutions already found, which are not minimal
+            minimal = np.ones(len(sets), dtype=bool)
+            for solution in solutions:
+                minimal &= np.isin(sets, solution).sum(axis=1) < len(solution)
+            sets = sets[minimal]
+
+            resolving = (covered[sets].sum(axis=1) >= excess).all(axis=1)
+            solutions += list(sets[resolving])
+
+        resolutions = []
+        for solution in solutions:
+            indices = candidates[solution]
+            disabled = [routines[index] for index in indices]
+            lost_minutes = sum(end - start for r in disabled for action in r.actions
+                               for start, end in [action_span(r, action)])
+            cost = float(contributions[indices].sum(axis=0) @ prices) / 60
+            resolutions.append(Resolution(
+                disabled, None, None, lost_minutes, -cost))
+
+        return resolutions
+
+    def __shift_resolution(self, routines: list[Routine], index: int, load: np.ndarray, prices: np.ndarray) -> Resolution | None:
+        routine = routines[index]
+        minutes = const.MINUTES_IN_DAY
+        max_power = self.state_matrix.config.max_power
+        start = routine.when.hour * 60 + routine.when.minute
+
+        # Contribution of the routine in each minute since its start
+        profile = self.__relative_contribution(routine)
+        length = len(profile)
+        if length == 0:
+            return None
+
+        # Load under the routine for each start at once, padded after the end of the day
+        windows = np.lib.stride_tricks.sliding_window_view(
+            np.r_[load, np.full(length, -np.inf)], length)[:minutes]
+        fits = (windows + profile).max(axis=1) <= max_power
+
+        # The minutes outside the routine must be under the maximum as well
+        exceeding = np.r_[0, np.cumsum(load > max_power)]
+        starts = np.arange(minutes)
+        inside = exceeding[np.minimum(
+            starts + length, minutes)] - exceeding[starts]
+        fits &= inside == exceeding[-1]
+
+        others = routines[:index] + routines[index + 1:]
+        fits &= ~conflicting_starts(routine, others)
+        fits[start] = False
+
+        if not fits.any():
+            return None
+
+        # The nearest start, the earliest one on ties
+        distances = np.where(fits, np.abs(starts - start), minutes)
+        new_start = int(np.argmin(distances))
+
+        cost_delta = (self.__cost(profile, new_start, prices) -
+                      self.__cost(profile, start, prices))
+        return Resolution([], routine, routine.when.replace(hour=new_start // 60, minute=new_start % 60),
+                          int(distances[new_start]), cost_delta)
+
+    def __contribution(self, routine: Routine) -> np.ndarray:
+        contribution = np.zeros(const.MINUTES_IN_DAY)
+
+        for action in routine.actions:
+            start, end = action_span(routine, action)
+            column = self.state_matrix.registry.column(action.appliance.id)
+            contribution[start:end] += mode_power_vector(
+                action.mode, end - start) - self.idle_power[column]
+
+        return contribution
+
+    def __relative_contribution(self, routine: Routine) -> np.ndarray:
+        durations = [action.duration or const.MINUTES_IN_DAY for action in routine.actions]
+        contribution = np.zeros(max(durations, default=0))
+
+        for action, duration in zip(routine.actions, durations):
+            column = self.state_matrix.registry.column(action.appliance.id)
+            contribution[:duration] += mode_power_vector(
+                action.mode, duration) - self.idle_power[column]
+
+        return contribution
+
+    def __cost(self, profile: np.ndarray, start: int, prices: np.ndarray) -> float:
+        length = min(len(profile), const.MINUTES_IN_DAY - start)
+        return float(profile[:length] @ prices[start:start + length]) / 60
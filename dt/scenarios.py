@@ -0,0 +1,221 @@
+"""Monte Carlo simulation of the routines of a home.
+
+Routines are not started exactly at their scheduled time, and appliances don't always run for the same time.
+The scenario engine samples a start time and a duration for each routine in many scenarios, computes the
+power drawn by every appliance in every minute of every scenario as a single 3-D array
+(scenarios x minutes x appliances), and reports how likely the house is to draw more than its maximum power,
+along with percentile curves of the load.
+
+Each scenario is a day, drawn uniformly from the simulated days, and only the routines whose recurrence
+includes the day are executed in it, as in `Timeline`.
+
+Scenarios are simulated in chunks, to bound the memory used, and the chunks can be spread over many processes.
+Each chunk draws from its own random generator, spawned from a single seed, so that the results only depend
+on the seed and on the size of the chunks, not on the number of processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+
+from dt.config import HomeConfig
+from dt.data import Appliance, ApplianceRegistry, Routine
+from dt.dispatch import dispatch, solar_profile
+from dt.energy import mode_power_vector
+from dt import const
+
+
+class RoutineUncertainty:
+    """The variability of the timing of a routine.
+
+    Attributes:
+        start_jitter (float): The standard deviation of the start time, in minutes.
+        duration_spread (float): The standard deviation of the durations of the actions, relative to the duration.
+    """
+
+    def __init__(self, start_jitter: float = 0.0, duration_spread: float = 0.0):
+        if start_jitter < 0 or duration_spread < 0:
+            raise ValueError("Standard deviations must not be negative")
+
+        self.start_jitter = start_jitter
+        self.duration_spread = duration_spread
+
+
+class ScenarioReport:
+    """The outcome of a Monte Carlo simulation.
+
+    Attributes:
+        scenarios (int): The number of simulated scenarios.
+        exceedance_probability (float): The fraction of scenarios in which the maximum power is exceeded at least once.
+        minute_exceedance (np.ndarray): The fraction of scenarios in which the maximum power is exceeded, for each minute.
+        percentiles (list[float]): The percentiles of the load curves.
+        load_curves (np.ndarray): The power drawn from the grid in each minute, for each percentile, in watts.
+    """
+
+    def __init__(self, scenarios: int, exceedance_probability: float, minute_exceedance: np.ndarray, percentiles: list[float], load_curves: np.ndarray):
+        self.scenarios = scenarios
+        self.exceedance_probability = exceedance_probability
+        self.minute_exceedance = minute_exceedance
+        self.percentiles = percentiles
+        self.load_curves = load_curves
+
+
+class ScenarioEngine:
+    """Samples scenarios of the routines of a home.
+
+    Routines that overlap on the same appliance because of the sampling are not reported as inconsistent,
+    the latest routine in the list takes over the appliance instead.
+    """
+
+    def __init__(self, appliances: list[Appliance], routines: list[Routine], config: HomeConfig,
+                 uncertainty: RoutineUncertainty | None = None, uncertainties: dict[int, RoutineUncertainty] | None = None,
+                 days: list[date] | None = None):
+        """Constructor.
+
+        Args:
+            appliances (list[Appliance]): The list of appliances.
+            routines (list[Routine]): The list of routines. Disabled routines are ignored.
+            config (HomeConfig): The configuration of the home.
+            uncertainty (RoutineUncertainty | None, optional): The variability of the routines. Defaults to none.
+            uncertainties (dict[int, RoutineUncertainty] | None, optional): The variability of specific routines, by ID. Defaults to None.
+            days (list[date] | None, optional): The days the scenarios are drawn from. Defaults to today.
+
+        Raises:
+            ValueError: The list of days is empty.
+        """
+        days = days if days is not None else [date.today()]
+        if not days:
+            raise ValueError("At least one day must be simulated")
+
+        self.config = config
+        self.registry = ApplianceRegistry(appliances)
+        self.routines = [routine for routine in routines if any(
+            routine.occurs_on(day) for day in days)]
+        self.generation = solar_profile(config.generation)
+
+        # Whether each routine is executed on each day, as in `Timeline.active_routines`
+        self.occurrences = np.array([[routine.occurs_on(day) for routine in self.routines] for day in days],
+                                    dtype=bool).reshape(len(days), len(self.routines))
+
+        uncertainty = uncertainty or RoutineUncertainty()
+        uncertainties = uncertainties or {}
+
+        self.idle_power = np.array([appliance.modes[self.registry.idle_mode_index(column)].power_consumption
+                                    for column, appliance in enumerate(self.registry.appliances)])
+        self.starts = np.array([routine.when.hour * 60 + routine.when.minute
+                               for routine in self.routines], dtype=int)
+        self.start_jitters = np.array([uncertainties.get(routine.id, uncertainty).start_jitter
+                                       for routine in self.routines])
+        self.duration_spreads = np.array([uncertainties.get(routine.id, uncertainty).duration_spread
+                                          for routine in self.routines])
+
+        # Column, nominal duration and power since the start of each action, by routine
+        self.actions = [[(self.registry.column(action.appliance.id), action.duration,
+                          mode_power_vector(action.mode, const.MINUTES_IN_DAY))
+                         for action in routine.actions] for routine in self.routines]
+
+    def sample(self, scenarios: int, rng: np.random.Generator) -> np.ndarray:
+        """Sample the power drawn by each appliance in each minute of many scenarios.
+
+        Args:
+            scenarios (int): The number of scenarios.
+            rng (np.random.Generator): The random generator.
+
+        Returns:
+            np.ndarray: The power, in watts, with shape (scenarios, minutes, appliances).
+        """
+        power = np.empty(
+            (scenarios, const.MINUTES_IN_DAY, len(self.registry)), dtype=np.float32)
+        power[:] = self.idle_power
+
+        starts = np.clip(self.starts + np.rint(rng.normal(size=(scenarios, len(self.routines))) * self.start_jitters),
+                         0, const.MINUTES_IN_DAY - 1).astype(int)
+        scales = np.maximum(
+            1 + rng.normal(size=(scenarios, len(self.routines))) * self.duration_spreads, 0)
+
+        # The day of each scenario is only drawn if there is a choice, so that a single day keeps the same samples
+        if len(self.occurrences) > 1:
+            occurs = self.occurrences[rng.integers(
+                len(self.occurrences), size=scenarios)]
+        else:
+            occurs = np.broadcast_to(
+                self.occurrences[0], (scenarios, len(self.routines)))
+
+        minutes = np.arange(const.MINUTES_IN_DAY)
+
+        for index, actions in enumerate(self.actions):
+            start = starts[:, index, np.newaxis]
+            elapsed = minutes - start
+            executed = occurs[:, index, np.newaxis]
+
+            for column, duration, action_power in actions:
+                if duration:
+                    # Actions last at least a minute, as in the state matrix
+                    end = start + np.maximum(np.rint(duration * scales[:, index, np.newaxis]), 1)
+                    active = (elapsed >= 0) & (minutes < end)
+                else:
+                    active = elapsed >= 0
+
+                power[:, :, column] = np.where(
+                    active & executed, action_power[np.clip(elapsed, 0, None)], power[:, :, column])
+
+        return power
+
+    def load_curves(self, scenarios: int, seed: np.random.SeedSequence | int | None = None) -> np.ndarray:
+        """Sample the power drawn from the grid in each minute of many scenarios,
+        after the generation and the battery of the home.
+
+        Args:
+            scenarios (int): The number of scenarios.
+            seed (np.random.SeedSequence | int | None, optional): The seed of the random generator. Defaults to None.
+
+        Returns:
+            np.ndarray: The power, in watts, with shape (scenarios, minutes).
+        """
+        load = self.sample(scenarios, np.random.default_rng(seed)).sum(
+            axis=2, dtype=float)
+
+        if self.config.battery is None:
+            return (load - self.generation).astype(np.float32)
+
+        return np.array([dispatch(scenario_load, self.generation, self.config.battery).net_power
+                         for scenario_load in load], dtype=np.float32)
+
+    def run(self, scenarios: int, seed: int | None = None, chunk_size: int = 256, workers: int = 1,
+            percentiles: list[float] | None = None) -> ScenarioReport:
+        """Simulate many scenarios and summarize them.
+
+        Args:
+            scenarios (int): The number of scenarios.
+            seed (int | None, optional): The seed of the random generators, for reproducible results. Defaults to None.
+            chunk_size (int, optional): The number of scenarios simulated at once by each process. Defaults to 256.
+            workers (int, optional): The number of processes simulating in parallel. Defaults to 1.
+            percentiles (list[float] | None, optional): The percentiles of the load curves. Defaults to 5, 50 and 95.
+
+        Raises:
+            ValueError: The number of scenarios is not positive.
+
+        Returns:
+            ScenarioReport: The report.
+        """
+        if scenarios < 1:
+            raise ValueError("At least one scenario must be simulated")
+
+        percentiles = percentiles or [5, 50, 95]
+        counts = [chunk_size] * (scenarios // chunk_size)
+        if scenarios % chunk_size:
+            counts.append(scenarios % chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(counts))
+
+        if workers <= 1:
+            chunks = [self.load_curves(count, chunk_seed)
+                      for count, chunk_seed in zip(counts, seeds)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = list(executor.map(self.load_curves, counts, seeds))
+
+        curves = np.concatenate(chunks)
+        exceeding = curves > self.config.max_power
+
+        return ScenarioReport(scenarios, float(exceeding.any(axis=1).mean()), exceeding.mean(axis=0),
+                              percentiles, np.percentile(curves, percentiles, axis=0))
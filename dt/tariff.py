@@ -0,0 +1,109 @@
+"""Time-varying electricity prices.
+
+Customers on dynamic tariffs pay a different price for each hour, or quarter of an hour,
+e.g. following the day-ahead market. The prices are read from a CSV file with a `timestamp,price`
+header, one row per step, with the timestamps in ISO format and the prices in €/kWh:
+
+    timestamp,price
+    2024-03-01T00:00,0.0912
+    2024-03-01T01:00,0.0874
+
+The timestamps must be evenly spaced, so that only the first timestamp and the step
+are stored, and the price at any time is found by index arithmetic.
+"""
+
+import csv
+from datetime import date, datetime, timedelta
+import numpy as np
+
+from dt import const
+
+
+class TariffSeries:
+    """Prices of electricity over a range of time, at a fixed step.
+
+    Attributes:
+        start (datetime): The start of the first step.
+        step (timedelta): The length of each step, a whole number of minutes.
+        prices (np.ndarray): The price of each step, in €/Wh.
+    """
+
+    def __init__(self, start: datetime, step: timedelta, prices: np.ndarray):
+        """Constructor.
+
+        Args:
+            start (datetime): The start of the first step.
+            step (timedelta): The length of each step, a whole number of minutes.
+            prices (np.ndarray): The price of each step, in €/Wh.
+
+        Raises:
+            ValueError: The step is not a positive whole number of minutes.
+        """
+        if step <= timedelta(0) or step % timedelta(minutes=1):
+            raise ValueError("The step must be a positive whole number of minutes")
+
+        self.start = start
+        self.step = step
+        self.prices = np.asarray(prices, dtype=np.float32)
+
+    @property
+    def end(self) -> datetime:
+        """The end of the last step."""
+        return self.start + self.step * len(self.prices)
+
+    def day_prices(self, day: date) -> np.ndarray:
+        """Get the price of each minute of a day.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            np.ndarray: The price of each minute, in €/Wh, NaN where the series has no price.
+        """
+        step_minutes = self.step // timedelta(minutes=1)
+        offset = (datetime.combine(day, datetime.min.time()) -
+                  self.start) // timedelta(minutes=1)
+
+        # Index of the step of each minute of the day
+        steps = (offset + np.arange(const.MINUTES_IN_DAY)) // step_minutes
+        covered = (steps >= 0) & (steps < len(self.prices))
+
+        prices = np.full(const.MINUTES_IN_DAY, np.nan)
+        prices[covered] = self.prices[steps[covered]]
+        return prices
+
+    @staticmethod
+    def from_csv(filepath: str) -> "TariffSeries":
+        """Read a series of prices from a CSV file.
+
+        Args:
+            filepath (str): The path to the CSV file.
+
+        Raises:
+            ValueError: The file is empty, or the timestamps are not evenly spaced.
+
+        Returns:
+            TariffSeries: The series of prices.
+        """
+        with open(filepath, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            timestamps = []
+            prices = []
+
+            for row in reader:
+                timestamps.append(datetime.fromisoformat(row["timestamp"]))
+                prices.append(float(row["price"]))
+
+        if not timestamps:
+            raise ValueError(f"No prices found in {filepath}")
+
+        step = timestamps[1] - timestamps[0] if len(
+            timestamps) > 1 else timedelta(hours=1)
+
+        for i in range(1, len(timestamps)):
+            if timestamps[i] - timestamps[i - 1] != step:
+                raise ValueError(
+                    f"Timestamps in {filepath} are not evenly spaced at {timestamps[i]}")
+
+        # Prices are given in €/kWh, as in the configuration
+        return TariffSeries(timestamps[0], step, np.array(prices) / 1000)
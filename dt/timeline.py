@@ -0,0 +1,168 @@
+"""Timeline of the state of a home over many days.
+
+Routines can recur only on some days, e.g. on weekdays or every other day, so the state of the home
+changes from day to day. The timeline expands the recurrences lazily: the routines active on a day
+are only found when the day is queried, and a state matrix is simulated once for each distinct set of
+active routines, which is shared by every day with the same set. A weekly schedule needs at most seven
+matrices however long the horizon is, and days that are never queried are never simulated.
+
+A timeline is never modified: adding a routine gives a new version of it, which shares the routines and
+the matrices that are not affected by the new routine. Requests can query a version while a newer one is
+being built, and simulations can run on many threads at once, without locks.
+"""
+
+from datetime import date, timedelta
+from typing import Iterator
+
+import numpy as np
+
+from dt.config import HomeConfig
+from dt.data import Appliance, Routine, RoutineList
+from dt.energy import CostsMatrix, StateMatrix
+from dt import const
+
+
+class Timeline:
+    """The state matrices of a home, day by day.
+    """
+
+    def __init__(self, appliances: list[Appliance], routines: list[Routine], config: HomeConfig, base_matrix: np.ndarray | None = None,
+                 version: int = 0):
+        """Constructor.
+
+        Args:
+            appliances (list[Appliance]): The list of appliances.
+            routines (list[Routine]): The list of routines, with their recurrences.
+            config (HomeConfig): The configuration of the home.
+            base_matrix (np.ndarray | None, optional): A precompiled matrix of all the enabled routines, e.g. loaded from a snapshot.
+            It is used for the days on which every enabled routine is active. Defaults to None.
+            version (int, optional): The version of the timeline, increased by each added routine. Defaults to 0.
+        """
+        self.appliances = appliances
+        self.routines = routines if isinstance(
+            routines, RoutineList) else RoutineList(routines)
+        self.config = config
+        self.base_matrix = base_matrix
+        self.version = version
+
+        self.__matrices: dict[tuple[int, ...], StateMatrix] = {}
+        self.__all_routines = tuple(
+            routine.id for routine in routines if routine.enabled)
+
+    def active_routines(self, day: date) -> list[Routine]:
+        """Get the routines executed on a day.
+
+        Args:
+            day (date): The day.
+
+        Returns:
+            list[Routine]: The enabled routines whose recurrence includes the day.
+        """
+        return [routine for routine in self.routines if routine.occurs_on(day)]
+
+    def matrix(self, day: date) -> StateMatrix:
+        """Get the state matrix of a day, simulating it if no day with the same routines was queried before.
+
+        Args:
+            day (date): The day.
+
+        Raises:
+            InconsistentRoutinesError: The routines active on the day are inconsistent.
+            MaxPowerExceededError: The routines active on the day exceed the maximum power of the house.
+
+        Returns:
+            StateMatrix: The state matrix.
+        """
+        routines = self.active_routines(day)
+        key = tuple(routine.id for routine in routines)
+
+        matrix = self.__matrices.get(key)
+        if matrix is None:
+            previous = self.__matrices.get(key[:-1]) if key else None
+            if previous is not None and (self.base_matrix is None or key != self.__all_routines):
+                # Only the last routine is missing, e.g. the one added by the latest version, so it is added incrementally
+                matrix = previous.add_routine(routines[-1])
+            else:
+                base_matrix = self.base_matrix if key == self.__all_routines else None
+                matrix = StateMatrix(
+                    self.appliances, routines, self.config, base_matrix)
+
+            # Two threads can simulate the same day at once, in which case both get the first stored matrix
+            matrix = self.__matrices.setdefault(key, matrix)
+
+        return matrix
+
+    def with_routine(self, routine: Routine) -> "Timeline":
+        """Create the next version of the timeline, with a routine added.
+        This timeline is not modified, and the matrices it already simulated are shared with the new one.
+
+        Args:
+            routine (Routine): The routine to add.
+
+        Returns:
+            Timeline: The new timeline.
+        """
+        timeline = Timeline(self.appliances, self.routines.append(routine), self.config,
+                            None, self.version + 1)
+
+        # Days without the new routine have the same routines as before, so the same keys and matrices
+        timeline.__matrices = dict(self.__matrices)
+        return timeline
+
+    def simulate(self, routine: Routine, day: date) -> StateMatrix:
+        """Simulate the addition of a routine on a day.
+
+        Args:
+            routine (Routine): The routine to add.
+            day (date): The day.
+
+        Returns:
+            StateMatrix: The state matrix of the day, with the routine if its recurrence includes the day.
+        """
+        matrix = self.matrix(day)
+        return matrix.add_routine(routine) if routine.occurs_on(day) else matrix
+
+    def days(self, start: date, end: date) -> Iterator[tuple[date, StateMatrix]]:
+        """Iterate over the state matrices of a range of days, lazily.
+
+        Args:
+            start (date): The first day.
+            end (date): The day after the last one.
+
+        Yields:
+            tuple[date, StateMatrix]: Each day and its state matrix.
+        """
+        for offset in range((end - start).days):
+            day = start + timedelta(days=offset)
+            yield day, self.matrix(day)
+
+    def net_power(self, start: date, end: date) -> np.ndarray:
+        """Get the power drawn from the grid in each minute of a range of days.
+
+        Args:
+            start (date): The first day.
+            end (date): The day after the last one.
+
+        Returns:
+            np.ndarray: The power, in watts, with shape (days, minutes).
+        """
+        net_power = np.empty((max((end - start).days, 0), const.MINUTES_IN_DAY))
+
+        for index, (_, matrix) in enumerate(self.days(start, end)):
+            net_power[index] = matrix.net_power
+
+        return net_power
+
+    def energy_cost(self, start: date, end: date, costs: CostsMatrix) -> float:
+        """Calculate the cost of the energy drawn from the grid over a range of days,
+        with the prices of each day of the week. The energy fed into the grid is not credited, see `CostsMatrix.grid_costs`.
+
+        Args:
+            start (date): The first day.
+            end (date): The day after the last one.
+            costs (CostsMatrix): The costs of electricity.
+
+        Returns:
+            float: The cost, in €.
+        """
+        return sum(costs.grid_cost(matrix.net_power, day) for day, matrix in self.days(start, end))
@@ -40,7 +40,7 @@ const DigitalTwinContextProvider = ({ children }) => {
   const [consumptionsPerHour, setConsumptionsPerHour] = useState(
     new Array(24).fill(0),
   );
-  const [mostConsumingAppliances, setMostConsumingAppliances] = useState([]);
+  const [liveConsumptions, setLiveConsumptions] = useState([]);
   const [appliances, setAppliances] = useState([]);
   const [routines, setRoutines] = useState([]);
   const [simulatedRoutines, setSimulatedRoutines] = useState([]);
@@ -59,12 +59,6 @@ const DigitalTwinContextProvider = ({ children }) => {
   });
   const datesQueryParam = hourDates.map((date) => `when=${date}`).join("&");
 
-  const fetchTotalConsumption = async () => {
-    const totalConsumption = (await apiFetch(`/consumption/total/${timeNow}`))
-      .value;
-    setConsumptionNow(totalConsumption);
-  };
-
   const fetchAppliances = async () => {
     const { value: appliancesData } = await apiFetch("/appliance");
     const sortedAppliances = appliancesData.sort((a, b) =>
@@ -74,21 +68,6 @@ const DigitalTwinContextProvider = ({ children }) => {
 
     if (appliancesData.length === 0) return;
 
-    const { value: mostConsumingRaw } = await apiFetch(
-      `/consumption/${timeNow}`,
-    );
-    const mostConsuming = mostConsumingRaw
-      .sort((a, b) => b.consumption - a.consumption)
-      .slice(0, 3)
-      .map(({ appliance_id, consumption }) => {
-        const appliance = appliancesData.find(
-          (appliance) => appliance.id === appliance_id,
-        );
-        return { appliance: appliance, consumption: consumption };
-      });
-
-    setMostConsumingAppliances(mostConsuming);
-
     const simulatedRoutines = rawSimulatedRoutines.map(({ name, routine }) => {
       const simulatedActions = routine.actions.map((action) => {
         const appliance = appliancesData.find(
@@ -120,7 +99,6 @@ const DigitalTwinContextProvider = ({ children }) => {
 
     try {
       await Promise.all([
-        fetchTotalConsumption(),
         fetchAppliances(),
         fetchRoutines(),
         fetchConsumptionsPerHour(),
@@ -183,6 +161,47 @@ const DigitalTwinContextProvider = ({ children }) => {
     });
   };
 
+  const mostConsumingAppliances = [...liveConsumptions]
+    .sort((a, b) => b.consumption - a.consumption)
+    .slice(0, 3)
+    .map(({ appliance_id, consumption }) => ({
+      appliance: appliances.find((appliance) => appliance.id === appliance_id),
+      consumption,
+    }))
+    .filter(({ appliance }) => appliance !== undefined);
+
+  useEffect(() => {
+    // The consumptions of the current minute are pushed by the server when they change
+    let socket = null;
+    let reconnectTimeoutId = null;
+
+    const connect = () => {
+      socket = new WebSocket(
+        `${import.meta.env.DT_BACKEND_URL.replace(/^http/, "ws")}/consumption/live`,
+      );
+      socket.onopen = () => setHasError(false);
+      socket.onmessage = (event) => {
+        const { total, consumptions } = JSON.parse(event.data);
+        setConsumptionNow(total);
+        setLiveConsumptions(consumptions);
+      };
+      socket.onclose = (event) => {
+        // Reconnect after a while, unless the component was unmounted
+        if (event.code !== 1000) {
+          setHasError(true);
+          reconnectTimeoutId = setTimeout(connect, 5 * 1000);
+        }
+      };
+    };
+
+    connect();
+
+    return () => {
+      clearTimeout(reconnectTimeoutId);
+      socket.close(1000);
+    };
+  }, []);
+
   useEffect(() => {
     // Fetch the data on component mount
     fetchAllData();
@@ -9,16 +9,41 @@ const DisableRoutinesRecommendation = ({ routines }) => (
   </Alert>
 );
 
-const ChangeRoutineStartTimeRecommendation = ({ when, savings }) => {
+const DisableRoutineSetRecommendation = ({ routines }) => (
+  <Alert color="info" icon={MdInfo}>
+    Disable all of the following routines:{" "}
+    <i>{routines.map((r) => r.name).join(", ")}</i>
+  </Alert>
+);
+
+const ChangeRoutineStartTimeRecommendation = ({ when, savings, routine }) => {
   const hour = new Date(when).toLocaleTimeString([], {
     hour: "2-digit",
     minute: "2-digit",
   });
+  const name = routine ? <i>{routine.name}</i> : "the routine";
 
   return (
     <Alert color="success" icon={MdPaid}>
-      Starting the routine at {hour} can save {(savings * 30).toFixed(2)}€ over
-      a month
+      Starting {name} at {hour}
+      {savings > 0
+        ? ` can save ${(savings * 30).toFixed(2)}€ over a month`
+        : " keeps the house under its maximum power"}
+    </Alert>
+  );
+};
+
+const DemandResponseRecommendation = ({ delays, shiftedEnergy, unservedEnergy }) => {
+  const maxDelay = Math.max(0, ...delays.map((d) => d.delay));
+
+  return (
+    <Alert color="warning" icon={MdInfo}>
+      To stay under the maximum power,{" "}
+      <i>{delays.map((d) => d.appliance.device).join(", ")}</i> will be delayed
+      by up to {maxDelay} minutes, shifting{" "}
+      {(shiftedEnergy / 1000).toFixed(2)}kWh
+      {unservedEnergy > 0 &&
+        ` and leaving ${(unservedEnergy / 1000).toFixed(2)}kWh unserved`}
     </Alert>
   );
 };
@@ -46,6 +71,13 @@ const SimulationResult = ({ consumptionsPerHour, simulationStatus }) => {
   const disableRoutineRecommendations = simulationStatus.recommendations.filter(
     (s) => s.type === "DISABLE_ROUTINE",
   );
+  const disableRoutineSetRecommendations =
+    simulationStatus.recommendations.filter(
+      (s) => s.type === "DISABLE_ROUTINES",
+    );
+  const demandResponseRecommendations = simulationStatus.recommendations.filter(
+    (s) => s.type === "DEMAND_RESPONSE",
+  );
   const changeRoutineStartTimeRecommendations =
     simulationStatus.recommendations.filter(
       (s) => s.type === "CHANGE_ROUTINE_START_TIME",
@@ -74,12 +106,27 @@ const SimulationResult = ({ consumptionsPerHour, simulationStatus }) => {
             )}
           />
         )}
+        {disableRoutineSetRecommendations.map((r) => (
+          <DisableRoutineSetRecommendation
+            routines={r.context.routines}
+            key={r.context.routines.map((routine) => routine.id).join("-")}
+          />
+        ))}
+        {demandResponseRecommendations.map((r) => (
+          <DemandResponseRecommendation
+            delays={r.context.delays}
+            shiftedEnergy={r.context.shifted_energy}
+            unservedEnergy={r.context.unserved_energy}
+            key="demand-response"
+          />
+        ))}
         {changeRoutineStartTimeRecommendations.length > 0 &&
           changeRoutineStartTimeRecommendations.map((r) => (
             <ChangeRoutineStartTimeRecommendation
               when={r.context.when}
               savings={r.context.savings}
-              key={r.context.when}
+              routine={r.context.routine}
+              key={`${r.context.routine?.id}-${r.context.when}`}
             />
           ))}
       </div>
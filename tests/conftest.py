@@ -0,0 +1,56 @@
+"""Fixtures shared by the tests."""
+
+import json
+from typing import Callable
+
+import pytest
+
+from dt.data import JSONRepository
+
+# A heater and an oven, each with an off and an on mode of 2 kW
+APPLIANCES = [
+    {"id": 0, "device": "heater", "manufacturer": "", "model": "", "location": "",
+     "modes": [{"id": 0, "name": "off", "power_consumption": 0}, {"id": 1, "name": "on", "power_consumption": 2000}]},
+    {"id": 1, "device": "oven", "manufacturer": "", "model": "", "location": "",
+     "modes": [{"id": 0, "name": "off", "power_consumption": 0}, {"id": 1, "name": "on", "power_consumption": 2000}]},
+]
+
+
+def routine(routine_id: int, when: str, actions: list[tuple[int, int, int | None]], **fields) -> dict:
+    """Create the JSON object of a routine.
+
+    Args:
+        routine_id (int): The ID of the routine.
+        when (str): The start time, e.g. "10:00".
+        actions (list[tuple[int, int, int | None]]): The appliance ID, mode ID and duration in minutes of each action.
+        The duration is left out when it is None.
+
+    Returns:
+        dict: The JSON object, with the additional fields.
+    """
+    return {"id": routine_id, "name": f"Routine {routine_id}", "when": when, "enabled": True,
+            "actions": [{"id": index, "appliance_id": appliance_id, "mode_id": mode_id}
+                        | ({"duration": duration * 60} if duration is not None else {})
+                        for index, (appliance_id, mode_id, duration) in enumerate(actions)]} | fields
+
+
+@pytest.fixture
+def create_home(tmp_path) -> Callable[..., JSONRepository]:
+    """Write a home to JSON files in the temporary directory.
+
+    Returns:
+        Callable[..., JSONRepository]: A function of the routines, the test routines and the appliances,
+        which defaults to `APPLIANCES`, that returns the repository of the files.
+    """
+    def create(routines: list[dict], test_routines: list[dict] | None = None,
+               appliances: list[dict] | None = None) -> JSONRepository:
+        for name, entities in [("appliances", appliances if appliances is not None else APPLIANCES),
+                               ("routines", routines), ("test_routines", test_routines or [])]:
+            (tmp_path / name).mkdir(exist_ok=True)
+            for entity in entities:
+                (tmp_path / name / f"{entity['id']}.json").write_text(json.dumps(entity))
+
+        return JSONRepository(str(tmp_path / "appliances"), str(tmp_path / "routines"),
+                              str(tmp_path / "test_routines"))
+
+    return create
@@ -0,0 +1,85 @@
+"""Tests of the asynchronous access to the repositories."""
+
+import asyncio
+from typing import Iterable
+
+import pytest
+
+from dt.data import AsyncDataRepository, Appliance, JSONRepository
+from conftest import routine
+
+
+class CountingRepository(JSONRepository):
+    """A repository that records the bulk fetches of appliances."""
+
+    def __init__(self, repository: JSONRepository):
+        super().__init__(repository.appliances_dir, repository.routines_dir, repository.test_routines_dir)
+        self.fetches: list[list[int]] = []
+
+    def get_appliances_by_ids(self, appliance_ids: Iterable[int]) -> dict[int, Appliance]:
+        appliance_ids = list(appliance_ids)
+        self.fetches.append(appliance_ids)
+        return super().get_appliances_by_ids(appliance_ids)
+
+
+@pytest.fixture
+def repository(create_home) -> CountingRepository:
+    return CountingRepository(create_home([routine(0, "10:00", [(0, 1, 60)])]))
+
+
+def test_async_repository_returns_the_same_data(repository):
+    async_repository = AsyncDataRepository(repository, max_workers=2)
+
+    async def run():
+        return await asyncio.gather(async_repository.aget_appliances(), async_repository.aget_appliance(1),
+                                    async_repository.aget_routines_with_appliance(0))
+
+    try:
+        appliances, oven, routines = asyncio.run(run())
+    finally:
+        async_repository.close()
+
+    assert appliances == repository.get_appliances()
+    assert oven == repository.get_appliance(1)
+    assert [r.id for r in routines] == [0]
+
+
+def test_loader_fetches_the_appliances_of_a_request_at_once(repository):
+    async_repository = AsyncDataRepository(repository)
+
+    async def run():
+        loader = async_repository.loader()
+        appliances = await asyncio.gather(loader.load(0), loader.load(1), loader.load(0), loader.load(5))
+        # Appliances already loaded are not fetched again
+        return appliances, await loader.load(1)
+
+    try:
+        (heater, oven, heater_again, missing), oven_again = asyncio.run(run())
+    finally:
+        async_repository.close()
+
+    assert (heater.id, oven.id, missing) == (0, 1, None)
+    assert heater_again is heater and oven_again is oven
+    assert repository.fetches == [[0, 1, 5]]
+
+
+def test_loader_propagates_failed_fetches(repository):
+    async_repository = AsyncDataRepository(repository)
+
+    def fail(appliance_ids):
+        raise OSError("The repository is unavailable")
+
+    async def run():
+        loader = async_repository.loader()
+        repository.get_appliances_by_ids = fail
+        with pytest.raises(OSError):
+            await loader.load(0)
+
+        # Failed appliances are fetched again by the next call
+        del repository.get_appliances_by_ids
+        return await loader.load(0)
+
+    try:
+        assert asyncio.run(run()).id == 0
+    finally:
+        async_repository.close()
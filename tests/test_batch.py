@@ -0,0 +1,90 @@
+"""Tests of the batch simulation of candidate routines."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from dt.batch import RESULT_FIELDS, read_scenarios, run_batch, write_results
+from conftest import routine
+
+CONFIG = """
+[home]
+max_power = 3
+energy_rates_number = 1
+energy_rates_prices = [0.2]
+
+[database]
+type = "json"
+appliances_dir = "{directory}/appliances"
+routines_dir = "{directory}/routines"
+test_routines_dir = "{directory}/test_routines"
+"""
+
+SCENARIOS = [
+    # The oven runs with the heater from 10:30 to 11:00
+    {"id": "overlap", "day": "2026-10-19", "routines": [routine(1, "10:30", [(1, 1, 30)])]},
+    {"day": "2026-10-19", "routines": [routine(1, "12:00", [(1, 1, 30)]), routine(2, "20:00", [(1, 1, 60)])]},
+    {"id": "missing", "day": "2026-10-19"},
+]
+
+
+@pytest.fixture
+def config_file(create_home, tmp_path) -> str:
+    create_home([routine(0, "10:00", [(0, 1, 60)])])
+    (tmp_path / "config.toml").write_text(CONFIG.format(directory=tmp_path.as_posix()))
+    return str(tmp_path / "config.toml")
+
+
+@pytest.fixture
+def batch_file(tmp_path) -> str:
+    (tmp_path / "batch.jsonl").write_text("\n".join(json.dumps(scenario) for scenario in SCENARIOS) + "\n\n")
+    return str(tmp_path / "batch.jsonl")
+
+
+def by_routine(results: list[dict]) -> dict:
+    return {(result["scenario"], result["routine_id"]): result for result in results}
+
+
+def test_scenarios_are_read_from_files_and_directories(batch_file, tmp_path):
+    assert [scenario["id"] for scenario in read_scenarios(batch_file)] == ["overlap", 1, "missing"]
+
+    (tmp_path / "batch").mkdir()
+    (tmp_path / "batch" / "b.json").write_text(json.dumps(SCENARIOS[1]))
+    (tmp_path / "batch" / "a.json").write_text(json.dumps(SCENARIOS[0]))
+    assert [scenario["id"] for scenario in read_scenarios(str(tmp_path / "batch"))] == ["overlap", "b"]
+
+
+def test_each_candidate_gets_a_result(config_file, batch_file):
+    results = by_routine(run_batch(read_scenarios(batch_file), config_file))
+
+    assert results.keys() == {("overlap", 1), (1, 1), (1, 2), ("missing", None)}
+    assert results[("overlap", 1)]["status"] == "max_power_exceeded"
+    assert results[("missing", None)]["status"] == "invalid"
+
+    added = results[(1, 2)]
+    assert (added["status"], added["day"], added["peak_power"]) == ("ok", "2026-10-19", 2000)
+    assert added["energy_delta"] == pytest.approx(2000)
+    # 2 kWh at 0.2 €/kWh
+    assert added["cost_delta"] == pytest.approx(0.4)
+    # With a single rate no start time is cheaper
+    assert added["best_start"] is None
+
+
+def test_results_do_not_depend_on_the_processes(config_file, batch_file):
+    results = list(run_batch(read_scenarios(batch_file), config_file))
+
+    assert by_routine(run_batch(read_scenarios(batch_file), config_file, workers=2)) == by_routine(results)
+
+
+@pytest.mark.parametrize("format", ["jsonl", "csv"])
+def test_results_are_written(config_file, batch_file, format):
+    file = io.StringIO()
+
+    count = write_results(run_batch(read_scenarios(batch_file), config_file), file, format)
+
+    file.seek(0)
+    rows = list(csv.DictReader(file)) if format == "csv" else [json.loads(line) for line in file]
+    assert count == len(rows) == 4
+    assert all(list(row) == RESULT_FIELDS for row in rows)
@@ -0,0 +1,76 @@
+"""Tests of the calibration of the power of the modes from measured data."""
+
+from datetime import datetime
+import json
+
+import numpy as np
+import pytest
+
+from dt.calibration import Calibrator, write_calibrated_appliances
+from dt.config import GenerationConfig, HomeConfig
+from dt.energy import StateMatrix
+from conftest import routine
+
+# The heater and the oven overlap for half an hour, and run alone otherwise
+ROUTINES = [routine(0, "10:00", [(0, 1, 60)]), routine(1, "10:30", [(1, 1, 60)]), routine(2, "18:00", [(0, 1, 30)])]
+# The heater actually draws 1.8 kW and the oven 2.3 kW, over 100 W that are not modelled
+ACTUAL_POWER = {0: 1800.0, 1: 2300.0}
+BASE_LOAD = 100.0
+
+
+@pytest.fixture
+def repository(create_home):
+    return create_home(ROUTINES)
+
+
+def measured_load(matrix: StateMatrix, seed: int) -> np.ndarray:
+    on = matrix.matrix == 1
+    load = BASE_LOAD + on[:, 0] * ACTUAL_POWER[0] + on[:, 1] * ACTUAL_POWER[1]
+    return load + np.random.default_rng(seed).normal(0, 20, len(load))
+
+
+@pytest.mark.parametrize("generation", [None, GenerationConfig(3000, datetime(2000, 1, 1, 7), datetime(2000, 1, 1, 19))])
+def test_mode_power_is_fitted_to_the_measures(repository, generation):
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(),
+                         HomeConfig(10000, 1, [0.0002], generation=generation))
+    calibrator = Calibrator(repository.get_appliances())
+
+    for seed in range(3):
+        # The meter measures the power drawn from the grid, after the generation
+        measured = measured_load(matrix, seed) - matrix.dispatch.generation
+        measured[seed * 100:seed * 100 + 50] = np.nan
+        calibrator.add_day(matrix, measured)
+
+    powers = calibrator.fit()
+
+    assert calibrator.minutes == 3 * 1440 - 150
+    assert powers.keys() == {(0, 1), (1, 1)}
+    assert powers[(0, 1)] == pytest.approx(ACTUAL_POWER[0], abs=10)
+    assert powers[(1, 1)] == pytest.approx(ACTUAL_POWER[1], abs=10)
+
+
+def test_modes_that_were_not_observed_are_not_calibrated(create_home):
+    repository = create_home([routine(0, "10:00", [(0, 1, 60)])])
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), HomeConfig(10000, 1, [0.0002]))
+    calibrator = Calibrator(repository.get_appliances())
+
+    calibrator.add_day(matrix, measured_load(matrix, 0))
+
+    assert calibrator.fit().keys() == {(0, 1)}
+
+
+def test_calibrated_appliances_are_written(repository, tmp_path):
+    appliance = json.loads((tmp_path / "appliances" / "1.json").read_text())
+    appliance["modes"][1]["power_profile"] = [{"duration": 600, "power_consumption": 1000}]
+    (tmp_path / "appliances" / "1.json").write_text(json.dumps(appliance))
+
+    filepaths = write_calibrated_appliances(str(tmp_path / "appliances"), str(tmp_path / "calibrated"),
+                                            {(0, 1): 1800.04, (1, 1): 2300})
+
+    assert len(filepaths) == 2
+    heater = json.loads((tmp_path / "calibrated" / "0.json").read_text())
+    oven = json.loads((tmp_path / "calibrated" / "1.json").read_text())
+    assert [mode["power_consumption"] for mode in heater["modes"]] == [0, 1800.0]
+    # The power profile is scaled as the power of the mode
+    assert oven["modes"][1]["power_consumption"] == 2300
+    assert oven["modes"][1]["power_profile"] == [{"duration": 600, "power_consumption": 1150.0}]
@@ -0,0 +1,79 @@
+"""Tests of the demand response, through the simulation endpoints of the API."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from dt.api import create_api
+from dt.config import HomeConfig
+from dt.data import JSONRepository
+
+# A heater that would run from 10:00 to 11:00, and an oven with a higher priority
+__APPLIANCES = [
+    {"id": 0, "device": "heater", "manufacturer": "", "model": "", "location": "", "priority": 0,
+     "modes": [{"id": 0, "name": "off", "power_consumption": 0}, {"id": 1, "name": "on", "power_consumption": 2000}]},
+    {"id": 1, "device": "oven", "manufacturer": "", "model": "", "location": "", "priority": 1,
+     "modes": [{"id": 0, "name": "off", "power_consumption": 0}, {"id": 1, "name": "on", "power_consumption": 2000}]},
+]
+__ROUTINES = [
+    {"id": 0, "name": "Heat", "when": "10:00", "enabled": True,
+     "actions": [{"id": 0, "appliance_id": 0, "mode_id": 1, "duration": 3600}]},
+]
+
+# Running the oven from 10:00 to 10:30 would draw 4 kW with the heater
+OVEN_ROUTINE = {"id": 1, "name": "Bake", "when": "10:00", "enabled": True,
+                "actions": [{"id": 0, "appliance_id": 1, "mode_id": 1, "duration": 1800}]}
+
+
+def create_client(directory, demand_response: bool) -> TestClient:
+    for name, entities in [("appliances", __APPLIANCES), ("routines", __ROUTINES), ("test_routines", [])]:
+        (directory / name).mkdir(exist_ok=True)
+        for entity in entities:
+            (directory / name / f"{entity['id']}.json").write_text(json.dumps(entity))
+
+    repository = JSONRepository(str(directory / "appliances"), str(directory / "routines"),
+                                str(directory / "test_routines"))
+    config = HomeConfig(3000, 1, [0.2], demand_response=demand_response)
+    return TestClient(create_api(repository, config))
+
+
+@pytest.fixture(autouse=True)
+def frontend_url(monkeypatch):
+    monkeypatch.setenv("DT_FRONTEND_URL", "http://localhost:5173")
+
+
+def test_consumption_over_max_power_is_rejected_without_demand_response(tmp_path):
+    client = create_client(tmp_path, demand_response=False)
+
+    response = client.post("/simulate/consumption/total/2026-10-20T10:15:00", json=OVEN_ROUTINE)
+
+    assert response.status_code == 409
+
+
+def test_consumption_over_max_power_is_delayed_with_demand_response(tmp_path):
+    client = create_client(tmp_path, demand_response=True)
+
+    # The oven is served when requested, and the heater is delayed until it ends
+    response = client.post("/simulate/consumption/2026-10-20T10:15:00", json=OVEN_ROUTINE)
+    assert response.status_code == 200
+    assert {c["appliance_id"]: c["consumption"] for c in response.json()["value"]} == {0: 0.0, 1: 2000.0}
+
+    response = client.post("/simulate/consumption/total/2026-10-20T11:15:00", json=OVEN_ROUTINE)
+    assert response.status_code == 200
+    assert response.json()["value"] == 2000.0
+
+    response = client.post("/simulate/consumption/total/2026-10-20T11:45:00", json=OVEN_ROUTINE)
+    assert response.json()["value"] == 0.0
+
+
+def test_simulation_reports_the_delays(tmp_path):
+    client = create_client(tmp_path, demand_response=True)
+
+    response = client.post("/simulate", json=OVEN_ROUTINE)
+
+    assert response.status_code == 200
+    assert response.json()["error"] is None
+    recommendation = response.json()["value"][0]
+    assert recommendation["type"] == "DEMAND_RESPONSE"
+    assert [(d["appliance"]["id"], d["delay"]) for d in recommendation["context"]["delays"]] == [(0, 30)]
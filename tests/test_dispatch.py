@@ -0,0 +1,68 @@
+"""Tests of the dispatch of the generation and the battery."""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from dt import const
+from dt.config import BatteryConfig, GenerationConfig
+from dt.dispatch import dispatch, solar_profile, state_of_charge
+
+BATTERY = BatteryConfig(2000, 1500, 1000, efficiency=0.9, initial_charge=0.5)
+
+
+def state_of_charge_loop(changes: np.ndarray, initial_charge: float, capacity: float) -> np.ndarray:
+    # The charge clamped at each minute, one minute at a time
+    charge = []
+    level = initial_charge
+    for change in changes:
+        level = min(max(level + change, 0.0), capacity)
+        charge.append(level)
+    return np.array(charge)
+
+
+def day_load(seed: int) -> tuple[np.ndarray, np.ndarray]:
+    # A random load of up to 3 kW, and the generation of a 4 kW system from 6:00 to 20:00
+    rng = np.random.default_rng(seed)
+    load = rng.choice([0.0, 150.0, 800.0, 2000.0, 3000.0], const.MINUTES_IN_DAY)
+    generation = solar_profile(GenerationConfig(4000, datetime(2000, 1, 1, 6), datetime(2000, 1, 1, 20)))
+    return load, generation
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("capacity", [0.0, 50.0, 1000.0])
+def test_state_of_charge_matches_the_loop(seed, capacity):
+    changes = np.random.default_rng(seed).normal(0, 20, const.MINUTES_IN_DAY)
+
+    expected = state_of_charge_loop(changes, capacity / 2, capacity)
+
+    np.testing.assert_allclose(state_of_charge(changes, capacity / 2, capacity), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_battery_charge_matches_its_power(seed):
+    load, generation = day_load(seed)
+
+    result = dispatch(load, generation, BATTERY)
+
+    # The battery power is positive when it charges, and only the charged power is subject to the efficiency
+    changes = np.where(result.battery_power > 0, result.battery_power * BATTERY.efficiency,
+                       result.battery_power) / 60
+    np.testing.assert_allclose(result.state_of_charge,
+                               BATTERY.initial_charge * BATTERY.capacity + np.cumsum(changes), atol=1e-6)
+    assert ((result.state_of_charge >= -1e-9) & (result.state_of_charge <= BATTERY.capacity + 1e-9)).all()
+    assert (result.battery_power <= BATTERY.max_charge_power + 1e-9).all()
+    assert (result.battery_power >= -BATTERY.max_discharge_power - 1e-9).all()
+
+
+@pytest.mark.parametrize("battery", [None, BATTERY])
+def test_load_is_recovered_from_the_net_power(battery):
+    load, generation = day_load(0)
+
+    result = dispatch(load, generation, battery)
+
+    # As the calibration reconstructs the load from the meter readings
+    np.testing.assert_allclose(result.net_power + result.generation - result.battery_power, load, atol=1e-9)
+    # The battery only charges with the surplus, so the grid power is bounded by the load minus the generation
+    assert (np.maximum(result.net_power, 0) <= np.maximum(load - generation, 0) + 1e-9).all()
@@ -0,0 +1,75 @@
+"""Tests of the columnar export of the simulations."""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from dt.config import HomeConfig
+from dt.energy import CostsMatrix
+from dt.export import export_home, home_columns, read_columns, results_columns, write_columns
+from dt.timeline import Timeline
+from conftest import routine
+
+MONDAY = date(2026, 10, 19)
+CONFIG = HomeConfig(5000, 1, [0.0002])
+
+
+@pytest.fixture
+def timeline(create_home) -> Timeline:
+    repository = create_home([routine(0, "10:00", [(0, 1, 60)]),
+                              routine(1, "18:00", [(1, 1, 30)], recurrence={"weekdays": ["tuesday"]})])
+    return Timeline(repository.get_appliances(), repository.get_routines(), CONFIG)
+
+
+def test_home_columns_are_the_timeline(timeline):
+    end = MONDAY + timedelta(days=3)
+
+    columns = home_columns(timeline, CostsMatrix(CONFIG), MONDAY, end)
+
+    assert len({len(column) for column in columns.values()}) == 1 and len(columns["timestamp"]) == 3 * 1440
+    assert columns["timestamp"][1440 + 600] == np.datetime64("2026-10-20T10:00:00")
+    np.testing.assert_array_equal(columns["net_power"], timeline.net_power(MONDAY, end).ravel())
+    assert columns["cost"].sum() == pytest.approx(timeline.energy_cost(MONDAY, end, CostsMatrix(CONFIG)))
+    # The modes are the IDs of the modes, and the oven only runs on tuesday
+    assert columns["mode_0"][600] == 1 and columns["power_0"][600] == 2000
+    assert np.flatnonzero(columns["mode_1"]).tolist() == list(range(1440 + 1080, 1440 + 1110))
+
+
+def test_no_days_give_empty_columns(timeline):
+    columns = home_columns(timeline, CostsMatrix(CONFIG), MONDAY, MONDAY)
+
+    assert all(len(column) == 0 for column in columns.values())
+
+
+@pytest.mark.parametrize("format", ["npz", "parquet", "arrow"])
+def test_columns_are_read_as_written(timeline, tmp_path, format):
+    if format != "npz":
+        pytest.importorskip("pyarrow")
+    columns = home_columns(timeline, CostsMatrix(CONFIG), MONDAY, MONDAY + timedelta(days=2))
+
+    filepath = export_home(timeline, CostsMatrix(CONFIG), MONDAY, MONDAY + timedelta(days=2),
+                           str(tmp_path), "home", format)
+
+    assert filepath == str(tmp_path / "home" / f"2026-10-19_2026-10-21.{format}")
+    read = read_columns(filepath)
+    assert read.keys() == columns.keys()
+    for name, column in columns.items():
+        np.testing.assert_array_equal(read[name], column)
+
+
+def test_results_columns(tmp_path):
+    results = [{"scenario": "a", "savings": 0.5, "best_start": "10:00"},
+               {"scenario": 1, "savings": None, "best_start": None}]
+
+    columns = results_columns(results)
+
+    assert columns["scenario"].tolist() == ["a", "1"] and columns["best_start"].tolist() == ["10:00", ""]
+    np.testing.assert_array_equal(columns["savings"], [0.5, np.nan])
+    read = read_columns(write_columns(columns, str(tmp_path / "results.npz")))
+    assert read["scenario"].tolist() == ["a", "1"]
+
+
+def test_unknown_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_columns({"a": np.zeros(1)}, str(tmp_path / "columns.csv"))
@@ -0,0 +1,79 @@
+"""Tests of the live consumption updates."""
+
+import asyncio
+import json
+
+import pytest
+
+from dt.api import live
+from dt.api.live import ConsumptionBroadcaster
+from dt.config import HomeConfig
+from dt.data import JSONRepository
+from dt.timeline import Timeline
+
+__APPLIANCES = [
+    {"id": 0, "device": "heater", "manufacturer": "", "model": "", "location": "",
+     "modes": [{"id": 0, "name": "off", "power_consumption": 0}, {"id": 1, "name": "on", "power_consumption": 2000}]},
+]
+
+
+class FailingTimeline:
+    """A timeline that fails after a number of days have been queried."""
+
+    def __init__(self, timeline: Timeline, successes: int):
+        self.timeline = timeline
+        self.successes = successes
+
+    def matrix(self, day):
+        if self.successes == 0:
+            raise ValueError("The day can't be simulated")
+
+        self.successes -= 1
+        return self.timeline.matrix(day)
+
+
+@pytest.fixture
+def timeline(tmp_path) -> Timeline:
+    for name, entities in [("appliances", __APPLIANCES), ("routines", []), ("test_routines", [])]:
+        (tmp_path / name).mkdir()
+        for entity in entities:
+            (tmp_path / name / f"{entity['id']}.json").write_text(json.dumps(entity))
+
+    repository = JSONRepository(str(tmp_path / "appliances"), str(tmp_path / "routines"),
+                                str(tmp_path / "test_routines"))
+    return Timeline(repository.get_appliances(), repository.get_routines(), HomeConfig(3000, 1, [0.2]))
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(live.asyncio, "sleep", lambda delay: sleep(0))
+
+
+async def receive_all(broadcaster: ConsumptionBroadcaster) -> list[dict]:
+    return [json.loads(message) async for message in broadcaster.subscribe()]
+
+
+def test_failed_first_update_stops_the_subscriber(timeline):
+    broadcaster = ConsumptionBroadcaster(FailingTimeline(timeline, 0))
+
+    messages = asyncio.run(asyncio.wait_for(receive_all(broadcaster), 1))
+
+    assert messages == [{"error": {"message": "The day can't be simulated", "context": {}}}]
+
+
+def test_failed_update_stops_the_subscribers_and_the_task(timeline, no_wait):
+    broadcaster = ConsumptionBroadcaster(FailingTimeline(timeline, 1))
+
+    async def run():
+        messages = await asyncio.gather(receive_all(broadcaster), receive_all(broadcaster))
+        # The failed task is not left behind, so the next subscriber starts over
+        broadcaster.timeline.successes = 1
+        return messages, await receive_all(broadcaster)
+
+    (first, second), third = asyncio.run(asyncio.wait_for(run(), 1))
+
+    assert first == second
+    assert first[0]["total"] == 0.0
+    assert first[-1] == {"error": {"message": "The day can't be simulated", "context": {}}}
+    assert third[-1] == first[-1]
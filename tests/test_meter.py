@@ -0,0 +1,94 @@
+"""Tests of the meter readings and of their comparison with the twin."""
+
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from dt.meter import MeterHistory, ingest_meter_csv, read_meter_csv
+
+START = date(2026, 10, 19)
+
+
+def at(day: int, minute: int) -> datetime:
+    return datetime.combine(START, datetime.min.time()) + timedelta(days=day, minutes=minute)
+
+
+@pytest.fixture
+def history(tmp_path) -> MeterHistory:
+    return MeterHistory.create(str(tmp_path / "meter.bin"), START)
+
+
+def test_readings_are_stored_by_minute(history):
+    readings = [(at(0, 10), 100.0), (at(0, 10) + timedelta(seconds=30), 300.0), (at(1, 5), 50.0)]
+
+    assert history.ingest(readings, chunk_size=2) == 3
+
+    assert history.days == 2
+    assert history.day(START)[10] == 200.0
+    assert history.day(START + timedelta(days=1))[5] == 50.0
+    assert np.isnan(history.day(START)[11]) and np.isnan(history.day(START + timedelta(days=2))).all()
+
+
+def test_readings_replace_the_ones_stored_before(history):
+    history.ingest([(at(0, 10), 100.0), (at(0, 11), 100.0)])
+    history.ingest([(at(0, 10), 400.0)])
+
+    assert list(history.day(START)[10:12]) == [400.0, 100.0]
+
+
+def test_history_is_persisted(history):
+    history.ingest([(at(2, 0), 1000.0)])
+
+    reopened = MeterHistory(history.filepath)
+
+    assert (reopened.start, reopened.days) == (START, 3)
+    assert reopened.day(START + timedelta(days=2))[0] == 1000.0
+
+
+@pytest.mark.parametrize("when", [at(-1, 0), at(0, 0).replace(tzinfo=timezone.utc)])
+def test_invalid_readings_are_rejected(history, when):
+    with pytest.raises(ValueError):
+        history.ingest([(when, 100.0)])
+
+
+def test_csv_timestamps_are_read_in_local_time(tmp_path):
+    csv_file = tmp_path / "meter.csv"
+    csv_file.write_text("timestamp,power\n2026-10-19T10:00:00+02:00,100\n2026-10-19T10:01:00,200\n")
+
+    assert list(read_meter_csv(str(csv_file))) == [(datetime(2026, 10, 19, 10), 100.0),
+                                                   (datetime(2026, 10, 19, 10, 1), 200.0)]
+
+    history = ingest_meter_csv(str(csv_file), str(tmp_path / "meter.bin"))
+    assert history.start == START
+    assert list(history.day(START)[600:602]) == [100.0, 200.0]
+
+
+def test_comparison_with_the_twin(history):
+    # Two days at 100 W, except for 10 minutes at 1 kW around midnight
+    history.ingest([(at(0, minute), 100.0) for minute in range(2 * 1440)])
+    history.ingest([(at(0, minute), 1000.0) for minute in range(1435, 1445)])
+    simulated = np.full(1440, 100.0)
+
+    # The interval across midnight is joined across chunks of a single day
+    comparison = history.compare(simulated, threshold=500, min_duration=5, chunk_days=1)
+
+    assert comparison.minutes == 2 * 1440
+    assert comparison.mean_absolute_error == pytest.approx(10 * 900 / (2 * 1440))
+    assert comparison.bias == pytest.approx(-10 * 900 / (2 * 1440))
+    assert comparison.energy_error == pytest.approx(-10 * 900 / 60)
+    assert comparison.divergent_intervals == [(at(0, 1435), at(0, 1445))]
+    np.testing.assert_allclose(comparison.daily_errors, [5 * 900 / 1440] * 2)
+
+
+def test_comparison_of_a_range_of_days(history):
+    history.ingest([(at(0, minute), 100.0) for minute in range(3 * 1440)])
+    simulated = {START + timedelta(days=day): np.full(1440, 100.0 * (day + 1)) for day in range(3)}
+
+    comparison = history.compare(lambda day: simulated[day], start=START + timedelta(days=1),
+                                 end=START + timedelta(days=10))
+
+    assert comparison.minutes == 2 * 1440
+    np.testing.assert_allclose(comparison.daily_errors, [100.0, 200.0])
+    assert comparison.divergent_intervals == []
+    assert history.compare(np.zeros(1440), start=START + timedelta(days=5)).minutes == 0
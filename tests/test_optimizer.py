@@ -0,0 +1,77 @@
+"""Tests of the start times found by the routine optimizer."""
+
+from datetime import date
+
+import pytest
+
+from dt.config import HomeConfig
+from dt.data import JSONRepository
+from dt.data.data_repository import parse_routine
+from dt.energy import CostsMatrix, RoutineOptimizer, StateMatrix
+from conftest import routine
+
+# A monday, on which the first rate applies from 8:00 to 19:00
+DAY = date(2026, 10, 19)
+
+
+@pytest.fixture
+def repository(create_home) -> JSONRepository:
+    # The heater runs from 10:00 to 11:00
+    return create_home([routine(0, "10:00", [(0, 1, 60)])])
+
+
+@pytest.fixture
+def optimizer(repository) -> RoutineOptimizer:
+    config = HomeConfig(5000, 2, [0.0003, 0.0001])
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), config)
+    return RoutineOptimizer(matrix, CostsMatrix(config), DAY)
+
+
+def simulated_savings(optimizer: RoutineOptimizer, candidate, when) -> tuple[float, float]:
+    # The savings and the peak load of moving the routine, from the state matrix with it
+    costs, matrix = optimizer.costs_matrix, optimizer.state_matrix
+    current = matrix.add_routine(candidate)
+    moved = matrix.add_routine(candidate.at(when))
+    return (costs.grid_cost(current.net_power, DAY) - costs.grid_cost(moved.net_power, DAY),
+            float((moved.power - moved.dispatch.generation).max()))
+
+
+@pytest.mark.parametrize("duration", [30, None])
+def test_pareto_start_times_match_the_simulation(repository, optimizer, duration):
+    # Actions without a duration run until the end of the day
+    candidate = parse_routine(routine(1, "12:00", [(1, 1, duration)]), repository.get_registry())
+
+    front = optimizer.find_pareto_start_times(candidate)
+
+    assert front
+    for option in front:
+        savings, peak_power = simulated_savings(optimizer, candidate, option.when)
+        assert option.savings == pytest.approx(savings)
+        assert option.peak_power == pytest.approx(peak_power)
+
+
+def test_cheapest_start_time_matches_the_simulation(repository, optimizer):
+    candidate = parse_routine(routine(1, "12:00", [(1, 1, 30)]), repository.get_registry())
+
+    when, savings = optimizer.find_best_start_time(candidate)
+
+    # Half an hour of the oven at the second rate instead of the first one
+    assert savings == pytest.approx(1000 * (0.0003 - 0.0001))
+    assert simulated_savings(optimizer, candidate, when)[0] == pytest.approx(savings)
+
+
+def test_approximate_start_time_is_optimal_without_a_budget(repository, optimizer):
+    candidate = parse_routine(routine(1, "12:00", [(1, 1, 30)]), repository.get_registry())
+
+    when, savings, bound = optimizer.find_approximate_start_time(candidate, resolution=15)
+
+    assert bound == 0
+    assert savings == pytest.approx(optimizer.find_best_start_time(candidate)[1])
+    assert simulated_savings(optimizer, candidate, when)[0] == pytest.approx(savings)
+
+
+def test_no_start_time_is_found_when_the_routine_is_already_the_cheapest(repository, optimizer):
+    candidate = parse_routine(routine(1, "20:00", [(1, 1, 30)]), repository.get_registry())
+
+    assert optimizer.find_best_start_time(candidate) is None
+    assert optimizer.find_approximate_start_time(candidate) is None
@@ -0,0 +1,57 @@
+"""Tests of the resolutions of the exceeding of the maximum power."""
+
+from datetime import date
+
+import pytest
+
+from dt.config import HomeConfig
+from dt.data.data_repository import parse_routine
+from dt.energy import CostsMatrix, StateMatrix
+from dt.recommendations import ConflictResolver
+from conftest import routine
+
+DAY = date(2026, 10, 19)
+CONFIG = HomeConfig(3000, 1, [0.0002])
+
+ROUTINES = [routine(0, "10:00", [(0, 1, 60)]), routine(1, "18:00", [(1, 1, 60)])]
+
+
+@pytest.fixture
+def repository(create_home):
+    return create_home(ROUTINES)
+
+
+@pytest.fixture
+def resolver(repository) -> ConflictResolver:
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), CONFIG)
+    return ConflictResolver(matrix, CostsMatrix(CONFIG), DAY)
+
+
+def test_resolutions_keep_the_house_under_its_maximum_power(repository, resolver):
+    # The oven runs with the heater from 10:30 to 11:00
+    new_routine = parse_routine(routine(2, "10:30", [(1, 1, 30)]), repository.get_registry())
+
+    resolutions = resolver.resolve(new_routine)
+
+    assert resolutions
+    assert [(r.comfort_loss, r.cost_delta) for r in resolutions] == \
+        sorted((r.comfort_loss, r.cost_delta) for r in resolutions)
+    for resolution in resolutions:
+        routines = [r for r in repository.get_routines() + [new_routine]
+                    if r not in resolution.disabled and r is not resolution.shifted]
+        if resolution.shifted is not None:
+            routines.append(resolution.shifted.at(resolution.when))
+
+        # The routines of the resolution are simulated without exceeding the maximum power
+        StateMatrix(repository.get_appliances(), routines, CONFIG)
+
+    # Disabling the heater is the only minimal set, which loses its hour
+    disabling = [r for r in resolutions if r.disabled]
+    assert [([r.id for r in d.disabled], d.comfort_loss) for d in disabling] == [([0], 60)]
+    assert disabling[0].cost_delta == pytest.approx(-2000 * 0.0002)
+
+
+def test_no_resolution_is_needed_under_the_maximum_power(repository, resolver):
+    new_routine = parse_routine(routine(2, "12:00", [(1, 1, 30)]), repository.get_registry())
+
+    assert resolver.resolve(new_routine) == []
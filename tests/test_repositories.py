@@ -0,0 +1,252 @@
+"""Tests of the repositories, which must all return the same data as the JSON files."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pickle
+import sqlite3
+
+import numpy as np
+import pytest
+
+from dt.config import BatteryConfig, HomeConfig
+from dt.data import JSONLinesRepository, JSONRepository
+from dt.data.data_repository import DataRepository, convert_json_to_jsonl, serialize_recurrence
+from dt.data.snapshot import SnapshotRepository, read_snapshot, write_snapshot
+from dt.data.sqlite_repository import SQLiteRepository, import_to_sqlite
+from dt.energy import StateMatrix
+from conftest import APPLIANCES, routine
+
+# A washing machine whose mode draws more power while heating, and which can be delayed
+WASHER = {"id": 2, "device": "washing machine", "manufacturer": "", "model": "", "location": "", "priority": 2,
+          "interruptible": True,
+          "modes": [{"id": 0, "name": "off", "power_consumption": 0},
+                    {"id": 1, "name": "cotton", "power_consumption": 200, "default_duration": 5400,
+                     "power_profile": [{"duration": 600, "power_consumption": 2000}]}]}
+
+ROUTINES = [
+    routine(0, "10:00", [(0, 1, 60)]),
+    routine(1, "18:30", [(1, 1, 45), (2, 1, 90)],
+            recurrence={"weekdays": ["saturday", "sunday"], "start_date": "2026-01-01"}),
+    # The heater stays on until the end of the day
+    routine(2, "21:00", [(0, 1, None)], enabled=False),
+]
+# The ID of the test routine is also the ID of a routine
+TEST_ROUTINES = [routine(0, "07:00", [(2, 1, 90)])]
+
+CONFIG = HomeConfig(5000, 1, [0.2])
+
+
+def routine_fields(routines) -> list[tuple]:
+    return [(r.id, r.name, r.when, r.enabled, serialize_recurrence(r.recurrence) if r.recurrence is not None else None,
+             [(a.id, a.appliance.id, a.mode.id, a.duration) for a in r.actions]) for r in routines]
+
+
+def assert_same_data(repository: DataRepository, expected: DataRepository):
+    assert sorted(repository.get_appliances(), key=lambda a: a.id) == sorted(
+        expected.get_appliances(), key=lambda a: a.id)
+    assert sorted(routine_fields(repository.get_routines())) == sorted(
+        routine_fields(expected.get_routines()))
+    assert sorted(routine_fields(repository.get_test_routines())) == sorted(
+        routine_fields(expected.get_test_routines()))
+
+
+@pytest.fixture
+def repository(create_home) -> JSONRepository:
+    return create_home(ROUTINES, TEST_ROUTINES, APPLIANCES + [WASHER])
+
+
+def test_json_models(repository):
+    washer = repository.get_appliance(2)
+
+    assert (washer.priority, washer.interruptible) == (2, True)
+    assert washer.modes[1].default_duration == 90
+    assert [washer.modes[1].power_at(minute) for minute in (0, 9, 10)] == [2000, 2000, 200]
+    assert repository.get_routine(1).recurrence.weekdays == frozenset({5, 6})
+    assert repository.get_routine(2).actions[0].duration is None
+    assert [r.id for r in repository.get_routines_with_appliance(2)] == [1]
+
+
+def test_equal_modes_are_shared(repository):
+    heater, oven = repository.get_appliance(0), repository.get_appliance(1)
+
+    assert heater.modes[1] is oven.modes[1]
+    # Unpickled modes are interned as well
+    assert pickle.loads(pickle.dumps(heater)).modes[1] is oven.modes[1]
+
+
+def test_registry_lookups(repository):
+    registry = repository.get_registry()
+
+    assert [a.id for a in registry.appliances] == [0, 1, 2]
+    assert registry.get(2) is repository.get_appliance(2)
+    assert registry.get(3) is None
+    assert registry.get_mode(2, 1).name == "cotton"
+    assert registry.get_mode(2, 5) is None
+    assert registry.column(2) == 2
+    assert registry.mode_index(2, 1) == 1
+    with pytest.raises(KeyError):
+        registry.column(3)
+
+
+def test_json_files_are_read_again_when_they_change(repository, tmp_path):
+    registry = repository.get_registry()
+    assert repository.get_registry() is registry
+
+    (tmp_path / "routines" / "0.json").unlink()
+    # The modification time may not change within the resolution of the filesystem, but the size does
+    (tmp_path / "appliances" / "1.json").write_text(
+        (tmp_path / "appliances" / "1.json").read_text().replace("oven", "big oven"))
+
+    assert sorted(r.id for r in repository.get_routines()) == [1, 2]
+    assert repository.get_appliance(1).device == "big oven"
+    assert repository.get_registry() is not registry
+
+
+def test_bundle_has_the_same_data(repository, tmp_path):
+    bundle_file = str(tmp_path / "home.jsonl")
+    convert_json_to_jsonl(repository.appliances_dir, repository.routines_dir,
+                          repository.test_routines_dir, bundle_file)
+
+    assert_same_data(JSONLinesRepository(bundle_file), repository)
+
+
+def test_sqlite_has_the_same_data(repository, tmp_path):
+    sqlite_file = str(tmp_path / "homes.db")
+    import_to_sqlite(repository, sqlite_file, "home")
+    # Another home in the same database is kept apart
+    (tmp_path / "empty").mkdir()
+    import_to_sqlite(JSONRepository(str(tmp_path / "appliances"), str(tmp_path / "routines"),
+                                    str(tmp_path / "empty")), sqlite_file, "other")
+
+    sqlite_repository = SQLiteRepository(sqlite_file, "home")
+
+    assert_same_data(sqlite_repository, repository)
+    assert sqlite_repository.get_appliance(2) == repository.get_appliance(2)
+    assert sqlite_repository.get_appliance(3) is None
+    assert routine_fields([sqlite_repository.get_routine(1)]) == routine_fields([repository.get_routine(1)])
+    assert [r.id for r in sqlite_repository.get_routines_with_appliance(2)] == [1]
+    assert SQLiteRepository(sqlite_file, "other").get_test_routines() == []
+
+
+def test_sqlite_reads_a_database_imported_again(repository, tmp_path):
+    sqlite_file = str(tmp_path / "homes.db")
+    import_to_sqlite(repository, sqlite_file, "home")
+    sqlite_repository = SQLiteRepository(sqlite_file, "home")
+    registry = sqlite_repository.get_registry()
+    assert sqlite_repository.get_registry() is registry
+
+    (tmp_path / "appliances" / "2.json").unlink()
+    for name in os.listdir(tmp_path / "routines"):
+        (tmp_path / "routines" / name).unlink()
+    (tmp_path / "test_routines" / "0.json").unlink()
+    import_to_sqlite(repository, sqlite_file, "home")
+
+    assert [a.id for a in sqlite_repository.get_registry().appliances] == [0, 1]
+    assert sqlite_repository.get_routines() == []
+
+
+def test_sqlite_pool_serves_concurrent_readers(repository, tmp_path):
+    sqlite_file = str(tmp_path / "homes.db")
+    import_to_sqlite(repository, sqlite_file, "home")
+    sqlite_repository = SQLiteRepository(sqlite_file, "home", pool_size=2)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: routine_fields(sqlite_repository.get_routines()), range(32)))
+
+    assert all(result == results[0] for result in results)
+
+
+def test_sqlite_migrates_databases_of_older_versions(repository, tmp_path):
+    sqlite_file = str(tmp_path / "homes.db")
+
+    # The first version of the schema, without the power profiles, the recurrences and the priorities
+    connection = sqlite3.connect(sqlite_file)
+    connection.executescript("""
+        CREATE TABLE appliances (home_id TEXT NOT NULL, id INTEGER NOT NULL, device TEXT NOT NULL,
+            manufacturer TEXT NOT NULL, model TEXT NOT NULL, location TEXT NOT NULL, PRIMARY KEY (home_id, id)) WITHOUT ROWID;
+        CREATE TABLE modes (home_id TEXT NOT NULL, appliance_id INTEGER NOT NULL, id INTEGER NOT NULL, name TEXT NOT NULL,
+            power_consumption REAL NOT NULL, default_duration INTEGER, PRIMARY KEY (home_id, appliance_id, id),
+            FOREIGN KEY (home_id, appliance_id) REFERENCES appliances (home_id, id) ON DELETE CASCADE) WITHOUT ROWID;
+        CREATE TABLE routines (home_id TEXT NOT NULL, kind TEXT NOT NULL, id INTEGER NOT NULL, name TEXT NOT NULL,
+            "when" TEXT NOT NULL, enabled INTEGER NOT NULL, PRIMARY KEY (home_id, kind, id)) WITHOUT ROWID;
+        CREATE TABLE actions (home_id TEXT NOT NULL, kind TEXT NOT NULL, routine_id INTEGER NOT NULL, id INTEGER NOT NULL,
+            appliance_id INTEGER NOT NULL, mode_id INTEGER NOT NULL, duration INTEGER,
+            PRIMARY KEY (home_id, kind, routine_id, id),
+            FOREIGN KEY (home_id, kind, routine_id) REFERENCES routines (home_id, kind, id) ON DELETE CASCADE) WITHOUT ROWID;
+        INSERT INTO appliances VALUES ('old', 0, 'lamp', '', '', '');
+        INSERT INTO modes VALUES ('old', 0, 0, 'off', 0, NULL), ('old', 0, 1, 'on', 60, NULL);
+        INSERT INTO routines VALUES ('old', 'routine', 0, 'Evening', '19:00', 1);
+        INSERT INTO actions VALUES ('old', 'routine', 0, 0, 0, 1, 120);
+    """)
+    connection.close()
+
+    import_to_sqlite(repository, sqlite_file, "home")
+
+    assert_same_data(SQLiteRepository(sqlite_file, "home"), repository)
+    old = SQLiteRepository(sqlite_file, "old")
+    lamp = old.get_appliance(0)
+    assert (lamp.priority, lamp.interruptible, lamp.modes[1].power_profile) == (0, False, None)
+    assert routine_fields(old.get_routines())[0][4:] == (None, [(0, 0, 1, 120)])
+
+    connection = sqlite3.connect(sqlite_file)
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    connection.close()
+    assert version == 4
+
+    # Importing again into a migrated database does not migrate it twice
+    import_to_sqlite(repository, sqlite_file, "home")
+    assert_same_data(SQLiteRepository(sqlite_file, "home"), repository)
+
+
+@pytest.fixture
+def snapshot_file(repository, tmp_path) -> str:
+    filepath = str(tmp_path / "home.snapshot")
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), CONFIG)
+    write_snapshot(filepath, repository, [a.id for a in matrix.registry.appliances],
+                   [r.id for r in matrix.routines if r.enabled], matrix.requested_matrix, CONFIG)
+    return filepath
+
+
+def test_snapshot_has_the_same_data(repository, snapshot_file):
+    snapshot_repository = SnapshotRepository(snapshot_file)
+
+    assert_same_data(snapshot_repository, repository)
+    base_matrix = snapshot_repository.get_base_matrix(CONFIG)
+    np.testing.assert_array_equal(base_matrix, StateMatrix(
+        repository.get_appliances(), repository.get_routines(), CONFIG).requested_matrix)
+    assert not base_matrix.flags.writeable
+
+
+def test_snapshot_matrix_is_simulated_again_with_the_same_result(repository, snapshot_file):
+    snapshot_repository = SnapshotRepository(snapshot_file)
+    compiled = StateMatrix(snapshot_repository.get_appliances(), snapshot_repository.get_routines(), CONFIG,
+                           snapshot_repository.get_base_matrix(CONFIG))
+    simulated = StateMatrix(repository.get_appliances(), repository.get_routines(), CONFIG)
+
+    np.testing.assert_array_equal(compiled.power, simulated.power)
+
+
+@pytest.mark.parametrize("config", [
+    HomeConfig(3000, 1, [0.2]),
+    HomeConfig(5000, 1, [0.2], battery=BatteryConfig(5000, 2000, 2000)),
+    HomeConfig(5000, 1, [0.2], demand_response=True),
+])
+def test_snapshot_matrix_is_not_used_with_another_configuration(snapshot_file, config):
+    assert SnapshotRepository(snapshot_file).get_base_matrix(config) is None
+
+
+def test_snapshot_matrix_is_only_used_for_the_routines_it_was_compiled_with(repository, tmp_path):
+    filepath = str(tmp_path / "idle.snapshot")
+    matrix = StateMatrix(repository.get_appliances(), [], CONFIG)
+    write_snapshot(filepath, repository, [a.id for a in matrix.registry.appliances], [],
+                   matrix.requested_matrix, CONFIG)
+
+    assert SnapshotRepository(filepath).get_base_matrix(CONFIG) is None
+
+
+def test_snapshot_of_another_format_is_rejected(tmp_path):
+    filepath = tmp_path / "home.snapshot"
+    filepath.write_bytes(b"DTSNAP01" + bytes(64))
+
+    with pytest.raises(ValueError):
+        read_snapshot(str(filepath))
@@ -0,0 +1,75 @@
+"""Tests of the routines: their conflicts and the days they run on."""
+
+from datetime import date
+
+import pytest
+
+from dt.data.data_repository import parse_recurrence, parse_routine
+from dt.data.models import Recurrence
+from conftest import routine
+
+# A monday
+MONDAY = date(2026, 10, 19)
+
+
+@pytest.fixture
+def parse(create_home):
+    registry = create_home([]).get_registry()
+    return lambda data: parse_routine(data, registry)
+
+
+@pytest.mark.parametrize("first, second, conflicting", [
+    # The heater is turned off while it is on
+    (routine(0, "10:00", [(0, 1, 60)]), routine(1, "10:30", [(0, 0, 10)]), True),
+    (routine(0, "10:00", [(0, 1, 60)]), routine(1, "11:00", [(0, 0, 10)]), False),
+    # The same mode, or another appliance, are not a conflict
+    (routine(0, "10:00", [(0, 1, 60)]), routine(1, "10:30", [(0, 1, 60)]), False),
+    (routine(0, "10:00", [(0, 1, 60)]), routine(1, "10:30", [(1, 0, 60)]), False),
+    # Actions without a duration run until the end of the day
+    (routine(0, "22:00", [(0, 1, None)]), routine(1, "10:30", [(0, 0, 10)]), False),
+    (routine(0, "22:00", [(0, 1, None)]), routine(1, "21:55", [(0, 0, 10)]), True),
+    (routine(0, "22:00", [(0, 1, None)]), routine(1, "23:00", [(0, 0, 10)]), True),
+    (routine(0, "22:00", [(0, 1, None)]), routine(1, "06:00", [(0, 0, None)]), True),
+    (routine(0, "22:00", [(0, 1, None)]), routine(1, "06:00", [(0, 0, 10)], enabled=False), False),
+])
+def test_conflicting_actions(parse, first, second, conflicting):
+    first, second = parse(first), parse(second)
+
+    assert (first.conflicting_actions(second) is not None) == conflicting
+    assert (second.conflicting_actions(first) is not None) == conflicting
+
+
+@pytest.mark.parametrize("data, days", [
+    ({}, [True] * 14),
+    ({"weekdays": ["saturday", "sunday"]}, [False] * 5 + [True] * 2 + [False] * 5 + [True] * 2),
+    ({"every_n_days": 3, "start_date": "2026-10-20"}, [False, True, False, False, True, False, False,
+                                                       True, False, False, True, False, False, True]),
+    ({"weekdays": ["monday"], "every_n_days": 2, "start_date": "2026-10-19"}, [True] + [False] * 13),
+    ({"start_date": "2026-10-21", "end_date": "2026-10-22"}, [False, False, True, True] + [False] * 10),
+])
+def test_recurrence_days(data, days):
+    recurrence = parse_recurrence(data)
+
+    assert [recurrence.occurs_on(date.fromordinal(MONDAY.toordinal() + offset)) for offset in range(14)] == days
+
+
+def test_next_occurrence():
+    weekends = Recurrence(frozenset({5, 6}))
+
+    assert weekends.next_occurrence(MONDAY) == date(2026, 10, 24)
+    assert weekends.next_occurrence(date(2026, 10, 25)) == date(2026, 10, 25)
+    assert Recurrence(frozenset({0}), end_date=date(2026, 10, 25)).next_occurrence(date(2026, 10, 20)) is None
+    assert Recurrence(every_n_days=10, start_date=date(2026, 11, 1)).next_occurrence(MONDAY) == date(2026, 11, 1)
+
+
+def test_disabled_routines_never_run(parse):
+    disabled = parse(routine(0, "10:00", [(0, 1, 60)], enabled=False))
+
+    assert not disabled.occurs_on(MONDAY)
+    assert disabled.next_occurrence(MONDAY) is None
+
+
+@pytest.mark.parametrize("data", [{"weekdays": ["someday"]}, {"every_n_days": 0}])
+def test_invalid_recurrences_are_rejected(data):
+    with pytest.raises(ValueError):
+        parse_recurrence(data)
@@ -0,0 +1,75 @@
+"""Tests of the Monte Carlo scenario engine."""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from dt.config import HomeConfig
+from dt.energy import StateMatrix
+from dt.scenarios import RoutineUncertainty, ScenarioEngine
+from conftest import routine
+
+# A monday and a saturday
+MONDAY, SATURDAY = date(2026, 10, 19), date(2026, 10, 24)
+CONFIG = HomeConfig(3000, 1, [0.0002])
+
+ROUTINES = [
+    routine(0, "10:00", [(0, 1, 60)]),
+    # The oven overlaps with the heater on saturdays
+    routine(1, "10:30", [(1, 1, 45)], recurrence={"weekdays": ["saturday"]}),
+]
+
+
+@pytest.fixture
+def repository(create_home):
+    return create_home(ROUTINES)
+
+
+def test_scenarios_without_uncertainty_are_the_twin(repository):
+    engine = ScenarioEngine(repository.get_appliances(), repository.get_routines(), CONFIG, days=[SATURDAY])
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), CONFIG, check_max_power=False)
+
+    curves = engine.load_curves(3, seed=0)
+
+    np.testing.assert_allclose(curves, np.broadcast_to(matrix.net_power, curves.shape))
+    report = engine.run(3, seed=0)
+    assert report.exceedance_probability == 1.0
+    assert (report.minute_exceedance[630:660] == 1).all() and report.minute_exceedance.sum() == 30
+
+
+def test_routines_only_run_on_the_days_of_their_recurrence(repository):
+    engine = ScenarioEngine(repository.get_appliances(), repository.get_routines(), CONFIG, days=[MONDAY, SATURDAY])
+
+    report = engine.run(2000, seed=1)
+
+    # Half of the scenarios are drawn on saturday
+    assert report.exceedance_probability == pytest.approx(0.5, abs=0.05)
+    assert ScenarioEngine(repository.get_appliances(), repository.get_routines(), CONFIG,
+                          days=[MONDAY]).run(100, seed=1).exceedance_probability == 0.0
+
+
+def test_start_jitter_spreads_the_load(repository):
+    uncertainty = RoutineUncertainty(start_jitter=20, duration_spread=0.2)
+    engine = ScenarioEngine(repository.get_appliances(), repository.get_routines(), CONFIG, uncertainty, days=[MONDAY])
+
+    curves = engine.load_curves(500, seed=2)
+
+    # The heater is still on in every scenario, for about an hour
+    assert np.allclose(np.sort(np.unique(curves)), [0, 2000])
+    assert (curves > 0).sum(axis=1).mean() == pytest.approx(60, abs=3)
+    assert 0 < (curves[:, 600] > 0).mean() < 1
+
+
+def test_seeded_runs_are_reproducible_across_workers(repository):
+    uncertainty = RoutineUncertainty(start_jitter=30, duration_spread=0.3)
+    engine = ScenarioEngine(repository.get_appliances(), repository.get_routines(), CONFIG, uncertainty,
+                            days=[MONDAY, SATURDAY])
+
+    serial = engine.run(300, seed=42, chunk_size=64)
+    parallel = engine.run(300, seed=42, chunk_size=64, workers=2)
+
+    assert serial.exceedance_probability == parallel.exceedance_probability
+    np.testing.assert_array_equal(serial.minute_exceedance, parallel.minute_exceedance)
+    np.testing.assert_array_equal(serial.load_curves, parallel.load_curves)
+    assert not np.array_equal(engine.run(300, seed=43, chunk_size=64).load_curves, serial.load_curves)
@@ -0,0 +1,134 @@
+"""Tests of the simulation of the modes and of the power of a day."""
+
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from dt.config import HomeConfig
+from dt.data.data_repository import parse_routine
+from dt.energy import (CostsMatrix, ConflictError, InconsistentRoutinesError, MaxPowerExceededError, StateMatrix,
+                       find_runs)
+from conftest import APPLIANCES, routine
+
+WASHER = {"id": 2, "device": "washing machine", "manufacturer": "", "model": "", "location": "",
+          "modes": [{"id": 0, "name": "off", "power_consumption": 0},
+                    {"id": 1, "name": "cotton", "power_consumption": 200,
+                     "power_profile": [{"duration": 600, "power_consumption": 2000}]}]}
+
+ROUTINES = [
+    routine(0, "10:00", [(0, 1, 60)]),
+    routine(1, "18:30", [(1, 1, 45), (2, 1, 90)]),
+    # The heater stays on until the end of the day
+    routine(2, "22:00", [(0, 1, None)]),
+]
+CONFIG = HomeConfig(5000, 1, [0.0002])
+
+
+@pytest.fixture
+def repository(create_home):
+    return create_home(ROUTINES, appliances=APPLIANCES + [WASHER])
+
+
+@pytest.fixture
+def matrix(repository) -> StateMatrix:
+    return StateMatrix(repository.get_appliances(), repository.get_routines(), CONFIG)
+
+
+def parse(repository, data: dict):
+    return parse_routine(data, repository.get_registry())
+
+
+def test_modes_and_power_of_the_routines(matrix):
+    heater, oven, washer = matrix.power_matrix.T
+
+    assert (heater[600:660] == 2000).all() and (heater[1320:] == 2000).all()
+    assert heater.sum() == 2000 * (60 + 120)
+    assert (oven[1110:1155] == 2000).all() and oven.sum() == 2000 * 45
+    # The power profile of the washer starts when its mode is set
+    assert (washer[1110:1120] == 2000).all() and (washer[1120:1200] == 200).all() and washer.sum() == 2000 * 10 + 200 * 80
+    np.testing.assert_array_equal(matrix.power, matrix.power_matrix.sum(axis=1))
+    assert matrix.total_consumption(datetime(2026, 10, 19, 18, 35)) == 4000
+    assert matrix.appliance_consumption(matrix.registry.get(2), datetime(2026, 10, 19, 18, 45)) == 200
+
+
+def test_arrays_are_read_only(matrix):
+    for array in [matrix.matrix, matrix.power_matrix, matrix.power, matrix.net_power]:
+        with pytest.raises(ValueError):
+            array[0] = 1
+
+
+def test_inconsistent_routines_are_rejected(repository):
+    # The heater is set to off while the first routine sets it to on
+    routines = repository.get_routines() + [parse(repository, routine(3, "10:30", [(0, 0, 10)]))]
+
+    with pytest.raises(InconsistentRoutinesError):
+        StateMatrix(repository.get_appliances(), routines, CONFIG)
+
+
+def test_max_power_is_checked_unless_disabled(repository):
+    routines = repository.get_routines() + [parse(repository, routine(3, "10:30", [(1, 1, 10), (2, 1, 10)]))]
+    config = HomeConfig(4000, 1, [0.0002])
+
+    with pytest.raises(MaxPowerExceededError) as error:
+        StateMatrix(repository.get_appliances(), routines, config)
+    assert (error.value.when.hour, error.value.when.minute) == (10, 30)
+
+    matrix = StateMatrix(repository.get_appliances(), routines, config, check_max_power=False)
+    assert matrix.power.max() == 6000
+
+
+def test_added_routines_are_simulated_as_a_new_matrix(repository, matrix):
+    new_routine = parse(repository, routine(3, "07:00", [(1, 1, 30), (2, 1, 20)]))
+    power = matrix.power.copy()
+
+    added = matrix.add_routine(new_routine)
+
+    # The matrix is not modified, and the new one is the same as one simulated from scratch
+    np.testing.assert_array_equal(matrix.power, power)
+    assert len(matrix.routines) == 3 and len(added.routines) == 4
+    expected = StateMatrix(repository.get_appliances(), list(repository.get_routines()) + [new_routine], CONFIG)
+    np.testing.assert_array_equal(added.matrix, expected.matrix)
+    np.testing.assert_array_equal(added.power_matrix, expected.power_matrix)
+
+
+def test_mode_runs(matrix):
+    runs = matrix.mode_runs()
+
+    # The runs of the active modes, by column and then by start
+    assert list(zip(runs.columns, runs.starts, runs.ends, runs.modes)) == [
+        (0, 600, 660, 1), (0, 1320, 1440, 1), (1, 1110, 1155, 1), (2, 1110, 1200, 1)]
+    assert len(matrix.mode_runs(include_idle=True)) == len(runs) + 6
+
+
+def test_find_runs():
+    starts, ends = find_runs(np.array([True, True, False, True, False, False, True]))
+
+    assert starts.tolist() == [0, 3, 6] and ends.tolist() == [2, 4, 7]
+
+
+@pytest.mark.parametrize("actions", [[(1, 1, 45)], [(0, 0, 30)], [(2, 1, 20), (1, 1, 60)], [(1, 1, None)]])
+def test_feasible_starts_match_the_simulation(repository, actions):
+    matrix = StateMatrix(repository.get_appliances(), repository.get_routines(), HomeConfig(4100, 1, [0.0002]))
+    candidate = parse(repository, routine(3, "00:00", actions))
+
+    feasible = matrix.feasible_starts(candidate)
+
+    for minute in range(0, 1440, 7):
+        try:
+            matrix.add_routine(candidate.at(candidate.when.replace(hour=minute // 60, minute=minute % 60)))
+            assert feasible[minute], minute
+        except ConflictError:
+            assert not feasible[minute], minute
+
+
+def test_diff_of_an_added_routine(repository, matrix):
+    costs = CostsMatrix(CONFIG)
+    added = matrix.add_routine(parse(repository, routine(3, "07:00", [(1, 1, 30)])))
+
+    diff = matrix.diff(added, costs, date(2026, 10, 19))
+
+    assert list(zip(diff.columns, diff.starts, diff.ends, diff.modes_before, diff.modes_after)) == [(1, 420, 450, 0, 1)]
+    assert diff.delta_energy == pytest.approx(1000)
+    assert diff.delta_cost == pytest.approx(1000 * 0.0002)
+    assert len(matrix.diff(matrix, costs)) == 0
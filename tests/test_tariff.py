@@ -0,0 +1,82 @@
+"""Tests of the prices of electricity."""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from dt.config import HomeConfig
+from dt.energy import CostsMatrix
+from dt.tariff import TariffSeries
+
+# A monday, on which the first rate applies from 8:00 to 19:00
+DAY = date(2026, 10, 19)
+CONFIG = HomeConfig(3000, 2, [0.0003, 0.0001])
+
+
+@pytest.fixture
+def tariff_file(tmp_path) -> str:
+    # Prices every 15 minutes from 12:00 to 13:00 of the day, in €/kWh
+    filepath = tmp_path / "tariff.csv"
+    filepath.write_text("timestamp,price\n" + "".join(
+        f"2026-10-19T12:{minute:02d},{price}\n" for minute, price in [(0, 0.5), (15, -0.1), (30, 0.2), (45, 0.3)]))
+    return str(filepath)
+
+
+def test_tariff_is_read_from_csv(tariff_file):
+    tariff = TariffSeries.from_csv(tariff_file)
+
+    assert (tariff.start, tariff.step, tariff.end) == (
+        datetime(2026, 10, 19, 12), timedelta(minutes=15), datetime(2026, 10, 19, 13))
+
+    prices = tariff.day_prices(DAY)
+    assert np.isnan(prices[:720]).all() and np.isnan(prices[780:]).all()
+    np.testing.assert_allclose(prices[720:780], np.repeat([0.0005, -0.0001, 0.0002, 0.0003], 15))
+    assert np.isnan(tariff.day_prices(DAY + timedelta(days=1))).all()
+
+
+@pytest.mark.parametrize("content", ["timestamp,price\n",
+                                     "timestamp,price\n2026-10-19T12:00,0.5\n2026-10-19T12:15,0.5\n2026-10-19T13:00,0.5\n"])
+def test_invalid_tariff_files_are_rejected(tmp_path, content):
+    filepath = tmp_path / "tariff.csv"
+    filepath.write_text(content)
+
+    with pytest.raises(ValueError):
+        TariffSeries.from_csv(str(filepath))
+
+
+def test_tariff_replaces_the_energy_rates_where_it_has_prices(tariff_file):
+    costs = CostsMatrix(HomeConfig(3000, 2, [0.0003, 0.0001], tariff_file=tariff_file))
+
+    prices = costs.prices(DAY)
+
+    np.testing.assert_allclose(prices[:480], 0.0001)
+    np.testing.assert_allclose(prices[480:720], 0.0003)
+    np.testing.assert_allclose(prices[720:735], 0.0005)
+    np.testing.assert_allclose(prices[780:1140], 0.0003)
+    assert costs.get_cost(datetime(2026, 10, 19, 12, 20)) == pytest.approx(-0.0001)
+    # The prices of a day are computed once, and can't be changed by the callers
+    assert costs.prices(DAY) is prices and not prices.flags.writeable
+
+
+def test_energy_rates_by_weekday():
+    costs = CostsMatrix(CONFIG)
+
+    assert costs.get_cost(datetime(2026, 10, 19, 8)) == 0.0003
+    assert costs.get_cost(datetime(2026, 10, 19, 19)) == 0.0001
+    # The second rate applies all day in the weekend
+    assert costs.get_cost(datetime(2026, 10, 24, 12)) == 0.0001
+    assert costs.get_duration_cost(datetime(2026, 10, 19, 7, 30), timedelta(hours=1)) == pytest.approx(
+        (30 * 0.0001 + 30 * 0.0003) / 60)
+
+
+def test_power_fed_into_the_grid_is_not_credited():
+    costs = CostsMatrix(CONFIG)
+    net_power = np.full(1440, 1000.0)
+    net_power[600:660] = -2000
+
+    expected = (np.full(1440, 1000.0) * costs.prices(DAY)).sum() / 60 - 60 * 1000 * 0.0003 / 60
+
+    assert costs.grid_cost(net_power, DAY) == pytest.approx(expected)
+    assert (costs.grid_costs(net_power, DAY)[600:660] == 0).all()
+    assert costs.energy_cost(net_power, DAY) < costs.grid_cost(net_power, DAY)
@@ -0,0 +1,111 @@
+"""Tests of the state of a home day by day."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from dt.config import HomeConfig
+from dt.data.data_repository import parse_routine
+from dt.energy import CostsMatrix, MaxPowerExceededError, StateMatrix
+from dt.timeline import Timeline
+from conftest import routine
+
+# A monday
+MONDAY = date(2026, 10, 19)
+CONFIG = HomeConfig(3000, 1, [0.0002])
+
+ROUTINES = [
+    routine(0, "10:00", [(0, 1, 60)], recurrence={"weekdays": ["monday", "wednesday", "friday"]}),
+    # The oven would exceed the maximum power with the heater, but they never run on the same day
+    routine(1, "10:30", [(1, 1, 60)], recurrence={"weekdays": ["tuesday", "thursday"]}),
+    routine(2, "19:00", [(1, 1, 30)]),
+]
+
+
+@pytest.fixture
+def repository(create_home):
+    return create_home(ROUTINES)
+
+
+@pytest.fixture
+def timeline(repository) -> Timeline:
+    return Timeline(repository.get_appliances(), repository.get_routines(), CONFIG)
+
+
+def test_each_day_runs_its_routines(timeline):
+    assert [sorted(r.id for r in timeline.active_routines(MONDAY + timedelta(days=day))) for day in range(7)] == [
+        [0, 2], [1, 2], [0, 2], [1, 2], [0, 2], [2], [2]]
+
+    monday, tuesday = timeline.matrix(MONDAY), timeline.matrix(MONDAY + timedelta(days=1))
+    assert monday.power[600:660].tolist() == [2000] * 60 and monday.power[660:690].tolist() == [0] * 30
+    assert tuesday.power[600:630].tolist() == [0] * 30 and tuesday.power[630:690].tolist() == [2000] * 60
+
+
+def test_days_with_the_same_routines_share_their_matrix(timeline):
+    matrices = [matrix for _, matrix in timeline.days(MONDAY, MONDAY + timedelta(days=14))]
+
+    assert matrices[0] is matrices[2] is matrices[7]
+    assert matrices[5] is matrices[6] and matrices[0] is not matrices[1]
+    assert len({id(matrix) for matrix in matrices}) == 3
+
+
+def test_routines_that_exceed_the_maximum_power_together_fail_without_the_recurrences(repository):
+    # Without the recurrences the heater and the oven run together
+    with pytest.raises(MaxPowerExceededError):
+        StateMatrix(repository.get_appliances(), repository.get_routines(), HomeConfig(3000, 1, [0.0002]))
+
+
+def test_adding_a_routine_gives_a_new_version(repository, timeline):
+    weekend = parse_routine(routine(3, "12:00", [(0, 1, 30)], recurrence={"weekdays": ["saturday"]}),
+                            repository.get_registry())
+    monday = timeline.matrix(MONDAY)
+
+    added = timeline.with_routine(weekend)
+
+    assert (added.version, len(added.routines), len(timeline.routines)) == (1, 4, 3)
+    # Days without the new routine share the matrices of the previous version
+    assert added.matrix(MONDAY) is monday
+    assert added.matrix(MONDAY + timedelta(days=5)).power[720:750].tolist() == [2000] * 30
+    assert timeline.matrix(MONDAY + timedelta(days=5)).power[720:750].tolist() == [0] * 30
+
+
+def test_simulated_routines_only_run_on_their_days(repository, timeline):
+    weekend = parse_routine(routine(3, "12:00", [(0, 1, 30)], recurrence={"weekdays": ["saturday"]}),
+                            repository.get_registry())
+
+    assert timeline.simulate(weekend, MONDAY) is timeline.matrix(MONDAY)
+    assert timeline.simulate(weekend, MONDAY + timedelta(days=5)).power[720] == 2000
+
+
+def test_base_matrix_is_only_used_for_the_days_of_all_the_routines(repository):
+    routines = [r for r in repository.get_routines() if r.id != 1]
+    # A base matrix in which the heater is always on, to tell where it is used
+    base_matrix = np.ones((1440, 2), dtype=np.int16)
+    base_matrix[:, 1] = 0
+    timeline = Timeline(repository.get_appliances(), routines, HomeConfig(100000, 1, [0.0002]), base_matrix)
+
+    assert timeline.matrix(MONDAY).power.min() == 2000
+    assert timeline.matrix(MONDAY + timedelta(days=1)).power.min() == 0
+
+
+def test_costs_and_power_over_many_days(timeline):
+    costs = CostsMatrix(CONFIG)
+    end = MONDAY + timedelta(days=7)
+
+    net_power = timeline.net_power(MONDAY, end)
+
+    assert net_power.shape == (7, 1440)
+    # The heater runs for three hours, the oven for two hours and the evening routine for half an hour a day
+    assert net_power.sum() / 60 == pytest.approx(2000 * (3 + 2 + 3.5))
+    assert timeline.energy_cost(MONDAY, end, costs) == pytest.approx(2000 * (3 + 2 + 3.5) * 0.0002)
+
+
+def test_days_are_simulated_once_from_many_threads(timeline):
+    days = [MONDAY + timedelta(days=day % 7) for day in range(64)]
+
+    with ThreadPoolExecutor(8) as executor:
+        matrices = list(executor.map(timeline.matrix, days))
+
+    assert all(matrix is timeline.matrix(day) for day, matrix in zip(days, matrices))